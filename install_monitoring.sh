@@ -16,7 +16,7 @@ apt-get update -y
 
 # 2. Установка системных утилит и Python-пакетов через apt
 echo -e "\n${YELLOW}> Шаг 2: Установка всех необходимых пакетов через apt...${NC}"
-apt-get install -y python3 lm-sensors python3-rich python3-psutil python3-requests python3-psycopg2
+apt-get install -y python3 lm-sensors python3-rich python3-psutil python3-requests python3-psycopg2 python3-jeepney
 
 echo -e "\n${GREEN}=== Установка успешно завершена! ===${NC}"
 echo -e "Скрипт мониторинга готов к запуску."
@@ -3,7 +3,9 @@ import os
 import sys
 import psutil
 import requests
+from requests.adapters import HTTPAdapter
 from rich.console import Console, Group
+from rich.segment import Segment
 from rich.table import Table
 from rich.panel import Panel
 from rich.live import Live
@@ -22,82 +24,265 @@ import configparser
 from datetime import datetime
 import json
 import csv
+import argparse
+import threading
+import glob
+import itertools
+import functools
+import asyncio
+import signal
+import bisect
+import heapq
+import math
+import mmap
+import struct
+import gzip
+import queue
+import errno
+import shutil
+import select
+import gc
+import cProfile
+import tracemalloc
+import io
+import tempfile
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from array import array
+from collections import deque, namedtuple
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
 
 try:
     import psycopg2
 except ImportError:
     psycopg2 = None
 
+try:
+    from jeepney import DBusAddress, MatchRule, Properties, message_bus, new_method_call
+    from jeepney.io.blocking import open_dbus_connection
+    from jeepney.wrappers import unwrap_msg
+except ImportError:
+    open_dbus_connection = None
+
 install()
 
+# Неизменяемый снимок разобранной конфигурации; подменяется целиком при перезагрузке
+ConfigSnapshot = namedtuple('ConfigSnapshot', 'monitoring postgresql application alerts collectors daemon notifications fleet')
+
+def _freeze(values):
+    return MappingProxyType({k: _freeze(v) if isinstance(v, dict) else v for k, v in values.items()})
+
 class ConfigManager:
     DEFAULT_CONFIG = {
         'monitoring': {
             'update_interval': '2',
             'history_length': '60',
+            'minute_rollups': '1440',
+            'hour_rollups': '672',
+            'chart_window': '3600',
+            'top_processes': '10',
+            'mounts': '',
+            'show_health': 'false',
+            'profile_dir': '/tmp',
             'enable_notifications': 'true',
-            'log_to_csv': 'true'
+            'log_to_csv': 'true',
+            'log_file': 'monitoring_log.csv',
+            'log_format': 'csv',
+            'log_batch_size': '50',
+            'log_flush_interval': '5',
+            'log_fsync': 'batch',
+            'log_max_size_mb': '100',
+            'log_rotate_interval': '0',
+            'log_keep': '7'
         },
         'postgresql': {
             'host': 'localhost',
             'port': '5432',
             'database': 'postgres',
             'user': 'postgres',
-            'password': ''
+            'password': '',
+            'size_interval': '300',
+            'replication_interval': '30',
+            'statements_interval': '60',
+            'top_statements': '5'
         },
         'application': {
             'service_name': 'platform5.service',
-            'url': 'http://localhost:8081'
+            'services': '',
+            'url': 'http://localhost:8081',
+            'urls': ''
         },
         'alerts': {
             'cpu_threshold': '80',
             'memory_threshold': '80',
             'disk_threshold': '80',
             'temp_threshold': '75',
-            'cpu_sustained_load_time': '60'
+            'cpu_sustained_load_time': '60',
+            'disk_full_hours': '24',
+            'net_errors_threshold': '10',
+            'app_connections_threshold': '1000',
+            'pg_replication_lag': '60',
+            'pg_lock_waits': '10',
+            'service_pressure_threshold': '20',
+            'anomaly_threshold': '6',
+            'anomaly_window': '600',
+            'anomaly_warmup': '30',
+            'alert_for': '10',
+            'hysteresis': '5',
+            'notify_cooldown': '300'
+        },
+        'notifications': {
+            'webhook_url': '',
+            'syslog': 'false',
+            'exec_command': '',
+            'file': '',
+            'queue_size': '100',
+            'batch_size': '20',
+            'retries': '3',
+            'retry_backoff': '1'
+        },
+        'daemon': {
+            'listen_address': '127.0.0.1',
+            'listen_port': '9101',
+            'stream_interval': '1'
+        },
+        'fleet': {
+            'agents': '',
+            'sort': 'cpu'
+        },
+        'collectors': {
+            'system_interval': '2',
+            'system_timeout': '1',
+            'temp_interval': '5',
+            'temp_timeout': '2',
+            'postgresql_interval': '5',
+            'postgresql_timeout': '2',
+            'pg_workload_interval': '10',
+            'pg_workload_timeout': '5',
+            'service_interval': '5',
+            'service_timeout': '2',
+            'http_interval': '5',
+            'http_timeout': '2',
+            'process_interval': '5',
+            'process_timeout': '5',
+            'cgroup_interval': '5',
+            'cgroup_timeout': '2',
+            'disk_interval': '10',
+            'disk_timeout': '5',
+            'net_interval': '5',
+            'net_timeout': '3',
+            'monitor_interval': '5',
+            'monitor_timeout': '1'
         }
     }
 
     def __init__(self, config_file='monitoring.conf'):
         self.config_file = config_file
         self.config = configparser.ConfigParser()
+        self.snapshot = None
+        self.version = 0
+        self.last_error = None
+        self._file_stamp = None
         self.load()
 
     def load(self):
         try:
+            config = configparser.ConfigParser()
             if os.path.exists(self.config_file):
-                self.config.read(self.config_file, encoding='utf-8')
+                config.read(self.config_file, encoding='utf-8')
+            self.config = config
+            self._file_stamp = self.file_stamp()
             self._set_defaults()
         except Exception as e:
             console.print(f"[red]Ошибка при загрузке конфигурации: {str(e)}[/red]")
             self._set_defaults()
+        self._rebuild_snapshot()
+
+    def reload(self):
+        """Перечитывает файл и атомарно подменяет снимок. Возвращает True, если снимок обновлён."""
+        config = configparser.ConfigParser()
+        try:
+            if not config.read(self.config_file, encoding='utf-8'):
+                return False # Файл удалён или недоступен — остаёмся на текущем снимке
+        except Exception as e:
+            self.last_error = str(e)
+            return False
+        previous = self.config
+        self.config = config
+        self._set_defaults(save=False)
+        self._file_stamp = self.file_stamp()
+        if not self._rebuild_snapshot(report=False):
+            self.config = previous
+            return False
+        return True
+
+    def file_stamp(self):
+        try:
+            st = os.stat(self.config_file)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
 
-    def _set_defaults(self):
+    def changed_on_disk(self, stamp=None):
+        """Изменился ли файл после последней загрузки или сохранения (по mtime и размеру)."""
+        return (stamp or self.file_stamp()) != self._file_stamp
+
+    def _set_defaults(self, save=True):
         try:
+            added = False
             for section, values in self.DEFAULT_CONFIG.items():
                 if not self.config.has_section(section):
                     self.config.add_section(section)
                 for key, value in values.items():
                     if not self.config.has_option(section, key):
                         self.config.set(section, key, value)
-            self.save()
+                        added = True
+            if added and save:
+                self.save()
         except Exception as e:
             console.print(f"[red]Ошибка при установке значений по умолчанию: {str(e)}[/red]")
 
     def save(self):
+        """Атомарно записывает конфигурацию: во временный файл, затем os.replace."""
+        temp_file = f"{self.config_file}.tmp"
         try:
-            with open(self.config_file, 'w', encoding='utf-8') as f:
+            with open(temp_file, 'w', encoding='utf-8') as f:
                 self.config.write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.config_file)
+            self._file_stamp = self.file_stamp()
         except Exception as e:
             console.print(f"[red]Ошибка при сохранении конфигурации: {str(e)}[/red]")
-            # Попробуем сохранить во временный файл
-            temp_file = f"{self.config_file}.tmp"
-            try:
-                with open(temp_file, 'w', encoding='utf-8') as f:
-                    self.config.write(f)
-                os.replace(temp_file, self.config_file)
-            except Exception as e2:
-                console.print(f"[red]Не удалось сохранить даже во временный файл: {str(e2)}[/red]")
+
+    def _rebuild_snapshot(self, report=True):
+        """Разбирает значения один раз и публикует новый неизменяемый снимок."""
+        try:
+            snapshot = ConfigSnapshot(
+                monitoring=_freeze(self._read_monitoring_config()),
+                postgresql=_freeze(self._read_postgresql_config()),
+                application=_freeze(self._read_application_config()),
+                alerts=_freeze(self._read_alerts_config()),
+                collectors=_freeze(self._read_collectors_config()),
+                daemon=_freeze(self._read_daemon_config()),
+                notifications=_freeze(self._read_notifications_config()),
+                fleet=_freeze(self._read_fleet_config())
+            )
+        except Exception as e:
+            self.last_error = str(e)
+            if report:
+                console.print(f"[red]Ошибка в значениях конфигурации: {str(e)}[/red]")
+            if self.snapshot is None:
+                # Без корректного снимка работать нельзя — берём значения по умолчанию
+                self.config = configparser.ConfigParser()
+                self._set_defaults(save=False)
+                return self._rebuild_snapshot(report)
+            return False
+        self.last_error = None
+        self.snapshot = snapshot
+        self.version += 1
+        return True
 
     def get(self, section, key, fallback=None):
         try:
@@ -108,55 +293,152 @@ class ConfigManager:
             console.print(f"[red]Ошибка при получении значения {section}.{key}: {str(e)}[/red]")
             return fallback
 
-    def set(self, section, key, value):
+    def set(self, section, key, value, save=True):
         try:
             if not self.config.has_section(section):
                 self.config.add_section(section)
             # Убедимся, что значение является строкой и не содержит суррогатных пар
             safe_value = str(value).encode('utf-8', errors='ignore').decode('utf-8')
             self.config.set(section, key, safe_value)
-            self.save()
+            if save:
+                self.save()
+                self._rebuild_snapshot()
         except Exception as e:
             console.print(f"[red]Ошибка при установке значения {section}.{key}: {str(e)}[/red]")
 
     def get_postgresql_config(self):
+        return self.snapshot.postgresql
+
+    def get_application_config(self):
+        return self.snapshot.application
+
+    def get_alerts_config(self):
+        return self.snapshot.alerts
+
+    def get_monitoring_config(self):
+        return self.snapshot.monitoring
+
+    def get_collectors_config(self):
+        """Интервал и таймаут опроса (в секундах) для каждого сборщика."""
+        return self.snapshot.collectors
+
+    def get_daemon_config(self):
+        return self.snapshot.daemon
+
+    def get_notifications_config(self):
+        return self.snapshot.notifications
+
+    def get_fleet_config(self):
+        return self.snapshot.fleet
+
+    def _read_postgresql_config(self):
         return {
             'host': self.get('postgresql', 'host'),
             'port': self.get('postgresql', 'port'),
             'database': self.get('postgresql', 'database'),
             'user': self.get('postgresql', 'user'),
-            'password': self.get('postgresql', 'password')
+            'password': self.get('postgresql', 'password'),
+            'size_interval': self.get('postgresql', 'size_interval'),
+            'replication_interval': self.get('postgresql', 'replication_interval'),
+            'statements_interval': self.get('postgresql', 'statements_interval'),
+            'top_statements': self.get('postgresql', 'top_statements')
         }
 
-    def get_application_config(self):
+    def _read_application_config(self):
         return {
             'service_name': self.get('application', 'service_name'),
-            'url': self.get('application', 'url')
+            'services': [u.strip() for u in self.get('application', 'services', '').split(',') if u.strip()],
+            'url': self.get('application', 'url'),
+            'urls': [u.strip() for u in self.get('application', 'urls', '').split(',') if u.strip()]
         }
 
-    def get_alerts_config(self):
+    def _read_alerts_config(self):
         return {
             'cpu_threshold': float(self.get('alerts', 'cpu_threshold')),
             'memory_threshold': float(self.get('alerts', 'memory_threshold')),
             'disk_threshold': float(self.get('alerts', 'disk_threshold')),
             'temp_threshold': float(self.get('alerts', 'temp_threshold')),
-            'cpu_sustained_load_time': int(self.get('alerts', 'cpu_sustained_load_time'))
+            'cpu_sustained_load_time': int(self.get('alerts', 'cpu_sustained_load_time')),
+            'disk_full_hours': float(self.get('alerts', 'disk_full_hours')),
+            'net_errors_threshold': float(self.get('alerts', 'net_errors_threshold')),
+            'app_connections_threshold': float(self.get('alerts', 'app_connections_threshold')),
+            'pg_replication_lag': float(self.get('alerts', 'pg_replication_lag')),
+            'pg_lock_waits': float(self.get('alerts', 'pg_lock_waits')),
+            'service_pressure_threshold': float(self.get('alerts', 'service_pressure_threshold')),
+            'anomaly_threshold': float(self.get('alerts', 'anomaly_threshold')),
+            'anomaly_window': float(self.get('alerts', 'anomaly_window')),
+            'anomaly_warmup': int(self.get('alerts', 'anomaly_warmup')),
+            'alert_for': float(self.get('alerts', 'alert_for')),
+            'hysteresis': float(self.get('alerts', 'hysteresis')),
+            'notify_cooldown': float(self.get('alerts', 'notify_cooldown'))
         }
 
-    def get_monitoring_config(self):
+    def _read_monitoring_config(self):
         return {
             'update_interval': float(self.get('monitoring', 'update_interval')),
             'history_length': int(self.get('monitoring', 'history_length')),
+            'minute_rollups': int(self.get('monitoring', 'minute_rollups')),
+            'hour_rollups': int(self.get('monitoring', 'hour_rollups')),
+            'chart_window': float(self.get('monitoring', 'chart_window')),
+            'top_processes': int(self.get('monitoring', 'top_processes')),
+            'mounts': tuple(m.strip() for m in self.get('monitoring', 'mounts').split(',') if m.strip()),
+            'show_health': self.get('monitoring', 'show_health').lower() == 'true',
+            'profile_dir': self.get('monitoring', 'profile_dir'),
             'enable_notifications': self.get('monitoring', 'enable_notifications').lower() == 'true',
-            'log_to_csv': self.get('monitoring', 'log_to_csv').lower() == 'true'
+            'log_to_csv': self.get('monitoring', 'log_to_csv').lower() == 'true',
+            'log_file': self.get('monitoring', 'log_file'),
+            'log_format': self.get('monitoring', 'log_format').strip().lower(),
+            'log_batch_size': int(self.get('monitoring', 'log_batch_size')),
+            'log_flush_interval': float(self.get('monitoring', 'log_flush_interval')),
+            'log_fsync': self.get('monitoring', 'log_fsync').strip().lower(),
+            'log_max_size_mb': float(self.get('monitoring', 'log_max_size_mb')),
+            'log_rotate_interval': float(self.get('monitoring', 'log_rotate_interval')),
+            'log_keep': int(self.get('monitoring', 'log_keep'))
+        }
+
+    def _read_notifications_config(self):
+        return {
+            'webhook_url': self.get('notifications', 'webhook_url').strip(),
+            'syslog': self.get('notifications', 'syslog').lower() == 'true',
+            'exec_command': self.get('notifications', 'exec_command').strip(),
+            'file': self.get('notifications', 'file').strip(),
+            'queue_size': int(self.get('notifications', 'queue_size')),
+            'batch_size': int(self.get('notifications', 'batch_size')),
+            'retries': int(self.get('notifications', 'retries')),
+            'retry_backoff': float(self.get('notifications', 'retry_backoff'))
         }
 
+    def _read_daemon_config(self):
+        return {
+            'listen_address': self.get('daemon', 'listen_address'),
+            'listen_port': int(self.get('daemon', 'listen_port')),
+            'stream_interval': float(self.get('daemon', 'stream_interval'))
+        }
+
+    def _read_fleet_config(self):
+        sort = self.get('fleet', 'sort').strip()
+        return {
+            'agents': tuple(a.strip() for a in self.get('fleet', 'agents').split(',') if a.strip()),
+            'sort': sort if sort in FLEET_SORT_KEYS else 'cpu'
+        }
+
+    def _read_collectors_config(self):
+        collectors = {}
+        for name in ('system', 'temp', 'postgresql', 'pg_workload', 'service', 'http', 'process', 'cgroup', 'disk', 'net',
+                     'monitor'):
+            collectors[name] = {
+                'interval': float(self.get('collectors', f'{name}_interval')),
+                'timeout': float(self.get('collectors', f'{name}_timeout'))
+            }
+        return collectors
+
     def edit_interactive(self):
         """Интерактивное редактирование конфигурационного файла."""
         console.clear()
         console.print("[bold cyan]=== Интерактивное редактирование конфигурации ===\n")
         console.print("Нажмите Enter, чтобы оставить текущее значение. Нажмите Ctrl+C для отмены.\n")
         
+        changed = False
         try:
             for section in self.config.sections():
                 console.print(f"\n[bold yellow]{section.upper()}:")
@@ -168,16 +450,23 @@ class ConfigManager:
                             show_default=True,
                         )
                         if new_value != value:
-                            self.set(section, key, new_value)
+                            # Все изменения сохраняются одной атомарной записью в конце
+                            self.set(section, key, new_value, save=False)
+                            changed = True
                     except Exception as e:
                         console.print(f"[red]Ошибка при редактировании {section}.{key}: {str(e)}[/red]")
             
+            if changed:
+                self.save()
+                self._rebuild_snapshot()
             console.print("\n[green]Конфигурация сохранена![/green]")
             if Confirm.ask("\n[bold]Перезапустить мониторинг с новой конфигурацией?[/bold]", default=True):
                 return True
             return False
 
         except KeyboardInterrupt:
+            # Отбрасываем несохранённые правки
+            self.load()
             console.print("\n\n[yellow]Редактирование отменено. Возврат в главное меню...[/yellow]")
             return False # Не перезапускать мониторинг
         except Exception as e:
@@ -185,77 +474,879 @@ class ConfigManager:
             input("\nНажмите Enter для продолжения...")
             return False
 
+class ConfigWatcher:
+    """Следит за mtime файла конфигурации и перезагружает его без перезапуска мониторинга."""
+    def __init__(self, config_manager, interval=2.0):
+        self.config_manager = config_manager
+        self.interval = interval
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='config-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def _loop(self):
+        pending = None
+        while not self._stopped.wait(self.interval):
+            stamp = self.config_manager.file_stamp()
+            if not self.config_manager.changed_on_disk(stamp):
+                pending = None
+            elif stamp == pending:
+                # Файл не менялся целый интервал — запись завершена, можно перечитывать
+                self.config_manager.reload()
+                pending = None
+            else:
+                pending = stamp
+
 # Удаляем старые функции конфигурации
 # CONFIG_FILE = "monitoring.conf"
 LOG_FILE = "monitoring_log.csv"
 
 console = Console()
 
+_history_versions = itertools.count()
+
 # График для истории
 class History:
+    """Кольцевой буфер фиксированной ёмкости поверх array('d') с добавлением за O(1).
+
+    Каждое значение пишется дважды (в позицию i и i + maxlen), поэтому последние
+    n значений всегда лежат непрерывно и отдаются как memoryview без копирования.
+    Параллельно хранятся частичные суммы и монотонные очереди, так что сумма или
+    среднее по любому окну, а также минимум и максимум вычисляются за O(1).
+    Суммы не копятся бесконечно: при каждом обороте буфера значения текущего оборота
+    получают суффиксные суммы, а новые — префиксные с нуля, поэтому точность
+    ограничена величинами внутри окна, а не всей историей.
+    """
     def __init__(self, maxlen=60, default_value=0):
-        self.maxlen = maxlen
+        self.maxlen = max(1, int(maxlen))
         self.default_value = default_value
-        self.data = [default_value]  # Инициализируем с одним значением по умолчанию
-    
+        self._buf = array('d', bytes(16 * self.maxlen))
+        # Сумма значений текущего оборота до позиции i
+        self._before = array('d', bytes(8 * self.maxlen))
+        # Сумма значений прошлого оборота от позиции i до конца буфера
+        self._after = array('d', bytes(8 * self.maxlen))
+        self._view = memoryview(self._buf)
+        self._head = 0
+        self._len = 0
+        self._count = 0
+        self._total = 0.0
+        self._min = deque()  # (номер значения, значение), значения возрастают
+        self._max = deque()  # (номер значения, значение), значения убывают
+        # Меняется при каждом изменении данных — ключ для кэша графиков
+        self.version = next(_history_versions)
+        # Инициализируем с одним значением по умолчанию (None — пустая история)
+        if default_value is not None:
+            self.append(default_value)
+
     def append(self, value):
-        self.data.append(value)
-        if len(self.data) > self.maxlen:
-            self.data.pop(0)
-    
+        value = float(value)
+        head, maxlen = self._head, self.maxlen
+        self._buf[head] = self._buf[head + maxlen] = value
+        self._before[head] = self._total
+        self._total += value
+        if head + 1 < maxlen:
+            self._head = head + 1
+        else:
+            self._head = 0
+            self._wrap()
+        if self._len < maxlen:
+            self._len += 1
+        n = self._count
+        self._count += 1
+        self.version = next(_history_versions)
+
+        oldest = self._count - self._len
+        for extremes, worse in ((self._min, value.__le__), (self._max, value.__ge__)):
+            while extremes and worse(extremes[-1][1]):
+                extremes.pop()
+            extremes.append((n, value))
+            while extremes[0][0] < oldest:
+                extremes.popleft()
+
+    def _wrap(self):
+        """Буфер обернулся: его значения становятся прошлым оборотом, суммы нового начинаются с нуля."""
+        buf, after = self._buf, self._after
+        total = 0.0
+        for i in range(self.maxlen - 1, -1, -1):
+            total += buf[i]
+            after[i] = total
+        self._total = 0.0
+
+    def __len__(self):
+        return self._len
+
+    def window(self, n=None):
+        """Последние n значений (по умолчанию все) как memoryview без копирования."""
+        if n is None or n > self._len:
+            n = self._len
+        end = self._head + self.maxlen
+        return self._view[end - n:end]
+
     def get(self):
-        return self.data
+        return self.window()
 
-cpu_hist = History()
-mem_hist = History()
-disk_hist = History()
-temp_hist = History()
-pg_conn_hist = History()
-pg_long_hist = History()
-http_hist = History()
+    @property
+    def data(self):
+        return self.window()
+
+    def last(self, default=None):
+        return self._buf[self._head + self.maxlen - 1] if self._len else default
+
+    def sum(self, n=None):
+        """Сумма последних n значений за O(1)."""
+        if n is None or n > self._len:
+            n = self._len
+        if n <= 0:
+            return 0.0
+        head = self._head
+        if n <= head:
+            return self._total - self._before[head - n]
+        return self._total + self._after[head - n + self.maxlen]
+
+    def mean(self, n=None):
+        if n is None or n > self._len:
+            n = self._len
+        return self.sum(n) / n if n > 0 else 0.0
+
+    def min(self, default=None):
+        return self._min[0][1] if self._len else default
+
+    def max(self, default=None):
+        return self._max[0][1] if self._len else default
+
+    def resize(self, maxlen):
+        """Меняет ёмкость, сохраняя последние значения."""
+        maxlen = max(1, int(maxlen))
+        if maxlen == self.maxlen:
+            return
+        values = list(self.window(maxlen))
+        History.__init__(self, maxlen, default_value=None)
+        for value in values:
+            History.append(self, value)
+
+class RollupTier:
+    """Агрегаты min/avg/max за фиксированные периоды (например, по минутам)."""
+    def __init__(self, period, capacity):
+        self.period = period
+        self.start = History(capacity, default_value=None)
+        self.min = History(capacity, default_value=None)
+        self.avg = History(capacity, default_value=None)
+        self.max = History(capacity, default_value=None)
+        self._bucket = None
+        self._count = 0
+
+    @property
+    def capacity(self):
+        return self.avg.maxlen
+
+    def add(self, value, ts):
+        bucket = ts - ts % self.period
+        if bucket != self._bucket:
+            self.flush()
+            self._bucket = bucket
+            self._sum, self._lo, self._hi = 0.0, value, value
+        self._count += 1
+        self._sum += value
+        if value < self._lo:
+            self._lo = value
+        elif value > self._hi:
+            self._hi = value
+
+    def flush(self):
+        """Закрывает текущий период и добавляет его агрегаты в историю."""
+        if self._count:
+            self.start.append(self._bucket)
+            self.min.append(self._lo)
+            self.avg.append(self._sum / self._count)
+            self.max.append(self._hi)
+        self._count = 0
+
+class TieredHistory(History):
+    """История с автоматическим прореживанием.
+
+    Сама является History сырых значений (ёмкость history_length), а каждое значение
+    дополнительно сворачивается в минутные и часовые агрегаты min/avg/max,
+    так что длинные окна занимают ограниченную память и не требуют пересчёта.
+    """
+    def __init__(self, maxlen=60, default_value=0, minutes=1440, hours=672):
+        self.tiers = [RollupTier(60, minutes), RollupTier(3600, hours)]
+        super().__init__(maxlen, default_value=None)
+        # Начальное значение попадает только в сырые данные, не искажая агрегаты
+        if default_value is not None:
+            History.append(self, default_value)
+
+    def append(self, value, ts=None):
+        super().append(value)
+        value = float(value)
+        ts = time.time() if ts is None else ts
+        for tier in self.tiers:
+            tier.add(value, ts)
+
+    def resize(self, maxlen, minutes=None, hours=None):
+        super().resize(maxlen)
+        for tier, capacity in zip(self.tiers, (minutes, hours)):
+            if capacity is not None:
+                for h in (tier.start, tier.min, tier.avg, tier.max):
+                    h.resize(capacity)
+
+    def span(self, seconds, interval, agg='avg'):
+        """Значения за последние seconds секунд из самого подробного уровня, который их вмещает.
+
+        interval — период сырых значений. Возвращает memoryview без копирования.
+        """
+        if seconds <= self.maxlen * interval:
+            return self.window(max(1, int(seconds / interval)))
+        levels = [(interval, self)]
+        for tier in self.tiers:
+            levels.append((tier.period, getattr(tier, agg)))
+            if seconds <= tier.period * tier.capacity:
+                break
+        period, values = levels[-1]
+        if len(values) < 2:
+            # Нужный уровень ещё не накопился — берём из более подробных тот, что покрывает
+            # больший отрезок времени (при равенстве — самый подробный)
+            period, values = max(levels[:-1], key=lambda level: len(level[1]) * level[0])
+        return values.window(max(1, int(seconds // period)))
+
+cpu_hist = TieredHistory()
+mem_hist = TieredHistory()
+disk_hist = TieredHistory()
+temp_hist = TieredHistory()
+pg_conn_hist = TieredHistory()
+pg_long_hist = TieredHistory()
+http_hist = TieredHistory()
+net_rx_hist = TieredHistory()
+net_tx_hist = TieredHistory()
+app_conn_hist = TieredHistory()
+monitor_rss_hist = TieredHistory()
+monitor_cpu_hist = TieredHistory()
+
+def configure_histories(monitoring_config):
+    """Применяет длины истории из [monitoring] к глобальным историям метрик."""
+    for hist in (cpu_hist, mem_hist, disk_hist, temp_hist, pg_conn_hist, pg_long_hist, http_hist,
+                 net_rx_hist, net_tx_hist, app_conn_hist, monitor_rss_hist, monitor_cpu_hist):
+        hist.resize(monitoring_config['history_length'],
+                    monitoring_config['minute_rollups'], monitoring_config['hour_rollups'])
+    monitor_health.resize(monitoring_config['history_length'])
 
 # PostgreSQL мониторинг
-def pg_status(conf):
-    if not psycopg2:
-        return (False, 'psycopg2 не установлен', 0, 0, 'N/A')
-    try:
+class PostgresCollector:
+    """Постоянное подключение к PostgreSQL с переподключением и экспоненциальной отсрочкой.
+
+    collect() — дешёвые счётчики подключений одним подготовленным запросом; дорогой
+    pg_database_size выполняется не чаще size_interval секунд. workload() собирает
+    нагрузку с разной периодичностью: pg_stat_database и блокировки — при каждом
+    вызове, репликацию и checkpoints — раз в replication_interval, pg_stat_statements
+    и мёртвые строки — раз в statements_interval. Счётчики переводятся в скорости
+    по разнице с прошлым значением. На каждый запрос действуют statement_timeout и
+    lock_timeout, поэтому монитор не может создать всплеск нагрузки. Подключение
+    одно на обе пробы, а тайм-аут передаётся при вызове и меняется в сессии только
+    тогда, когда отличается от уже установленного.
+    """
+    STATS_SQL = (
+        "SELECT count(*) FILTER (WHERE pid <> pg_backend_pid()), "
+        "count(*) FILTER (WHERE state = 'active' AND now() - query_start > interval '30 seconds') "
+        "FROM pg_stat_activity"
+    )
+    STATS_SIZE_SQL = (
+        "SELECT count(*) FILTER (WHERE pid <> pg_backend_pid()), "
+        "count(*) FILTER (WHERE state = 'active' AND now() - query_start > interval '30 seconds'), "
+        "pg_size_pretty(pg_database_size(current_database())) "
+        "FROM pg_stat_activity"
+    )
+    DATABASE_SQL = (
+        "SELECT xact_commit, xact_rollback, blks_read, blks_hit, deadlocks, temp_bytes, "
+        "tup_inserted, tup_updated, tup_deleted "
+        "FROM pg_stat_database WHERE datname = current_database()"
+    )
+    LOCKS_SQL = (
+        "SELECT count(*), coalesce(extract(epoch FROM max(now() - state_change)), 0) "
+        "FROM pg_stat_activity WHERE wait_event_type = 'Lock'"
+    )
+    REPLICATION_SQL = (
+        "SELECT coalesce(application_name, client_addr::text, pid::text), state, "
+        "pg_wal_lsn_diff(pg_current_wal_lsn(), replay_lsn), "
+        "coalesce(extract(epoch FROM replay_lag), 0) "
+        "FROM pg_stat_replication"
+    )
+    STANDBY_SQL = (
+        "SELECT pg_is_in_recovery(), "
+        "CASE WHEN pg_is_in_recovery() THEN coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+    # В PostgreSQL 17 счётчики checkpoint'ов перенесены в pg_stat_checkpointer
+    CHECKPOINT_SQL = (
+        "SELECT checkpoints_timed, checkpoints_req, buffers_checkpoint, buffers_clean, buffers_backend "
+        "FROM pg_stat_bgwriter"
+    )
+    CHECKPOINT_SQL_17 = (
+        "SELECT c.num_timed, c.num_requested, c.buffers_written, b.buffers_clean, 0 "
+        "FROM pg_stat_checkpointer c, pg_stat_bgwriter b"
+    )
+    STATEMENTS_SQL = (
+        "SELECT queryid, left(query, 200), calls, total_exec_time FROM pg_stat_statements "
+        "WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database()) "
+        "ORDER BY total_exec_time DESC LIMIT %s"
+    )
+    STATEMENTS_SQL_12 = STATEMENTS_SQL.replace('total_exec_time', 'total_time')
+    DEAD_TUPLES_SQL = (
+        "SELECT schemaname || '.' || relname, n_dead_tup, "
+        "n_dead_tup::float / nullif(n_live_tup + n_dead_tup, 0) "
+        "FROM pg_stat_user_tables WHERE n_dead_tup > 0 ORDER BY n_dead_tup DESC LIMIT %s"
+    )
+
+    def __init__(self, conf, timeout=2, size_interval=300, max_backoff=60,
+                 replication_interval=30, statements_interval=60, top_statements=5):
+        self.conf = conf
+        self.timeout = timeout
+        self.size_interval = float(conf.get('size_interval') or size_interval)
+        self.replication_interval = float(conf.get('replication_interval') or replication_interval)
+        self.statements_interval = float(conf.get('statements_interval') or statements_interval)
+        self.top_statements = int(conf.get('top_statements') or top_statements)
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_timeout = None  # тайм-аут, установленный в текущей сессии
+        self._backoff = 0
+        self._retry_at = 0.0
+        self._last_error = None
+        self._db_size = 'N/A'
+        self._size_at = None
+        self._server_version = 0
+        self._has_statements = False
+        self._counters = {}  # имя -> (значения счётчиков, время)
+        self._slow = {}  # результаты редких запросов
+        self._slow_at = {}
+
+    def _connect(self, timeout):
         conn = psycopg2.connect(
-            host=conf['host'], port=conf['port'], dbname=conf['database'], user=conf['user'], password=conf['password'],
-            connect_timeout=2
+            host=self.conf['host'], port=self.conf['port'], dbname=self.conf['database'],
+            user=self.conf['user'], password=self.conf['password'],
+            connect_timeout=max(1, int(timeout)),
+            application_name='monitoring'
         )
+        conn.autocommit = True
         cur = conn.cursor()
-        cur.execute("SELECT count(*) FROM pg_stat_activity;")
-        active_conn = int(cur.fetchone()[0])
-        cur.execute("SELECT count(*) FROM pg_stat_activity WHERE state='active' AND now()-query_start > interval '30 seconds';")
-        long_queries = int(cur.fetchone()[0])
-        cur.execute(f"SELECT pg_size_pretty(pg_database_size('{conf['database']}'));")
-        db_size = cur.fetchone()[0]
+        cur.execute("PREPARE monitoring_stats AS " + self.STATS_SQL)
+        cur.execute("PREPARE monitoring_stats_size AS " + self.STATS_SIZE_SQL)
+        cur.execute("SELECT count(*) FROM pg_extension WHERE extname = 'pg_stat_statements'")
+        self._has_statements = cur.fetchone()[0] > 0
         cur.close()
-        conn.close()
-        return (True, 'OK', active_conn, long_queries, db_size)
-    except Exception as e:
-        return (False, str(e), 0, 0, 'N/A')
+        self._server_version = conn.server_version
+        self._counters = {}
+        self._conn_timeout = None
+        return conn
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _with_connection(self, query, timeout=None):
+        """Выполняет query(cursor, now) с переподключением; возвращает (результат, ошибка)."""
+        timeout = self.timeout if timeout is None else timeout
+        now = time.monotonic()
+        if self._conn is None and now < self._retry_at:
+            return None, f"{self._last_error} (повтор через {self._retry_at - now:.0f} сек.)"
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = self._connect(timeout)
+            cur = self._conn.cursor()
+            try:
+                if timeout != self._conn_timeout:
+                    ms = str(int(timeout * 1000))
+                    cur.execute("SELECT set_config('statement_timeout', %s, false), "
+                                "set_config('lock_timeout', %s, false)", (ms, ms))
+                    self._conn_timeout = timeout
+                result = query(cur, now)
+            finally:
+                cur.close()
+            self._backoff = 0
+            return result, None
+        except psycopg2.errors.QueryCanceled as e:
+            # Сработал statement_timeout: подключение исправно, пропускаем этот запрос
+            return None, str(e).strip()
+        except Exception as e:
+            self._close()
+            self._last_error = str(e).strip()
+            self._backoff = min(self.max_backoff, self._backoff * 2 or 1)
+            self._retry_at = now + self._backoff
+            return None, self._last_error
+
+    def collect(self, timeout=None):
+        if not psycopg2:
+            return (False, 'psycopg2 не установлен', 0, 0, 'N/A')
+
+        def query(cur, now):
+            with_size = self._size_at is None or now - self._size_at >= self.size_interval
+            cur.execute("EXECUTE monitoring_stats_size" if with_size else "EXECUTE monitoring_stats")
+            row = cur.fetchone()
+            if with_size:
+                self._db_size = row[2]
+                self._size_at = now
+            return row
+
+        with self._lock:
+            row, error = self._with_connection(query, timeout)
+        if row is None:
+            return (False, error, 0, 0, 'N/A')
+        return (True, 'OK', int(row[0]), int(row[1]), self._db_size)
+
+    def _rates(self, name, values, now):
+        """Скорости в секунду по разнице с прошлыми значениями счётчиков (None при первом вызове)."""
+        prev = self._counters.get(name)
+        self._counters[name] = (values, now)
+        if prev is None or now <= prev[1]:
+            return None
+        elapsed = now - prev[1]
+        # Сброс статистики (pg_stat_reset) даёт отрицательную разницу — считаем с нуля
+        return [max(0.0, float(v - p)) / elapsed for v, p in zip(values, prev[0])]
+
+    def _due(self, name, interval, now):
+        if now - self._slow_at.get(name, -math.inf) < interval:
+            return False
+        self._slow_at[name] = now
+        return True
+
+    def workload(self, timeout=None):
+        """Показатели нагрузки; ключ 'error' — причина, если подключиться не удалось."""
+        if not psycopg2:
+            return {'error': 'psycopg2 не установлен'}
+
+        def query(cur, now):
+            result = {}
+            cur.execute(self.DATABASE_SQL)
+            row = cur.fetchone()
+            if row is not None:
+                rates = self._rates('database', row, now)
+                if rates is not None:
+                    commit, rollback, blks_read, blks_hit, deadlocks, temp_bytes, ins, upd, dele = rates
+                    result.update(tps=commit + rollback, commit_rate=commit, rollback_rate=rollback,
+                                  deadlock_rate=deadlocks, temp_bytes_rate=temp_bytes,
+                                  tuple_write_rate=ins + upd + dele)
+                    # Доля попаданий в кэш за интервал, а не за всё время работы сервера
+                    blocks = blks_read + blks_hit
+                    result['cache_hit'] = blks_hit / blocks * 100 if blocks else None
+            cur.execute(self.LOCKS_SQL)
+            waiting, longest = cur.fetchone()
+            result.update(lock_waits=int(waiting), longest_lock_wait=float(longest))
+
+            if self._due('replication', self.replication_interval, now):
+                slow = {}
+                cur.execute(self.STANDBY_SQL)
+                in_recovery, standby_lag = cur.fetchone()
+                slow['standby_lag'] = float(standby_lag) if in_recovery and standby_lag is not None else None
+                slow['replicas'] = []
+                if not in_recovery:
+                    cur.execute(self.REPLICATION_SQL)
+                    slow['replicas'] = [(name, state, float(lag_bytes or 0), float(lag or 0))
+                                        for name, state, lag_bytes, lag in cur.fetchall()]
+                cur.execute(self.CHECKPOINT_SQL_17 if self._server_version >= 170000 else self.CHECKPOINT_SQL)
+                rates = self._rates('checkpoints', cur.fetchone(), now)
+                if rates is not None:
+                    slow['checkpoints'] = dict(zip(
+                        ('timed_rate', 'requested_rate', 'buffers_checkpoint_rate', 'buffers_clean_rate',
+                         'buffers_backend_rate'), rates))
+                self._slow.update(slow)
+
+            if self._due('statements', self.statements_interval, now):
+                if self._has_statements:
+                    cur.execute(self.STATEMENTS_SQL if self._server_version >= 130000 else self.STATEMENTS_SQL_12,
+                                (self.top_statements * 4,))
+                    self._slow['statements'] = self._statement_rates(cur.fetchall(), now)
+                cur.execute(self.DEAD_TUPLES_SQL, (self.top_statements,))
+                self._slow['dead_tuples'] = [(name, int(dead), ratio) for name, dead, ratio in cur.fetchall()]
+
+            result.update(self._slow)
+            return result
+
+        with self._lock:
+            result, error = self._with_connection(query, timeout)
+        return result if result is not None else {'error': error}
+
+    def _statement_rates(self, rows, now):
+        """Топ запросов по времени выполнения за интервал между выборками pg_stat_statements."""
+        prev = self._counters.get('statements')
+        current = {queryid: (calls, total_ms) for queryid, _, calls, total_ms in rows}
+        self._counters['statements'] = (current, now)
+        if prev is None:
+            return []
+        prev_rows, prev_at = prev
+        elapsed = now - prev_at
+        top = []
+        for queryid, text, calls, total_ms in rows:
+            prev_calls, prev_ms = prev_rows.get(queryid, (0, 0.0))
+            d_calls, d_ms = calls - prev_calls, total_ms - prev_ms
+            if d_calls <= 0 or d_ms < 0:
+                continue
+            top.append({'query': ' '.join(text.split()), 'calls_rate': d_calls / elapsed,
+                        'mean_ms': d_ms / d_calls, 'load': d_ms / 1000 / elapsed})
+        return heapq.nlargest(self.top_statements, top, key=lambda s: s['load'])
+
+_pg_collectors = {}
+_pg_collectors_lock = threading.Lock()
+
+def _pg_collector_key(conf):
+    return tuple(sorted(conf.items()))
+
+def pg_collector(conf):
+    key = _pg_collector_key(conf)
+    with _pg_collectors_lock:
+        collector = _pg_collectors.get(key)
+        if collector is None:
+            collector = _pg_collectors[key] = PostgresCollector(conf)
+        return collector
+
+def pg_status(conf, timeout=2):
+    return pg_collector(conf).collect(timeout)
 
 # Статус systemd
-def service_status(service):
-    try:
-        out = subprocess.check_output(['systemctl', 'is-active', service], stderr=subprocess.STDOUT).decode().strip()
-        return out == 'active'
-    except Exception:
-        return False
+class SystemdWatcher:
+    """Кэш состояний unit'ов systemd.
 
-# HTTP статус
-def http_status(url):
-    try:
-        r = requests.get(url, timeout=2)
-        return r.status_code
-    except Exception:
+    При наличии jeepney и системной шины состояния читаются один раз через D-Bus,
+    а затем обновляются по сигналам PropertiesChanged в фоновом потоке. Иначе все
+    unit'ы опрашиваются одним вызовом systemctl show.
+    """
+    SYSTEMD = DBusAddress('/org/freedesktop/systemd1', bus_name='org.freedesktop.systemd1',
+                          interface='org.freedesktop.systemd1.Manager') if open_dbus_connection else None
+    UNIT_INTERFACE = 'org.freedesktop.systemd1.Unit'
+
+    def __init__(self, units, timeout=2):
+        self.units = list(dict.fromkeys(u for u in units if u))
+        self.timeout = timeout
+        self.mode = 'systemctl'
+        self._states = {}
+        self._paths = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if open_dbus_connection is None:
+            return
+        try:
+            self._conn = open_dbus_connection(bus='SYSTEM')
+            self._call(new_method_call(self.SYSTEMD, 'Subscribe'))
+            rule = MatchRule(type='signal', interface='org.freedesktop.DBus.Properties',
+                             member='PropertiesChanged', path_namespace='/org/freedesktop/systemd1/unit')
+            self._call(message_bus.AddMatch(rule))
+            for unit in self.units:
+                path = self._call(new_method_call(self.SYSTEMD, 'LoadUnit', 's', (unit,)))[0]
+                self._paths[path] = unit
+                self._refresh(path)
+        except Exception:
+            self._close()
+            return
+        self.mode = 'dbus'
+        self._thread = threading.Thread(target=self._listen, args=(rule,), name='systemd-dbus', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+    def _call(self, msg):
+        return unwrap_msg(self._conn.send_and_get_reply(msg, timeout=self.timeout))
+
+    def _refresh(self, path):
+        unit = DBusAddress(path, bus_name='org.freedesktop.systemd1')
+        _, state = self._call(Properties(unit).get(self.UNIT_INTERFACE, 'ActiveState'))[0]
+        with self._lock:
+            self._states[self._paths[path]] = state
+
+    def _listen(self, rule):
+        try:
+            with self._conn.filter(rule, bufsize=1024) as matches:
+                while not self._stopped.is_set():
+                    try:
+                        msg = self._conn.recv_until_filtered(matches, timeout=1.0)
+                    except TimeoutError:
+                        continue
+                    path = msg.header.fields.get(1)
+                    if path not in self._paths:
+                        continue
+                    interface, changed, invalidated = msg.body
+                    if interface != self.UNIT_INTERFACE:
+                        continue
+                    if 'ActiveState' in changed:
+                        with self._lock:
+                            self._states[self._paths[path]] = changed['ActiveState'][1]
+                    elif 'ActiveState' in invalidated:
+                        self._refresh(path)
+        except Exception:
+            # Шина пропала — переходим на опрос через systemctl
+            self._close()
+            self.mode = 'systemctl'
+
+    def _poll(self):
+        out = subprocess.check_output(
+            ['systemctl', 'show', '--property=Id,ActiveState', '--', *self.units],
+            stderr=subprocess.DEVNULL, timeout=self.timeout
+        ).decode()
+        # Блоки свойств разделены пустой строкой и идут в порядке перечисления unit'ов
+        states = {}
+        for unit, block in zip(self.units, out.strip().split('\n\n')):
+            props = dict(line.split('=', 1) for line in block.splitlines() if '=' in line)
+            states[unit] = props.get('ActiveState', 'unknown')
+        with self._lock:
+            self._states = states
+
+    def states(self):
+        """Возвращает {unit: ActiveState}; в режиме systemctl — после одного опроса всех unit'ов."""
+        if self.mode != 'dbus':
+            try:
+                self._poll()
+            except Exception:
+                with self._lock:
+                    self._states = {unit: 'unknown' for unit in self.units}
+        with self._lock:
+            return dict(self._states)
+
+_systemd_watchers = {}
+_systemd_watchers_lock = threading.Lock()
+
+def _systemd_watcher_key(units):
+    return tuple(units)
+
+def systemd_watcher(units, timeout=2):
+    """Возвращает общий запущенный SystemdWatcher для набора unit'ов."""
+    key = _systemd_watcher_key(units)
+    with _systemd_watchers_lock:
+        watcher = _systemd_watchers.get(key)
+        if watcher is None:
+            watcher = _systemd_watchers[key] = SystemdWatcher(units, timeout)
+            watcher.start()
+    return watcher
+
+def service_status(service, timeout=2):
+    return systemd_watcher([service], timeout).states().get(service) == 'active'
+
+# HTTP мониторинг
+def percentile(sorted_values, q):
+    """Перцентиль q (0..100) по заранее отсортированным значениям (nearest-rank)."""
+    if not sorted_values:
         return None
+    rank = max(1, int(-(-q * len(sorted_values) // 100)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class EndpointStats:
+    """История задержек, кодов ответа и размеров тела для одного адреса.
+
+    Кроме скользящей истории ведётся накопительная гистограмма задержек для экспорта.
+    """
+    LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+    def __init__(self, maxlen=60):
+        self.latency_hist = History(maxlen, default_value=None)
+        self.status_hist = History(maxlen, default_value=None)
+        self.size_hist = History(maxlen, default_value=None)
+        self.last_status = None
+        self.last_error = None
+        self.bucket_counts = [0] * len(self.LATENCY_BUCKETS_MS)
+        self.latency_count = 0
+        self.latency_sum_ms = 0.0
+
+    def record(self, status, latency_ms, size, error=None):
+        self.last_status = status
+        self.last_error = error
+        self.status_hist.append(status or 0)
+        if status is not None:
+            self.latency_hist.append(latency_ms)
+            self.size_hist.append(size)
+            self.latency_count += 1
+            self.latency_sum_ms += latency_ms
+            i = bisect.bisect_left(self.LATENCY_BUCKETS_MS, latency_ms)
+            if i < len(self.bucket_counts):
+                self.bucket_counts[i] += 1
+
+    def summary(self):
+        latencies = sorted(self.latency_hist.get())
+        return {
+            'status': self.last_status,
+            'error': self.last_error,
+            'latency': self.latency_hist.last() if self.last_status is not None else None,
+            'size': int(self.size_hist.last()) if self.last_status is not None else None,
+            'p50': percentile(latencies, 50),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'histogram': (tuple(itertools.accumulate(self.bucket_counts)), self.latency_count, self.latency_sum_ms)
+        }
+
+class HttpProber:
+    """Параллельно опрашивает несколько адресов через общую keep-alive сессию."""
+    def __init__(self, endpoints, timeout=2, history_length=60):
+        self.endpoints = list(dict.fromkeys(u for u in endpoints if u))
+        self.timeout = timeout
+        workers = max(1, min(16, len(self.endpoints)))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = {url: EndpointStats(history_length) for url in self.endpoints}
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='http')
+
+    def _probe_one(self, url):
+        started = time.perf_counter()
+        try:
+            r = self.session.get(url, timeout=self.timeout)
+            size = len(r.content)
+            self.stats[url].record(r.status_code, (time.perf_counter() - started) * 1000, size)
+        except Exception as e:
+            self.stats[url].record(None, None, None, str(e))
 
-# Температура CPU (lm-sensors)
-def cpu_temp():
+    def probe(self):
+        """Опрашивает все адреса и возвращает {url: summary}."""
+        for future in [self._pool.submit(self._probe_one, url) for url in self.endpoints]:
+            future.result()
+        return {url: self.stats[url].summary() for url in self.endpoints}
+
+    def close(self):
+        # Начатые опросы дорабатывают, после чего закрываются соединения сессии
+        self._pool.shutdown(wait=True)
+        self.session.close()
+
+def format_latency(result):
+    """Строка с перцентилями задержки и размером ответа."""
+    return (f"p50 {result['p50']:.0f} · p95 {result['p95']:.0f} · p99 {result['p99']:.0f} ms"
+            f" · {result['size']} B")
+
+_http_probers = {}
+_http_probers_lock = threading.Lock()
+
+def _http_prober_key(endpoints, timeout):
+    return (tuple(endpoints), timeout)
+
+def http_prober(endpoints, timeout=2, history_length=60):
+    """Возвращает общий HttpProber для набора адресов."""
+    key = _http_prober_key(endpoints, timeout)
+    with _http_probers_lock:
+        prober = _http_probers.get(key)
+        if prober is None:
+            prober = _http_probers[key] = HttpProber(endpoints, timeout, history_length)
+    return prober
+
+def http_status(url, timeout=2):
+    return http_prober([url], timeout).probe()[url]['status']
+
+# Температура CPU (hwmon, с запасным вариантом через lm-sensors)
+class TempSensors:
+    """Читает температуры напрямую из /sys/class/hwmon.
+
+    Датчики находятся один раз, их файлы остаются открытыми и перечитываются через pread.
+    Разовая ошибка чтения лишь пропускает значение; датчик отбрасывается, если он
+    исчез (ENODEV/ENOENT) или не читается MAX_FAILURES раз подряд.
+    """
+    PACKAGE_LABELS = ('Package', 'Tctl', 'Tdie')
+    CORE_LABELS = ('Core', 'Tccd')
+    CPU_CHIPS = ('coretemp', 'k10temp', 'zenpower', 'cpu_thermal', 'soc_thermal', 'acpitz')
+    MAX_FAILURES = 5
+
+    def __init__(self, root='/sys/class/hwmon'):
+        self.root = root
+        self.sensors = []  # (chip, label, fd)
+        self._failures = {}  # fd -> число неудачных чтений подряд
+        self._lock = threading.Lock()
+        self.discover()
+
+    def discover(self):
+        for path in sorted(glob.glob(os.path.join(self.root, 'hwmon*', 'temp*_input'))):
+            hwmon_dir = os.path.dirname(path)
+            prefix = os.path.basename(path)[:-len('_input')]
+            chip = self._read_text(os.path.join(hwmon_dir, 'name')) or os.path.basename(hwmon_dir)
+            label = self._read_text(os.path.join(hwmon_dir, f'{prefix}_label')) or f'{chip} {prefix}'
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except OSError:
+                continue
+            self.sensors.append((chip, label, fd))
+
+    @staticmethod
+    def _read_text(path):
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def close(self):
+        with self._lock:
+            for _, _, fd in self.sensors:
+                os.close(fd)
+            self.sensors = []
+            self._failures = {}
+
+    def read(self):
+        """Возвращает {'main', 'packages', 'cores', 'other'}; значения в °C."""
+        packages, cores, other = {}, {}, {}
+        cpu_chip_temps = []
+        with self._lock:
+            alive = []
+            for chip, label, fd in self.sensors:
+                try:
+                    value = int(os.pread(fd, 32, 0)) / 1000.0
+                except (OSError, ValueError) as e:
+                    failures = self._failures.get(fd, 0) + 1
+                    gone = isinstance(e, OSError) and e.errno in (errno.ENODEV, errno.ENOENT)
+                    if gone or failures >= self.MAX_FAILURES:
+                        # Датчик пропал (например, выгружен драйвер) — больше его не читаем
+                        os.close(fd)
+                        self._failures.pop(fd, None)
+                    else:
+                        # Драйвер иногда отвечает EIO/EAGAIN — пропускаем только этот опрос
+                        self._failures[fd] = failures
+                        alive.append((chip, label, fd))
+                    continue
+                self._failures.pop(fd, None)
+                alive.append((chip, label, fd))
+                if label.startswith(self.PACKAGE_LABELS):
+                    packages[label] = value
+                elif label.startswith(self.CORE_LABELS):
+                    cores[label] = value
+                else:
+                    other[label] = value
+                    if chip in self.CPU_CHIPS:
+                        cpu_chip_temps.append(value)
+            self.sensors = alive
+        if packages:
+            main = max(packages.values())
+        elif cores:
+            main = max(cores.values())
+        elif cpu_chip_temps:
+            main = max(cpu_chip_temps)
+        else:
+            main = None
+        return {'main': main, 'packages': packages, 'cores': cores, 'other': other}
+
+_temp_sensors = None
+_temp_sensors_lock = threading.Lock()
+
+def _sensors_cpu_temp(timeout=2):
+    """Температура из вывода lm-sensors — используется, только если hwmon недоступен."""
     try:
-        out = subprocess.check_output(['sensors'], stderr=subprocess.STDOUT).decode()
+        out = subprocess.check_output(['sensors'], stderr=subprocess.STDOUT, timeout=timeout).decode()
         for line in out.splitlines():
             if 'Core 0' in line or 'Tctl' in line:
                 parts = line.split()
@@ -266,499 +1357,3024 @@ def cpu_temp():
     except Exception:
         return None
 
-# График линии (ASCII)
-def line_chart(data, width=50, height=8, color='cyan', alert_level=None):
-    if not data:
-        return ""
-    min_v = min(data)
-    max_v = max(data)
-    rng = max_v - min_v if max_v != min_v else 1
-    scaled = [int((v - min_v) / rng * (height - 1)) for v in data]
-    chart = [''] * height
-    for y in range(height-1, -1, -1):
-        row = ''
-        for x in range(-width, 0):
-            idx = x + len(data)
-            if 0 <= idx < len(data) and scaled[idx] == y:
-                # Цвет по алерту
-                if alert_level and data[idx] >= alert_level:
-                    row += '[red]▄[/]'
-                else:
-                    row += f'[{color}]▄[/]'
-            else:
-                row += ' '
-        chart[height-1-y] = row
-    return '\n'.join(chart)
+def cpu_temps(timeout=2):
+    global _temp_sensors
+    with _temp_sensors_lock:
+        if _temp_sensors is None:
+            _temp_sensors = TempSensors()
+    if _temp_sensors.sensors:
+        return _temp_sensors.read()
+    return {'main': _sensors_cpu_temp(timeout), 'packages': {}, 'cores': {}, 'other': {}}
 
-# Логирование
-if not os.path.exists(LOG_FILE):
-    with open(LOG_FILE, 'w') as f:
-        f.write('time,cpu,mem,disk,temp,pg_conn,pg_long,http\n')
+def cpu_temp(timeout=2):
+    return cpu_temps(timeout)['main']
 
-def log_metrics(cpu, mem, disk, temp, pg_conn, pg_long, http, config_manager):
-    if not config_manager.get_monitoring_config()['log_to_csv']:
-        return
-        
-    if not os.path.exists(LOG_FILE):
-        with open(LOG_FILE, 'w') as f:
-            f.write('time,cpu,mem,disk,temp,pg_conn,pg_long,http\n')
-            
-    with open(LOG_FILE, 'a') as f:
-        f.write(f"{datetime.now().isoformat(timespec='seconds')},{cpu},{mem},{disk},{temp},{pg_conn},{pg_long},{http}\n")
+# Системные метрики (psutil)
+def system_metrics():
+    return {
+        'cpu': psutil.cpu_percent(interval=None),
+        'per_cpu': psutil.cpu_percent(percpu=True),
+        'mem': psutil.virtual_memory(),
+        'disk': psutil.disk_usage('/')
+    }
 
-# Алерты
-def get_alerts(cpu, mem, disk, temp, pg_ok, app_ok, http_code, alerts_config):
-    alerts = []
-    if cpu > alerts_config['cpu_threshold']:
-        alerts.append("[red]CPU: высокая загрузка[/red]")
-    if mem > alerts_config['memory_threshold']:
-        alerts.append("[red]Memory: недостаточно свободной памяти[/red]")
-    if disk > alerts_config['disk_threshold']:
-        alerts.append("[red]Disk: критически мало места[/red]")
-    if temp is not None and temp > alerts_config['temp_threshold']:
-        alerts.append("[red]CPU Temperature: перегрев[/red]")
-    if not pg_ok:
-        alerts.append("[red]PostgreSQL: сервис недоступен[/red]")
-    if not app_ok:
-        alerts.append("[red]Application: сервис остановлен[/red]")
-    if http_code != 200:
-        status = 'недоступен' if http_code is None or http_code == 0 else str(http_code)
-        alerts.append(f"[red]HTTP Status: {status}[/red]")
-    return alerts
-
-# Всплывающее уведомление
-def notify(alerts, config_manager):
-    if not config_manager.get_monitoring_config()['enable_notifications']:
-        return
-    
-    for alert in alerts:
-        console.bell()
-        console.print(Panel(alert, style="bold red", title="ALERT!"))
+# Диски
+Partition = namedtuple('Partition', 'device mountpoint fstype')
 
-def sparkline(data, width=30, height=1):
-    """Создает спарклайн (мини-график) из данных"""
-    if not data or len(data) == 0:
-        return "─" * width
-    
-    blocks = "▁▂▃▄▅▆▇█"
-    min_val = min(data)
-    max_val = max(data)
-    rng = max_val - min_val if max_val != min_val else 1
-    
-    # Ресемплируем данные до нужной ширины
-    step = len(data) / width if len(data) > width else 1
-    sampled_data = []
-    for i in range(width):
-        idx = min(int(i * step), len(data) - 1)
-        sampled_data.append(data[idx])
-    
-    # Создаем спарклайн
-    line = ""
-    for val in sampled_data:
-        height_idx = int(((val - min_val) / rng) * (len(blocks) - 1))
-        line += blocks[height_idx]
-    
-    return line
+class MountTrend:
+    """Линейная регрессия занятого места по времени по последним точкам истории."""
+    def __init__(self, maxlen):
+        self._t0 = None
+        self._t = History(maxlen, default_value=None)
+        self._y = History(maxlen, default_value=None)
 
-def bar_chart(data, width=30, height=8, title="", color="blue", scale_to_max=False):
-    """Создает столбчатую диаграмму с заголовком"""
-    if not data or len(data) == 0:
-        empty_chart = []
-        if title:
-            header = f"─── {title} "
-            header += "─" * (width - len(title) - 4)
-            empty_chart.append(header)
-        empty_chart.extend([" " * width] * height)
-        return Text("\n".join(empty_chart), style=color)
-    
-    chart = []
-    max_val = max(data)
-    min_val = min(data)
-    
-    # Если scale_to_max=False, используем фиксированный диапазон 0-100 для процентов
-    if not scale_to_max and max_val <= 100:
-        max_val = 100
-        min_val = 0
-    
-    rng = max_val - min_val if max_val != min_val else 1
-    
-    # Ресемплируем данные до нужной ширины
-    step = len(data) / width if len(data) > width else 1
-    sampled_data = []
-    for i in range(width):
-        idx = min(int(i * step), len(data) - 1)
-        sampled_data.append(data[idx])
-    
-    # Создаем столбцы
-    for y in range(height - 1, -1, -1):
-        row = ""
-        for val in sampled_data:
-            bar_height = int(((val - min_val) / rng) * (height - 1))
-            if y <= bar_height:
-                row += "▀"  # Используем более тонкий символ
-            else:
-                row += " "
-        chart.append(row)
-    
-    # Добавляем заголовок
-    if title:
-        current = sampled_data[-1]
-        header = f"─── {title} [{current:.1f}] "
-        header += "─" * (width - len(title) - len(f" [{current:.1f}]") - 4)
-        chart.insert(0, header)
-    
-    return Text("\n".join(chart), style=color)
+    def add(self, ts, used):
+        if self._t0 is None:
+            self._t0 = ts
+        self._t.append(ts - self._t0)
+        self._y.append(used)
 
-def get_load_color(value, warning=70, critical=90):
-    """Возвращает цвет в зависимости от нагрузки"""
-    if value >= critical:
-        return "red"
-    elif value >= warning:
-        return "yellow"
-    return "green"
+    def slope(self):
+        """Скорость роста занятого места, байт/с (None, пока точек мало)."""
+        n = len(self._t)
+        if n < 3:
+            return None
+        ts, ys = self._t.window(), self._y.window()
+        # Центрированные суммы: без потери точности на больших t и объёмах в байтах
+        mean_t, mean_y = self._t.mean(), self._y.mean()
+        stt = sty = 0.0
+        for t, y in zip(ts, ys):
+            dt = t - mean_t
+            stt += dt * dt
+            sty += dt * (y - mean_y)
+        return sty / stt if stt > 0 else None
 
-def get_load_style(value, warning=70, critical=90):
-    """Возвращает стиль для отображения нагрузки"""
-    return f"bold {get_load_color(value, warning, critical)}"
+    def seconds_to_full(self, free):
+        slope = self.slope()
+        if not slope or slope <= 0:
+            return None
+        return free / slope
 
-def get_resource_indicator(value, warning=70, critical=90):
-    """Возвращает цветной индикатор ⬤ в зависимости от нагрузки."""
-    if value >= critical:
-        return Text("⬤", style="bold red")
-    elif value >= warning:
-        return Text("⬤", style="bold yellow")
-    return Text("⬤", style="bold green")
+class DiskMonitor:
+    """Заполнение всех (или заданных) точек монтирования и скорость ввода-вывода устройств.
 
-def load_bar(value, width=50, warning=70, critical=90):
-    """Создает индикатор нагрузки в стиле htop"""
-    filled_width = int(value * width / 100)
-    empty_width = width - filled_width
-    
-    # Создаем сегменты разных цветов
-    segments = []
-    if filled_width > 0:
-        color = get_load_color(value, warning, critical)
-        segments.append(Text("█" * filled_width, style=f"bold {color}"))
-    if empty_width > 0:
-        segments.append(Text("░" * empty_width, style="dim"))
-    
-    # Добавляем процент
-    bar = Text().join(segments)
-    return Group(
-        bar,
-        Text(f"{value:>5.1f}%", style=get_load_style(value, warning, critical))
-    )
+    Список разделов кэшируется и перечитывается, только когда ядро сообщает об
+    изменении /proc/self/mountinfo (POLLPRI). Скорости считаются по разнице
+    счётчиков disk_io_counters(perdisk=True) с прошлым опросом.
+    """
+    MOUNTINFO = '/proc/self/mountinfo'
+    SKIP_DEVICES = ('loop', 'ram', 'zram', 'fd')
+    RESCAN_INTERVAL = 60
 
-def metric_line(label, value, max_value=100, width=50, warning=70, critical=90, unit=""):
-    """Создает строку с меткой и индикатором нагрузки"""
-    value_pct = (value / max_value * 100) if max_value > 0 else 0
-    return Group(
-        Text(f"{label:<15}", style="bold blue"),
-        load_bar(value_pct, width, warning, critical),
-        Text(f" {value}{unit}", style="dim")
-    )
+    def __init__(self, mounts=(), history_length=720):
+        self.mounts = list(mounts)
+        self.history_length = history_length
+        self._lock = threading.Lock()
+        self._partitions = None
+        self._scanned_at = 0.0
+        self._trends = {}
+        self._io = None
+        self._io_at = None
+        self._poll = None
+        self._mountinfo = None
+        try:
+            self._mountinfo = open(self.MOUNTINFO, 'rb')
+            self._poll = select.poll()
+            self._poll.register(self._mountinfo, select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError):
+            # Нет /proc или poll — перечитываем разделы по таймеру
+            self._poll = None
 
-def render(config_manager):
-    term_width, term_height = console.size
-    minimal = term_width < 120 or term_height < 35
-    compact = term_width < 80 or term_height < 25
+    def _mounts_changed(self):
+        if self._partitions is None:
+            return True
+        if self._poll is None:
+            return time.monotonic() - self._scanned_at >= self.RESCAN_INTERVAL
+        if not self._poll.poll(0):
+            return False
+        # Событие сбрасывается только после повторного чтения файла
+        self._mountinfo.seek(0)
+        self._mountinfo.read()
+        return True
 
-    monitoring_config = config_manager.get_monitoring_config()
-    alerts_config = config_manager.get_alerts_config()
-    
-    # CPU
-    cpu = psutil.cpu_percent(interval=None)
-    cpu_hist.append(cpu)
-    per_cpu = psutil.cpu_percent(percpu=True)
-    
-    # Memory
-    mem = psutil.virtual_memory()
-    mem_hist.append(mem.percent)
-    
-    # Disk
-    disk = psutil.disk_usage('/')
-    disk_hist.append(disk.percent)
-    
-    # Temperature
-    temp = cpu_temp()
-    if temp is not None:
-        temp_hist.append(temp)
-    
-    # PostgreSQL
-    pg_config = config_manager.get_postgresql_config()
-    pg_ok, pg_status_text, pg_conn_count, pg_long_queries, pg_size = pg_status(pg_config)
+    def partitions(self):
+        if self._mounts_changed():
+            if self._mountinfo is not None and self._partitions is None:
+                self._mountinfo.read()
+            wanted = set(self.mounts)
+            partitions = {}
+            for p in psutil.disk_partitions(all=False):
+                if (wanted and p.mountpoint not in wanted) or p.mountpoint in partitions:
+                    continue
+                if not wanted and p.mountpoint.startswith(('/snap/', '/boot/efi')):
+                    continue
+                partitions[p.mountpoint] = Partition(p.device, p.mountpoint, p.fstype)
+            # Заданные вручную точки показываем, даже если их нет в списке разделов
+            for mount in self.mounts:
+                if mount not in partitions and os.path.isdir(mount):
+                    partitions[mount] = Partition('', mount, '')
+            self._partitions = list(partitions.values())
+            self._scanned_at = time.monotonic()
+            for mount in set(self._trends) - {p.mountpoint for p in self._partitions}:
+                del self._trends[mount]
+        return self._partitions
+
+    def sample(self):
+        with self._lock:
+            return self._sample()
+
+    def _sample(self):
+        now = time.time()
+        mounts = []
+        for p in self.partitions():
+            try:
+                usage = psutil.disk_usage(p.mountpoint)
+            except OSError:
+                continue
+            trend = self._trends.get(p.mountpoint)
+            if trend is None:
+                trend = self._trends[p.mountpoint] = MountTrend(self.history_length)
+            trend.add(now, usage.used)
+            mounts.append({
+                'mount': p.mountpoint, 'device': p.device, 'fstype': p.fstype,
+                'total': usage.total, 'used': usage.used, 'free': usage.free, 'percent': usage.percent,
+                'seconds_to_full': trend.seconds_to_full(usage.free),
+            })
+
+        devices = {}
+        counters = psutil.disk_io_counters(perdisk=True) or {}
+        monotonic = time.monotonic()
+        if self._io is not None:
+            elapsed = monotonic - self._io_at
+            for name, c in counters.items():
+                prev = self._io.get(name)
+                if prev is None or name.startswith(self.SKIP_DEVICES) or elapsed <= 0:
+                    continue
+                reads, writes = c.read_count - prev.read_count, c.write_count - prev.write_count
+                ops = reads + writes
+                busy = (c.read_time - prev.read_time) + (c.write_time - prev.write_time)
+                devices[name] = {
+                    'read_bps': (c.read_bytes - prev.read_bytes) / elapsed,
+                    'write_bps': (c.write_bytes - prev.write_bytes) / elapsed,
+                    'read_iops': reads / elapsed,
+                    'write_iops': writes / elapsed,
+                    # Среднее время операции в мс (read_time/write_time в счётчиках — мс)
+                    'latency_ms': busy / ops if ops else 0.0,
+                }
+        self._io, self._io_at = counters, monotonic
+        return {'mounts': mounts, 'devices': devices}
+
+_disk_monitors = {}
+_disk_monitors_lock = threading.Lock()
+
+def _disk_monitor_key(mounts, history_length):
+    return (tuple(mounts), history_length)
+
+def disk_monitor(mounts=(), history_length=720):
+    key = _disk_monitor_key(mounts, history_length)
+    with _disk_monitors_lock:
+        monitor = _disk_monitors.get(key)
+        if monitor is None:
+            monitor = _disk_monitors[key] = DiskMonitor(mounts, history_length)
+        return monitor
+
+# Сеть
+TCP_STATES = {
+    b'01': 'ESTABLISHED', b'02': 'SYN_SENT', b'03': 'SYN_RECV', b'04': 'FIN_WAIT1', b'05': 'FIN_WAIT2',
+    b'06': 'TIME_WAIT', b'07': 'CLOSE', b'08': 'CLOSE_WAIT', b'09': 'LAST_ACK', b'0A': 'LISTEN', b'0B': 'CLOSING',
+}
+
+class NetworkMonitor:
+    """Скорости по сетевым интерфейсам и число TCP-соединений по состояниям.
+
+    Сокеты считаются разбором /proc/net/tcp и /proc/net/tcp6 целиком в байтах:
+    номера портов сравниваются как hex-строки, без преобразования каждой строки
+    и без psutil.net_connections(), который медленен на десятках тысяч сокетов.
+    """
+    SKIP_NICS = ('lo',)
+
+    def __init__(self, ports=(), proc_root='/proc'):
+        # Порты в виде, в котором они записаны в /proc/net/tcp: ':1F91'
+        self.ports = {b':%04X' % port: port for port in ports if port}
+        self.tables = [os.path.join(proc_root, 'net', name) for name in ('tcp', 'tcp6')]
+        self._lock = threading.Lock()
+        self._nics = None
+        self._nics_at = None
+
+    def sample(self):
+        with self._lock:
+            return {'nics': self._nic_rates(), **self._tcp_states()}
+
+    def _nic_rates(self):
+        counters = psutil.net_io_counters(pernic=True)
+        now = time.monotonic()
+        rates = {}
+        if self._nics is not None and now > self._nics_at:
+            elapsed = now - self._nics_at
+            for name, c in counters.items():
+                prev = self._nics.get(name)
+                if prev is None or name in self.SKIP_NICS:
+                    continue
+                rates[name] = {
+                    'rx_bps': (c.bytes_recv - prev.bytes_recv) / elapsed,
+                    'tx_bps': (c.bytes_sent - prev.bytes_sent) / elapsed,
+                    'rx_pps': (c.packets_recv - prev.packets_recv) / elapsed,
+                    'tx_pps': (c.packets_sent - prev.packets_sent) / elapsed,
+                    'errors': ((c.errin - prev.errin) + (c.errout - prev.errout)) / elapsed,
+                    'drops': ((c.dropin - prev.dropin) + (c.dropout - prev.dropout)) / elapsed,
+                }
+        self._nics, self._nics_at = counters, now
+        return rates
+
+    def _tcp_states(self):
+        states = {}
+        ports = {port: {} for port in self.ports.values()}
+        focus = self.ports
+        for path in self.tables:
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            for line in data.split(b'\n')[1:]:
+                # "sl local_address rem_address st ..." — нужны только первые четыре поля
+                fields = line.split(None, 4)
+                if len(fields) < 4:
+                    continue
+                state = fields[3]
+                states[state] = states.get(state, 0) + 1
+                if focus:
+                    local, remote = fields[1], fields[2]
+                    port = focus.get(local[-5:]) or focus.get(remote[-5:])
+                    if port:
+                        counts = ports[port]
+                        counts[state] = counts.get(state, 0) + 1
+
+        def named(counts):
+            return {TCP_STATES.get(code, code.decode()): n for code, n in counts.items()}
+
+        return {'tcp': named(states), 'ports': {port: named(counts) for port, counts in ports.items()}}
+
+_network_monitors = {}
+_network_monitors_lock = threading.Lock()
+
+def _network_monitor_key(ports):
+    return tuple(ports)
+
+def network_monitor(ports=()):
+    key = _network_monitor_key(ports)
+    with _network_monitors_lock:
+        monitor = _network_monitors.get(key)
+        if monitor is None:
+            monitor = _network_monitors[key] = NetworkMonitor(ports)
+        return monitor
+
+def focus_ports(config_manager):
+    """Порты приложения (из url) и PostgreSQL для отдельного подсчёта соединений."""
+    app_url = urlsplit(config_manager.get_application_config()['url'])
+    try:
+        app_port = app_url.port or {'http': 80, 'https': 443}.get(app_url.scheme)
+    except ValueError:
+        app_port = None
+    try:
+        pg_port = int(config_manager.get_postgresql_config()['port'])
+    except (KeyError, ValueError):
+        pg_port = None
+    return app_port, pg_port
+
+# Процессы
+ProcessRow = namedtuple('ProcessRow', 'pid name cpu rss io')
+
+class ProcessTable:
+    """Топ процессов по CPU, памяти и вводу-выводу.
+
+    Объекты psutil.Process живут между опросами и хранятся по паре (PID, момент
+    запуска), поэтому повторно выданный PID начинает с чистого листа. На каждом шаге
+    сравнивается только список PID: новые процессы добавляются, завершившиеся
+    удаляются. Внутри oneshot() перечитываются лишь новые процессы, кандидаты
+    в топы прошлого шага, процессы сервиса и PostgreSQL и очередная порция
+    остальных (полный круг за ROTATION_TICKS шагов) — остальные строки берутся
+    из прошлых замеров. Загрузка CPU и скорость ввода-вывода считаются по разнице
+    с предыдущим замером этого процесса.
+    """
+    ROTATION_TICKS = 10
+
+    def __init__(self, service_name='', top_n=10, cgroup_root='/sys/fs/cgroup'):
+        self.service_name = service_name
+        self.top_n = top_n
+        self.cgroup_root = cgroup_root
+        # (pid, момент запуска) -> [Process, время CPU, байты ввода-вывода, io доступен, время замера, строка]
+        self._procs = {}
+        self._keys = {}  # pid -> (pid, момент запуска)
+        self._candidates = set()  # PID из топов прошлого шага
+        self._rotation = []  # очередь PID для поочерёдного обновления
+        self._lock = threading.Lock()
+        self._service_procs = self._find_service_cgroup()
+
+    def _find_service_cgroup(self):
+        if not self.service_name:
+            return None
+        for path in (os.path.join(self.cgroup_root, 'system.slice', self.service_name, 'cgroup.procs'),
+                     os.path.join(self.cgroup_root, 'systemd', 'system.slice', self.service_name, 'cgroup.procs')):
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _service_pids(self):
+        if self._service_procs is None:
+            self._service_procs = self._find_service_cgroup()
+            if self._service_procs is None:
+                return set()
+        try:
+            with open(self._service_procs) as f:
+                return {int(line) for line in f if line.strip()}
+        except OSError:
+            self._service_procs = None
+            return set()
+
+    def _add(self, pid):
+        try:
+            proc = psutil.Process(pid)
+            key = (pid, proc.create_time())
+        except psutil.Error:
+            return None
+        self._procs[key] = [proc, None, None, True, None, None]
+        self._keys[pid] = key
+        return key
+
+    def _drop(self, pid):
+        self._procs.pop(self._keys.pop(pid, None), None)
+
+    def _refresh(self, pid, now):
+        """Перечитывает процесс; False, если он завершился."""
+        key = self._keys.get(pid)
+        if key is None:
+            return False
+        entry = self._procs[key]
+        proc, prev_cpu, prev_io, io_allowed, prev_at, prev_row = entry
+        try:
+            with proc.oneshot():
+                times = proc.cpu_times()
+                rss = proc.memory_info().rss
+                name = proc.name()
+                io_bytes = None
+                if io_allowed:
+                    try:
+                        counters = proc.io_counters()
+                        io_bytes = counters.read_bytes + counters.write_bytes
+                    except (psutil.AccessDenied, AttributeError):
+                        # Без прав /proc/PID/io не читается — больше не пробуем
+                        entry[3] = False
+        except psutil.NoSuchProcess:
+            self._drop(pid)
+            return False
+        except psutil.Error:
+            return True
+        cpu_time = times.user + times.system
+        # Тот же PID мог достаться новому процессу: время CPU не убывает, а имя не меняется
+        # без exec. Проверка дешевле is_running(), который создаёт новый Process
+        if prev_row is not None and (cpu_time < prev_cpu or name != prev_row.name):
+            self._drop(pid)
+            if self._add(pid) is None:
+                return False
+            return self._refresh(pid, now)
+        elapsed = now - prev_at if prev_at is not None else None
+        cpu = (cpu_time - prev_cpu) / elapsed * 100 if elapsed and prev_cpu is not None else 0.0
+        io_rate = ((io_bytes - prev_io) / elapsed
+                   if elapsed and io_bytes is not None and prev_io is not None else 0.0)
+        entry[1], entry[2], entry[4] = cpu_time, io_bytes, now
+        entry[5] = ProcessRow(pid, name, cpu, rss, io_rate)
+        return True
+
+    def sample(self):
+        with self._lock:
+            return self._sample()
+
+    def _sample(self):
+        now = time.monotonic()
+        pids = set(psutil.pids())
+        known = self._keys.keys()
+        for pid in known - pids:
+            self._drop(pid)
+        new = [pid for pid in pids - known if self._add(pid) is not None]
+
+        service_pids = self._service_pids()
+        postgres_pids = {key[0] for key, entry in self._procs.items()
+                         if entry[5] is not None and entry[5].name.startswith('postgres')}
+        due = set(new) | (self._candidates & pids) | (service_pids & pids) | postgres_pids
+        # Остальные процессы обновляются по очереди, чтобы новый лидер по CPU попал в топ
+        if not self._rotation:
+            self._rotation = list(self._keys)
+        batch = max(1, -(-len(self._keys) // self.ROTATION_TICKS))
+        due.update(self._rotation[-batch:])
+        del self._rotation[-batch:]
+        for pid in due:
+            self._refresh(pid, now)
+
+        rows = [entry[5] for entry in self._procs.values() if entry[5] is not None]
+        service = [r for r in rows if r.pid in service_pids]
+        postgres = [r for r in rows if r.name.startswith('postgres')]
+        n = self.top_n
+        result = {
+            'count': len(rows),
+            'top_cpu': heapq.nlargest(n, rows, key=lambda r: r.cpu),
+            'top_rss': heapq.nlargest(n, rows, key=lambda r: r.rss),
+            'top_io': heapq.nlargest(n, rows, key=lambda r: r.io),
+            'service': heapq.nlargest(n, service, key=lambda r: r.cpu),
+            'service_total': _process_totals(service),
+            'postgres': heapq.nlargest(n, postgres, key=lambda r: r.cpu),
+            'postgres_total': _process_totals(postgres),
+        }
+        self._candidates = {r.pid for key in ('top_cpu', 'top_rss', 'top_io') for r in result[key]}
+        return result
+
+def _process_totals(rows):
+    return {'count': len(rows), 'cpu': sum(r.cpu for r in rows), 'rss': sum(r.rss for r in rows),
+            'io': sum(r.io for r in rows)}
+
+_process_tables = {}
+_process_tables_lock = threading.Lock()
+
+def _process_table_key(service_name, top_n):
+    return (service_name, top_n)
+
+def process_table(service_name, top_n=10):
+    key = _process_table_key(service_name, top_n)
+    with _process_tables_lock:
+        table = _process_tables.get(key)
+        if table is None:
+            table = _process_tables[key] = ProcessTable(service_name, top_n)
+        return table
+
+# Учёт ресурсов сервисов по cgroup v2
+class CgroupMonitor:
+    """Ресурсы unit'ов systemd из файлов их cgroup v2.
+
+    Файлы cpu.stat, memory.*, io.stat, pids.* и *.pressure открываются один раз и
+    перечитываются через pread — это дешевле обхода дерева процессов. После
+    перезапуска unit'а systemd создаёт cgroup заново: у каталога меняется inode,
+    и он ищется снова. Счётчик OOM kill накапливается между перезапусками,
+    потому что memory.events нового cgroup начинается с нуля.
+    """
+    FILES = ('cpu.stat', 'memory.current', 'memory.max', 'memory.stat', 'memory.events',
+             'io.stat', 'pids.current', 'pids.max', 'cpu.pressure', 'memory.pressure', 'io.pressure')
+    MEMORY_STAT_KEYS = ('anon', 'file', 'kernel', 'shmem', 'sock')
+    PRESSURE_RESOURCES = ('cpu', 'memory', 'io')
+
+    def __init__(self, units=(), roots=('/sys/fs/cgroup', '/sys/fs/cgroup/unified')):
+        self.units = [u for u in units if u]
+        # Вторая точка — гибридный режим systemd, где cgroup v2 смонтирована в unified
+        self.roots = [r for r in roots if os.path.exists(os.path.join(r, 'cgroup.controllers'))]
+        self._lock = threading.Lock()
+        self._fds = {}  # unit -> {имя файла: fd}
+        self._dirs = {}  # unit -> (каталог cgroup, inode)
+        self._prev = {}  # unit -> (счётчики, время)
+        self._oom_base = {}  # unit -> OOM kill в прежних cgroup
+        self._oom_last = {}  # unit -> последнее значение oom_kill текущего cgroup
+
+    def _find(self, unit):
+        for root in self.roots:
+            for path in [os.path.join(root, 'system.slice', unit)] + glob.glob(os.path.join(root, '*.slice', unit)):
+                if os.path.isdir(path):
+                    return path
+        return None
+
+    def _open(self, unit):
+        path = self._find(unit)
+        if path is None:
+            return None
+        try:
+            self._dirs[unit] = (path, os.stat(path).st_ino)
+        except OSError:
+            return None
+        fds = {}
+        for name in self.FILES:
+            # Файлы отключённых контроллеров (например, io) отсутствуют — они просто пропускаются
+            try:
+                fds[name] = os.open(os.path.join(path, name), os.O_RDONLY)
+            except OSError:
+                pass
+        return fds
+
+    def _close(self, unit):
+        for fd in self._fds.pop(unit, {}).values():
+            os.close(fd)
+
+    def close(self):
+        with self._lock:
+            for unit in list(self._fds):
+                self._close(unit)
+
+    def sample(self):
+        """{unit: показатели} для unit'ов, у которых найден cgroup."""
+        with self._lock:
+            result = {}
+            for unit in self.units:
+                stats = self._sample(unit)
+                if stats is None and unit in self._fds:
+                    # cgroup пересоздан перезапуском unit'а — ищем новый сразу же
+                    self._close(unit)
+                    stats = self._sample(unit)
+                if stats is not None:
+                    result[unit] = stats
+            return result
+
+    def _cgroup_replaced(self, unit):
+        path, ino = self._dirs[unit]
+        try:
+            return os.stat(path).st_ino != ino
+        except OSError:
+            return True
+
+    def _sample(self, unit):
+        fds = self._fds.get(unit)
+        if fds is not None and self._cgroup_replaced(unit):
+            return None
+        if fds is None:
+            fds = self._open(unit)
+            if fds is None:
+                return None
+            self._fds[unit] = fds
+            self._prev.pop(unit, None)
+            if unit in self._oom_last:
+                self._oom_base[unit] = self._oom_base.get(unit, 0) + self._oom_last[unit]
+                self._oom_last[unit] = 0
+        raw = {}
+        for name, fd in list(fds.items()):
+            try:
+                raw[name] = os.pread(fd, 65536, 0).decode()
+            except OSError:
+                # Например, PSI выключен в ядре (psi=0): файл есть, но не читается
+                os.close(fd)
+                del fds[name]
+        if not raw:
+            # Не читается ни один файл — cgroup удалён
+            return None
+        now = time.monotonic()
+
+        cpu = _cgroup_keyed(raw.get('cpu.stat', ''))
+        events = _cgroup_keyed(raw.get('memory.events', ''))
+        io_stat = {'rbytes': 0, 'wbytes': 0, 'rios': 0, 'wios': 0}
+        for line in raw.get('io.stat', '').splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition('=')
+                if key in io_stat:
+                    io_stat[key] += int(value)
+        counters = {'usage_usec': cpu.get('usage_usec', 0), 'nr_periods': cpu.get('nr_periods', 0),
+                    'nr_throttled': cpu.get('nr_throttled', 0), 'throttled_usec': cpu.get('throttled_usec', 0),
+                    'oom_kill': events.get('oom_kill', 0), **io_stat}
+
+        prev = self._prev.get(unit)
+        self._prev[unit] = (counters, now)
+        delta = None
+        if prev is not None and now > prev[1]:
+            delta = {k: max(0, v - prev[0][k]) for k, v in counters.items()}
+            delta['elapsed'] = now - prev[1]
+        # При первом чтении прошлые OOM kill не считаются новыми, после перезапуска — считаются
+        oom_kill = counters['oom_kill']
+        new_ooms = max(0, oom_kill - self._oom_last.get(unit, oom_kill))
+        self._oom_last[unit] = oom_kill
+
+        memory_stat = _cgroup_keyed(raw.get('memory.stat', ''))
+        stats = {
+            'cpu_percent': delta['usage_usec'] / 1e6 / delta['elapsed'] * 100 if delta else 0.0,
+            'throttled_percent': delta['nr_throttled'] / delta['nr_periods'] * 100 if delta and delta['nr_periods'] else 0.0,
+            'throttled_seconds': delta['throttled_usec'] / 1e6 / delta['elapsed'] if delta else 0.0,
+            'memory': _cgroup_int(raw.get('memory.current')),
+            'memory_max': _cgroup_int(raw.get('memory.max')),
+            'memory_stat': {k: memory_stat[k] for k in self.MEMORY_STAT_KEYS if k in memory_stat},
+            'oom_kills': self._oom_base.get(unit, 0) + oom_kill,
+            'new_oom_kills': new_ooms,
+            'read_bps': delta['rbytes'] / delta['elapsed'] if delta else 0.0,
+            'write_bps': delta['wbytes'] / delta['elapsed'] if delta else 0.0,
+            'iops': (delta['rios'] + delta['wios']) / delta['elapsed'] if delta else 0.0,
+            'pids': _cgroup_int(raw.get('pids.current')),
+            'pids_max': _cgroup_int(raw.get('pids.max')),
+            'pressure': {res: _cgroup_pressure(raw[f'{res}.pressure'])
+                         for res in self.PRESSURE_RESOURCES if f'{res}.pressure' in raw},
+        }
+        return stats
+
+def _cgroup_keyed(text):
+    """Файлы вида «ключ значение» (cpu.stat, memory.stat, memory.events)."""
+    result = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(' ')
+        if value.isdigit():
+            result[key] = int(value)
+    return result
+
+def _cgroup_int(text):
+    """Число из однострочного файла; 'max' (без ограничения) и отсутствие файла — None."""
+    text = (text or '').strip()
+    return int(text) if text.isdigit() else None
+
+def _cgroup_pressure(text):
+    """PSI: {'some': (avg10, avg60, avg300), 'full': ...} в процентах времени."""
+    result = {}
+    for line in text.splitlines():
+        kind, *fields = line.split()
+        values = dict(f.split('=', 1) for f in fields)
+        result[kind] = tuple(float(values[k]) for k in ('avg10', 'avg60', 'avg300'))
+    return result
+
+_cgroup_monitors = {}
+_cgroup_monitors_lock = threading.Lock()
+
+def _cgroup_monitor_key(units):
+    return tuple(units)
+
+def cgroup_monitor(units):
+    key = _cgroup_monitor_key(units)
+    with _cgroup_monitors_lock:
+        monitor = _cgroup_monitors.get(key)
+        if monitor is None:
+            monitor = _cgroup_monitors[key] = CgroupMonitor(units)
+        return monitor
+
+# Сборщики метрик
+class ProbeResult:
+    """Последнее значение сборщика вместе с временем получения."""
+    __slots__ = ('value', 'error', 'timestamp', 'duration', 'stale')
+
+    def __init__(self, value, error, timestamp, duration, stale=False):
+        self.value = value
+        self.error = error
+        self.timestamp = timestamp
+        self.duration = duration
+        self.stale = stale
+
+class Probe:
+    """Описание сборщика: функция опроса, собственный интервал и таймаут."""
+    def __init__(self, name, func, interval, timeout, on_result=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.on_result = on_result
+        self.next_run = 0.0
+        self.started_at = None
+
+    @property
+    def max_age(self):
+        # Значение считается устаревшим, если не обновлялось дольше интервала и таймаута
+        return self.interval + self.timeout
+
+class MetricsState:
+    """Общее состояние: последние результаты всех сборщиков."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self._max_age = {}
+        self.version = 0
+
+    def publish(self, name, value, error, duration, max_age):
+        result = ProbeResult(value, error, time.monotonic(), duration)
+        with self._lock:
+            self._results[name] = result
+            self._max_age[name] = max_age
+            self.version += 1
+
+    def snapshot(self):
+        """Возвращает копию результатов с отметкой об устаревании."""
+        now = time.monotonic()
+        with self._lock:
+            items = list(self._results.items())
+            max_age = dict(self._max_age)
+        snapshot = {}
+        for name, r in items:
+            stale = now - r.timestamp > max_age[name]
+            snapshot[name] = ProbeResult(r.value, r.error, r.timestamp, r.duration, stale)
+        return snapshot
+
+class CollectorEngine:
+    """Запускает сборщики по собственному расписанию в пуле потоков."""
+    def __init__(self, probes, state=None, health=None):
+        self.probes = list(probes)
+        self.state = state if state is not None else MetricsState()
+        self.health = health
+        self._workers = max(1, len(self.probes))
+        self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='probe')
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='collector', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        # Зависшие сборщики не ждём
+        self._pool.shutdown(wait=False)
+
+    def replace_probes(self, probes):
+        """Подменяет набор сборщиков (например, после перезагрузки конфигурации).
+
+        Уже запущенные опросы старых сборщиков доработают и опубликуют результат.
+        """
+        probes = list(probes)
+        with self._lock:
+            if len(probes) > self._workers:
+                self._pool.shutdown(wait=False)
+                self._workers = len(probes)
+                self._pool = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix='probe')
+            self.probes = probes
+        self._wakeup.set()
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            now = time.monotonic()
+            next_wake = now + 1.0
+            with self._lock:
+                for probe in self.probes:
+                    if probe.started_at is not None:
+                        # Предыдущий опрос ещё не завершился — новый не запускаем
+                        continue
+                    if now >= probe.next_run:
+                        probe.started_at = now
+                        self._pool.submit(self._run, probe)
+                    else:
+                        next_wake = min(next_wake, probe.next_run)
+            self._wakeup.wait(max(0.0, next_wake - time.monotonic()))
+            self._wakeup.clear()
+
+    def _run(self, probe):
+        started = time.monotonic()
+        cpu_started = time.thread_time()
+        value, error = None, None
+        try:
+            value = probe.func()
+        except Exception as e:
+            error = str(e)
+        duration = time.monotonic() - started
+        if self.health is not None:
+            self.health.record_probe(probe.name, duration, time.thread_time() - cpu_started, probe.interval)
+        if error is None and probe.on_result:
+            try:
+                probe.on_result(value)
+            except Exception as e:
+                error = str(e)
+        self.state.publish(probe.name, value, error, duration, probe.max_age)
+        with self._lock:
+            probe.started_at = None
+            probe.next_run = started + probe.interval
+        self._wakeup.set()
+
+# Затраты самого монитора
+class ProbeCost:
+    """Время одного сборщика: настенное и процессорное по каждому вызову."""
+    def __init__(self, maxlen):
+        self.wall = History(maxlen, default_value=None)  # мс
+        self.cpu = History(maxlen, default_value=None)  # мс
+        self.calls = 0
+        self.missed = 0
+        self.wall_total = 0.0  # с
+        self.cpu_total = 0.0  # с
+
+    def resize(self, maxlen):
+        self.wall.resize(maxlen)
+        self.cpu.resize(maxlen)
+
+def _history_p95(hist):
+    return percentile(sorted(hist.get()), 95) if len(hist) else None
+
+class MonitorHealth:
+    """Во что обходится монитор наблюдаемому хосту.
+
+    Время каждого вызова сборщика (настенное и CPU потока), построения и вывода
+    кадра, пропущенные такты, RSS и CPU процесса и паузы сборщика мусора.
+    Паузы GC пишутся из gc.callbacks: обработчик может сработать в любом потоке,
+    в том числе под чужой блокировкой, поэтому он не берёт блокировок и пишет в deque.
+    По сигналу включаются cProfile и снимки tracemalloc.
+    """
+    def __init__(self, maxlen=60):
+        self.maxlen = maxlen
+        self._lock = threading.Lock()
+        self.probes = {}  # имя -> ProbeCost
+        self.frame_build = History(maxlen, default_value=None)  # мс
+        self.frame_draw = History(maxlen, default_value=None)  # мс
+        self.frames = 0
+        self.missed_ticks = 0
+        self.gc_pauses = deque(maxlen=1000)  # (поколение, пауза в секундах)
+        self.gc_collections = [0, 0, 0]
+        self.gc_pause_total = 0.0
+        self._gc_started = None
+        self._process = psutil.Process()
+        self._cpu = None  # (время CPU процесса, момент замера)
+        self._profile = None
+        self._snapshot = None
+        self.profile_note = None
+        self.errors = {}  # источник -> [число ошибок, последнее сообщение, время последней]
+
+    def start(self):
+        if self._on_gc not in gc.callbacks:
+            gc.callbacks.append(self._on_gc)
+
+    def stop(self):
+        if self._on_gc in gc.callbacks:
+            gc.callbacks.remove(self._on_gc)
+
+    def resize(self, maxlen):
+        with self._lock:
+            self.maxlen = maxlen
+            self.frame_build.resize(maxlen)
+            self.frame_draw.resize(maxlen)
+            for cost in self.probes.values():
+                cost.resize(maxlen)
+
+    def _on_gc(self, phase, info):
+        if phase == 'start':
+            self._gc_started = time.perf_counter()
+        elif self._gc_started is not None:
+            pause = time.perf_counter() - self._gc_started
+            self._gc_started = None
+            generation = info['generation']
+            self.gc_collections[generation] += 1
+            self.gc_pause_total += pause
+            self.gc_pauses.append((generation, pause))
+
+    def record_probe(self, name, wall, cpu, interval):
+        """Вызов сборщика длился wall секунд и занял cpu секунд CPU своего потока."""
+        with self._lock:
+            cost = self.probes.get(name)
+            if cost is None:
+                cost = self.probes[name] = ProbeCost(self.maxlen)
+            cost.wall.append(wall * 1000)
+            cost.cpu.append(cpu * 1000)
+            cost.calls += 1
+            cost.wall_total += wall
+            cost.cpu_total += cpu
+            # Опрос дольше интервала сдвигает следующие запуски — это пропущенные опросы
+            if interval > 0 and wall > interval:
+                cost.missed += int(wall // interval)
+
+    def record_frame(self, build, draw=None):
+        with self._lock:
+            self.frames += 1
+            self.frame_build.append(build * 1000)
+            if draw is not None:
+                self.frame_draw.append(draw * 1000)
+
+    def record_missed(self, count):
+        with self._lock:
+            self.missed_ticks += count
+
+    def record_error(self, source, message):
+        with self._lock:
+            error = self.errors.setdefault(source, [0, None, None])
+            error[0] += 1
+            error[1], error[2] = message, time.time()
+
+    def recent_errors(self, seconds):
+        """Последние сообщения источников, у которых были ошибки за seconds секунд."""
+        since = time.time() - seconds
+        with self._lock:
+            return [(source, message) for source, (_, message, at) in sorted(self.errors.items()) if at >= since]
+
+    def sample(self):
+        """Сводка затрат для экрана, экспорта и оповещений."""
+        now = time.monotonic()
+        with self._process.oneshot():
+            times = self._process.cpu_times()
+            rss = self._process.memory_info().rss
+            threads = self._process.num_threads()
+        cpu_time = times.user + times.system
+        cpu_percent = 0.0
+        if self._cpu is not None and now > self._cpu[1]:
+            cpu_percent = (cpu_time - self._cpu[0]) / (now - self._cpu[1]) * 100
+        self._cpu = (cpu_time, now)
+        pauses = list(self.gc_pauses)
+        with self._lock:
+            probes = {name: {
+                'calls': cost.calls,
+                'missed': cost.missed,
+                'wall_ms': cost.wall.get()[-1] if len(cost.wall) else None,
+                'wall_p95_ms': _history_p95(cost.wall),
+                'cpu_ms': cost.cpu.get()[-1] if len(cost.cpu) else None,
+                'wall_total': cost.wall_total,
+                'cpu_total': cost.cpu_total,
+            } for name, cost in self.probes.items()}
+            frames = {
+                'count': self.frames,
+                'build_ms': self.frame_build.get()[-1] if len(self.frame_build) else None,
+                'build_p95_ms': _history_p95(self.frame_build),
+                'draw_p95_ms': _history_p95(self.frame_draw),
+                'missed': self.missed_ticks,
+            }
+            errors = {source: {'count': count, 'last': message} for source, (count, message, _) in self.errors.items()}
+        return {
+            'rss': rss,
+            'cpu_percent': cpu_percent,
+            'cpu_total': cpu_time,
+            'threads': threads,
+            'probes': probes,
+            'frames': frames,
+            'gc': {
+                'collections': list(self.gc_collections),
+                'pause_total': self.gc_pause_total,
+                'pause_max_ms': max((p for _, p in pauses), default=0.0) * 1000,
+                'pause_p95_ms': (percentile(sorted(p for _, p in pauses), 95) or 0.0) * 1000,
+            },
+            'profile': self.profile_note,
+            'errors': errors,
+        }
+
+    def toggle_profile(self, directory):
+        """Первый вызов включает cProfile в главном потоке, второй сохраняет .prof и выключает."""
+        if self._profile is None:
+            self._profile = cProfile.Profile()
+            try:
+                self._profile.enable()
+            except ValueError as e:
+                # Уже работает другой профилировщик
+                self._profile = None
+                self.profile_note = f"cProfile: {e}"
+                return self.profile_note
+            self.profile_note = "cProfile: запись..."
+            return self.profile_note
+        self._profile.disable()
+        path = os.path.join(directory, f"monitoring-{os.getpid()}-{datetime.now():%Y%m%d-%H%M%S}.prof")
+        try:
+            self._profile.dump_stats(path)
+            self.profile_note = f"cProfile: {path}"
+        except OSError as e:
+            self.profile_note = f"cProfile: {e}"
+        self._profile = None
+        return self.profile_note
+
+    def memory_snapshot(self, directory, top=30):
+        """Первый вызов запускает tracemalloc, следующие пишут топ выделений и рост с прошлого снимка."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._snapshot = None
+            self.profile_note = "tracemalloc: запущен"
+            return self.profile_note
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
+        lines = [f"# {datetime.now().isoformat(timespec='seconds')}, всего отслежено "
+                 f"{format_bytes(tracemalloc.get_traced_memory()[0])}", "", "# Топ по месту выделения"]
+        lines += [str(stat) for stat in snapshot.statistics('lineno')[:top]]
+        if self._snapshot is not None:
+            lines += ["", "# Рост с прошлого снимка"]
+            lines += [str(stat) for stat in snapshot.compare_to(self._snapshot, 'lineno')[:top]]
+        self._snapshot = snapshot
+        path = os.path.join(directory, f"monitoring-{os.getpid()}-{datetime.now():%Y%m%d-%H%M%S}.tracemalloc.txt")
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            self.profile_note = f"tracemalloc: {path}"
+        except OSError as e:
+            self.profile_note = f"tracemalloc: {e}"
+        return self.profile_note
+
+monitor_health = MonitorHealth()
+
+def report_error(source, message):
+    """Ошибка фонового потока: учитывается в monitor_health и показывается в футере.
+
+    На консоль она выводится, только если экран не занят панелью мониторинга:
+    печать из другого потока поверх Live(screen=True) ломает кадр.
+    """
+    monitor_health.record_error(source, message)
+    if not console.is_alt_screen:
+        console.print(f"[red]{message}[/red]")
+
+def install_profiling_signals(config_manager, loop=None):
+    """SIGUSR1 — включить/сохранить cProfile, SIGUSR2 — снимок tracemalloc (файлы в profile_dir)."""
+    def directory():
+        return config_manager.get_monitoring_config()['profile_dir']
+    handlers = {signal.SIGUSR1: lambda: monitor_health.toggle_profile(directory()),
+                signal.SIGUSR2: lambda: monitor_health.memory_snapshot(directory())}
+    for sig, handler in handlers.items():
+        if loop is not None:
+            # Без экрана сообщаем, куда записан результат
+            loop.add_signal_handler(sig, lambda handler=handler: console.print(f"[cyan]{handler()}[/cyan]"))
+        else:
+            signal.signal(sig, lambda signum, frame, handler=handler: handler())
+
+def _record_system(value):
+    cpu_hist.append(value['cpu'])
+    mem_hist.append(value['mem'].percent)
+    disk_hist.append(value['disk'].percent)
+
+def _record_temp(value):
+    if value['main'] is not None:
+        temp_hist.append(value['main'])
+
+def _record_pg(value):
+    _, _, pg_conn_count, pg_long_queries, _ = value
     if pg_conn_count is not None:
         pg_conn_hist.append(pg_conn_count)
     if pg_long_queries is not None:
         pg_long_hist.append(pg_long_queries)
-    
-    # App status
+
+def _record_http(url):
+    def record(value):
+        status = value[url]['status']
+        # Используем 0 как индикатор ошибки
+        http_hist.append(status if status is not None else 0)
+    return record
+
+def _record_net(app_port):
+    def record(value):
+        nics = value['nics'].values()
+        if nics:
+            net_rx_hist.append(sum(n['rx_bps'] for n in nics))
+            net_tx_hist.append(sum(n['tx_bps'] for n in nics))
+        if app_port:
+            app_conn_hist.append(value['ports'][app_port].get('ESTABLISHED', 0))
+    return record
+
+def _record_monitor(value):
+    monitor_rss_hist.append(value['rss'])
+    monitor_cpu_hist.append(value['cpu_percent'])
+
+def _release_collector(instance):
+    close = getattr(instance, 'close', None) or getattr(instance, 'stop', None)
+    if close is not None:
+        try:
+            close()
+        except Exception:
+            pass
+
+def retain_collectors(keep):
+    """Закрывает и забывает общие сборщики, чьих ключей нет в keep ({реестр: ключи}).
+
+    После перезагрузки конфигурации старые соединения PostgreSQL, HTTP-сессии,
+    потоки и подписки D-Bus иначе остались бы жить. Закрытие идёт в отдельном
+    потоке: начатый старым сборщиком опрос сначала доработает.
+    """
+    registries = {
+        'postgresql': (_pg_collectors, _pg_collectors_lock),
+        'service': (_systemd_watchers, _systemd_watchers_lock),
+        'http': (_http_probers, _http_probers_lock),
+        'disk': (_disk_monitors, _disk_monitors_lock),
+        'net': (_network_monitors, _network_monitors_lock),
+        'process': (_process_tables, _process_tables_lock),
+        'cgroup': (_cgroup_monitors, _cgroup_monitors_lock),
+    }
+    stale = []
+    for name, (registry, lock) in registries.items():
+        keys = keep.get(name, ())
+        with lock:
+            for key in [key for key in registry if key not in keys]:
+                stale.append(registry.pop(key))
+    if stale:
+        threading.Thread(target=lambda: [_release_collector(instance) for instance in stale],
+                         name='collector-release', daemon=True).start()
+    return len(stale)
+
+def build_probes(config_manager):
+    """Создаёт сборщики с интервалами и таймаутами из конфигурации.
+
+    Общие сборщики, которые новой конфигурации больше не нужны, закрываются.
+    """
+    collectors = config_manager.get_collectors_config()
+    pg_config = config_manager.get_postgresql_config()
     app_config = config_manager.get_application_config()
-    app_ok = service_status(app_config['service_name'])
-    http_code = http_status(app_config['url'])
-    if http_code is not None:
-        http_hist.append(http_code)
-    else:
-        http_hist.append(0)  # Используем 0 как индикатор ошибки
 
-    # Layout
-    layout = Layout()
+    units = [app_config['service_name']] + app_config['services']
+    endpoints = [app_config['url']] + app_config['urls']
+    monitoring_config = config_manager.get_monitoring_config()
+    history_length = monitoring_config['history_length']
+    top_processes = monitoring_config['top_processes']
+    ports = focus_ports(config_manager)
+
+    def make(name, func, on_result=None):
+        c = collectors[name]
+        timeout = c['timeout']
+        return Probe(name, lambda: func(timeout), c['interval'], timeout, on_result)
+
+    retain_collectors({
+        'postgresql': {_pg_collector_key(pg_config)},
+        'service': {_systemd_watcher_key(units)},
+        'http': {_http_prober_key(endpoints, collectors['http']['timeout'])},
+        'disk': {_disk_monitor_key(monitoring_config['mounts'], history_length)},
+        'net': {_network_monitor_key(ports)},
+        'process': {_process_table_key(app_config['service_name'], top_processes)},
+        'cgroup': {_cgroup_monitor_key(units)},
+    })
+    return [
+        make('system', lambda timeout: system_metrics(), _record_system),
+        make('temp', lambda timeout: cpu_temps(timeout), _record_temp),
+        make('postgresql', lambda timeout: pg_status(pg_config, timeout), _record_pg),
+        make('pg_workload', lambda timeout: pg_collector(pg_config).workload(timeout)),
+        make('service', lambda timeout: systemd_watcher(units, timeout).states()),
+        make('http', lambda timeout: http_prober(endpoints, timeout, history_length).probe(), _record_http(app_config['url'])),
+        make('process', lambda timeout: process_table(app_config['service_name'], top_processes).sample()),
+        make('cgroup', lambda timeout: cgroup_monitor(units).sample()),
+        make('disk', lambda timeout: disk_monitor(monitoring_config['mounts'], history_length).sample()),
+        make('net', lambda timeout: network_monitor(ports).sample(), _record_net(ports[0])),
+        make('monitor', lambda timeout: monitor_health.sample(), _record_monitor),
+    ]
+
+def data_range(data):
+    """Минимум и максимум данных; для History — за O(1) без обхода буфера."""
+    if isinstance(data, History):
+        return data.min(), data.max()
+    return min(data), max(data)
+
+def series(data):
+    """Индексируемая последовательность значений (для History — memoryview без копирования)."""
+    return data.get() if isinstance(data, History) else data
+
+# Графики: прореживание, масштабирование и выбор символов целыми массивами
+SPARK_GLYPHS = "▁▂▃▄▅▆▇█"
+
+_chart_cache = {}
+CHART_CACHE_SIZE = 256
+
+def _cached_chart(key, build):
+    """Результат построения графика по ключу (версия данных, ширина, параметры)."""
+    if key is None:
+        return build()
+    result = _chart_cache.get(key)
+    if result is None:
+        if len(_chart_cache) >= CHART_CACHE_SIZE:
+            _chart_cache.clear()
+        result = _chart_cache[key] = build()
+    return result
+
+def _chart_key(kind, data, version, *params):
+    if version is None and isinstance(data, History):
+        version = (id(data), data.version)
+    return None if version is None else (kind, version) + params
+
+@functools.lru_cache(maxsize=64)
+def _bucket_bounds(n, width):
+    """Границы width корзин, на которые делится n точек."""
+    edges = [n * i // width for i in range(width + 1)]
+    return tuple(zip(edges, edges[1:]))
+
+def downsample(data, width, mode='max'):
+    """Сводит данные к width точкам.
+
+    mode: 'max' — максимум корзины (пики не теряются), 'min', 'avg' или 'lttb'
+    (Largest-Triangle-Three-Buckets, сохраняет форму кривой). Меньшие данные
+    возвращаются как есть.
+    """
+    values = series(data)
+    n = len(values)
+    if n <= width:
+        return list(values)
+    if mode == 'lttb':
+        return _lttb(values, width)
+    bounds = _bucket_bounds(n, width)
+    if mode == 'avg':
+        return [sum(values[a:b]) / (b - a) for a, b in bounds]
+    agg = min if mode == 'min' else max
+    return [agg(values[a:b]) for a, b in bounds]
+
+def _lttb(values, width):
+    if width < 3:
+        return [max(values)] if width == 1 else [values[0], values[-1]]
+    n = len(values)
+    bounds = _bucket_bounds(n - 2, width - 2)
+    out = [values[0]]
+    ax, ay = 0, values[0]
+    for i, (a, b) in enumerate(bounds):
+        a, b = a + 1, b + 1
+        # Среднее следующей корзины (для последней — последняя точка)
+        if i + 1 < len(bounds):
+            na, nb = bounds[i + 1][0] + 1, bounds[i + 1][1] + 1
+        else:
+            na, nb = n - 1, n
+        cx, cy = (na + nb - 1) / 2, sum(values[na:nb]) / (nb - na)
+        best, best_area = a, -1.0
+        dx, dy = cx - ax, cy - ay
+        for j in range(a, b):
+            area = abs(dx * (values[j] - ay) - (j - ax) * dy)
+            if area > best_area:
+                best, best_area = j, area
+        out.append(values[best])
+        ax, ay = best, values[best]
+    out.append(values[-1])
+    return out
+
+def scale_levels(values, levels, lo, hi):
+    """Номера уровней 0..levels-1 для значений в диапазоне [lo, hi]."""
+    rng = hi - lo if hi != lo else 1
+    k = (levels - 1) / rng
+    top = levels - 1
+    return [min(top, max(0, int((v - lo) * k))) for v in values]
+
+@functools.lru_cache(maxsize=64)
+def _column_glyphs(height, glyph):
+    """Столбцы высоты h+1 сверху вниз для всех h: таблица для транспонирования в строки."""
+    return tuple(' ' * (height - 1 - h) + glyph * (h + 1) for h in range(height))
+
+@functools.lru_cache(maxsize=64)
+def _point_glyphs(height, glyph):
+    """Столбцы с единственной точкой на уровне h."""
+    return tuple(' ' * (height - 1 - h) + glyph + ' ' * h for h in range(height))
+
+# График линии (ASCII)
+def line_chart(data, width=50, height=8, color='cyan', alert_level=None, version=None):
+    if not data:
+        return ""
+
+    def build():
+        values = downsample(data, width, 'lttb')
+        min_v, max_v = min(values), max(values)
+        columns = _point_glyphs(height, '▄')
+        cells = [columns[level] for level in scale_levels(values, height, min_v, max_v)]
+        cells = [' ' * height] * (width - len(cells)) + cells
+        styles = [None] * (width - len(values)) + [
+            'red' if alert_level and v >= alert_level else color for v in values]
+        rows = []
+        for row in zip(*cells):
+            # Соседние точки одного цвета идут одним тегом разметки
+            parts = []
+            for style, group in itertools.groupby(zip(row, styles), key=lambda cell: cell[1] if cell[0] != ' ' else None):
+                text = ''.join(ch for ch, _ in group)
+                parts.append(f'[{style}]{text}[/]' if style else text)
+            rows.append(''.join(parts))
+        return '\n'.join(rows)
+
+    return _cached_chart(_chart_key('line', data, version, width, height, color, alert_level), build)
+
+# Логирование
+LOG_COLUMNS = ('time', 'cpu', 'mem', 'disk', 'temp', 'pg_conn', 'pg_long', 'http')
+
+class MetricsWriter:
+    """Фоновая запись метрик в CSV.
+
+    log() только кладёт кортеж в очередь; поток записи держит файл открытым,
+    сбрасывает строки пачками (по размеру пачки или по времени), выполняет fsync
+    по выбранной политике и ротирует файл по размеру/времени со сжатием gzip.
+    """
+    FSYNC_POLICIES = ('never', 'batch', 'always')
+
+    FORMATS = ('csv', 'binary')
+
+    def __init__(self, path=LOG_FILE, batch_size=50, flush_interval=5.0, fsync='batch',
+                 max_bytes=0, rotate_interval=0, keep=7, queue_size=10000, log_format='csv'):
+        if fsync not in self.FSYNC_POLICIES:
+            raise ValueError(f"Неизвестная политика fsync: {fsync}")
+        if log_format not in self.FORMATS:
+            raise ValueError(f"Неизвестный формат лога: {log_format}")
+        self.path = path
+        self.format = log_format
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.keep = keep
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._file = None
+        self._opened_at = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='metrics-writer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Дописывает всё из очереди и закрывает файл."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def log(self, *values):
+        try:
+            self._queue.put_nowait((time.time(),) + values)
+        except queue.Full:
+            # Диск не успевает — лучше потерять строку, чем задержать сбор метрик
+            self.dropped += 1
+
+    def _open(self):
+        if self.format == 'binary':
+            self._file = ColumnarLog(self.path, LOG_COLUMNS)
+        else:
+            self._file = open(self.path, 'a', encoding='utf-8')
+            if self._file.tell() == 0:
+                self._file.write(','.join(LOG_COLUMNS) + '\n')
+        self._opened_at = time.time()
+
+    def _loop(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+            except queue.Empty:
+                pass
+            if batch and (stopping or self.fsync == 'always' or len(batch) >= self.batch_size
+                          or time.monotonic() >= deadline):
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    report_error('log', f"Ошибка записи лога: {str(e)}")
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _flush(self, batch):
+        if self._file is None:
+            self._open()
+        if self.format == 'binary':
+            for row in batch:
+                self._file.append(row)
+            self._file.flush(fsync=self.fsync != 'never')
+            size = self._file.size()
+        else:
+            lines = []
+            for ts, *values in batch:
+                stamp = datetime.fromtimestamp(ts).isoformat(timespec='seconds')
+                lines.append(stamp + ',' + ','.join(str(v) for v in values) + '\n')
+            self._file.write(''.join(lines))
+            self._file.flush()
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+            size = self._file.tell()
+        if ((self.max_bytes and size >= self.max_bytes) or
+                (self.rotate_interval and time.time() - self._opened_at >= self.rotate_interval)):
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        rotated = f"{self.path}.{datetime.now():%Y%m%d-%H%M%S-%f}"
+        os.replace(self.path, rotated)
+        # Сжатие может занять время — выполняем его отдельно, чтобы не задерживать запись
+        threading.Thread(target=self._compress, args=(rotated,), name='log-gzip', daemon=True).start()
+
+    def _compress(self, rotated):
+        try:
+            with open(rotated, 'rb') as src, gzip.open(rotated + '.gz', 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(rotated)
+            archives = sorted(glob.glob(glob.escape(self.path) + '.*.gz'))
+            for old in archives[:-self.keep] if self.keep > 0 else []:
+                os.remove(old)
+        except Exception as e:
+            report_error('log', f"Ошибка сжатия лога {rotated}: {str(e)}")
+
+# Колоночный бинарный лог
+COLUMNAR_MAGIC = b'MONCOL01'
+COLUMNAR_HEADER = struct.Struct('<8sII')
+COLUMNAR_HEADER_SIZE = 64
+
+def is_columnar_log(path):
+    """Проверяет по сигнатуре, что файл — колоночный бинарный лог."""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(COLUMNAR_MAGIC)) == COLUMNAR_MAGIC
+    except OSError:
+        return False
+
+def _to_float(value):
+    if value is None or value in ('', 'None', 'N/A'):
+        return math.nan
+    return float(value)
+
+class ColumnarLog:
+    """Запись колоночного бинарного лога фиксированной ширины.
+
+    Файл — заголовок и блоки по block_rows строк. Блок начинается со сводки
+    (число строк и min/max/sum/число значений по каждой колонке), за ней идут
+    колонки целиком как массивы double. Пропуски хранятся как NaN. Сводка пишется
+    после данных, поэтому читатель никогда не увидит недописанные строки.
+    """
+    def __init__(self, path, columns=LOG_COLUMNS, block_rows=1024):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size >= COLUMNAR_HEADER_SIZE:
+            magic, ncols, block_rows = COLUMNAR_HEADER.unpack(os.pread(self._fd, COLUMNAR_HEADER.size, 0))
+            if magic != COLUMNAR_MAGIC:
+                os.close(self._fd)
+                raise ValueError(f"{path}: не колоночный лог")
+        else:
+            ncols = len(columns)
+            os.pwrite(self._fd, COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, ncols, block_rows).ljust(COLUMNAR_HEADER_SIZE, b'\0'), 0)
+            size = COLUMNAR_HEADER_SIZE
+        self.ncols = ncols
+        self.block_rows = block_rows
+        self.summary_len = 1 + 4 * ncols
+        self.block_size = 8 * (self.summary_len + ncols * block_rows)
+
+        nblocks = (size - COLUMNAR_HEADER_SIZE) // self.block_size
+        self._block = max(0, nblocks - 1)
+        self._load_block(self._block if nblocks else None)
+        if self._count == self.block_rows:
+            self._start_block(self._block + 1)
+        elif not nblocks:
+            self._start_block(0)
+
+    def _offset(self, block):
+        return COLUMNAR_HEADER_SIZE + block * self.block_size
+
+    def _load_block(self, block):
+        self._summary = array('d', bytes(8 * self.summary_len))
+        self._cols = [array('d', bytes(8 * self.block_rows)) for _ in range(self.ncols)]
+        self._count = 0
+        self._dirty_from = 0
+        if block is None:
+            return
+        offset = self._offset(block)
+        self._summary = array('d', os.pread(self._fd, 8 * self.summary_len, offset))
+        self._count = int(self._summary[0])
+        offset += 8 * self.summary_len
+        for col in self._cols:
+            col[:self._count] = array('d', os.pread(self._fd, 8 * self._count, offset))
+            offset += 8 * self.block_rows
+        self._dirty_from = self._count
+
+    def _start_block(self, block):
+        self._block = block
+        self._load_block(None)
+        for c in range(self.ncols):
+            self._summary[1 + 4 * c] = math.inf
+            self._summary[2 + 4 * c] = -math.inf
+        # Блок сразу занимает своё место в файле, чтобы смещения оставались фиксированными
+        os.ftruncate(self._fd, self._offset(block + 1))
+
+    def append(self, row):
+        if self._count == self.block_rows:
+            self.flush()
+            self._start_block(self._block + 1)
+        i = self._count
+        summary = self._summary
+        for c, value in enumerate(row):
+            value = _to_float(value)
+            self._cols[c][i] = value
+            if value == value:
+                base = 1 + 4 * c
+                if value < summary[base]:
+                    summary[base] = value
+                if value > summary[base + 1]:
+                    summary[base + 1] = value
+                summary[base + 2] += value
+                summary[base + 3] += 1
+        self._count += 1
+
+    def flush(self, fsync=False):
+        """Дописывает изменённые участки колонок, затем сводку блока."""
+        start, end = self._dirty_from, self._count
+        if end > start:
+            offset = self._offset(self._block) + 8 * self.summary_len
+            for col in self._cols:
+                os.pwrite(self._fd, col[start:end].tobytes(), offset + 8 * start)
+                offset += 8 * self.block_rows
+            self._summary[0] = end
+            os.pwrite(self._fd, self._summary.tobytes(), self._offset(self._block))
+            self._dirty_from = end
+        if fsync:
+            os.fsync(self._fd)
+
+    def size(self):
+        return self._offset(self._block) + 8 * (self.summary_len + self.ncols * self._count)
+
+    def close(self):
+        self.flush()
+        os.close(self._fd)
+
+class ColumnarLogReader:
+    """Чтение колоночного лога через mmap: поиск по времени и сводки по блокам."""
+    def __init__(self, path, columns=LOG_COLUMNS):
+        self.columns = columns
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.ncols, self.block_rows = COLUMNAR_HEADER.unpack_from(self._mm, 0)
+        if magic != COLUMNAR_MAGIC:
+            raise ValueError(f"{path}: не колоночный лог")
+        self.summary_len = 1 + 4 * self.ncols
+        self.block_size = 8 * (self.summary_len + self.ncols * self.block_rows)
+        self.nblocks = (len(self._mm) - COLUMNAR_HEADER_SIZE) // self.block_size
+        self._view = memoryview(self._mm)[COLUMNAR_HEADER_SIZE:COLUMNAR_HEADER_SIZE + self.nblocks * self.block_size].cast('d')
+        # Пустой последний блок (только что начатый писателем) не учитываем
+        while self.nblocks and not self._block_count(self.nblocks - 1):
+            self.nblocks -= 1
+
+    def close(self):
+        self._view.release()
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _block_base(self, block):
+        return block * (self.block_size // 8)
+
+    def _block_count(self, block):
+        return int(self._view[self._block_base(block)])
+
+    def _column(self, block, c):
+        start = self._block_base(block) + self.summary_len + c * self.block_rows
+        return self._view[start:start + self._block_count(block)]
+
+    def _block_stats(self, block, c):
+        base = self._block_base(block) + 1 + 4 * c
+        lo, hi, total, n = self._view[base:base + 4]
+        return n, total, lo, hi
+
+    def __len__(self):
+        if not self.nblocks:
+            return 0
+        return (self.nblocks - 1) * self.block_rows + self._block_count(self.nblocks - 1)
+
+    def _first_time(self, block):
+        return self._view[self._block_base(block) + self.summary_len]
+
+    def _locate(self, ts):
+        """(блок, строка) первой записи со временем >= ts."""
+        lo, hi = 0, self.nblocks
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._first_time(mid) <= ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        block = max(0, lo - 1)
+        if block >= self.nblocks:
+            return self.nblocks, 0
+        row = bisect.bisect_left(self._column(block, 0), ts)
+        if row == self._block_count(block):
+            return block + 1, 0
+        return block, row
+
+    def _ranges(self, since=None, until=None):
+        """Пары (блок, начало, конец) строк, попадающих в [since, until)."""
+        block, row = self._locate(since) if since is not None else (0, 0)
+        end_block, end_row = self._locate(until) if until is not None else (self.nblocks, 0)
+        while (block, row) < (end_block, end_row) and block < self.nblocks:
+            stop = end_row if block == end_block else self._block_count(block)
+            yield block, row, stop
+            block, row = block + 1, 0
+
+    def rows(self, since=None, until=None):
+        for block, start, stop in self._ranges(since, until):
+            cols = [self._column(block, c)[start:stop] for c in range(self.ncols)]
+            yield from zip(*cols)
+
+    def tail(self, n):
+        rows = []
+        block = self.nblocks - 1
+        while block >= 0 and len(rows) < n:
+            cols = [self._column(block, c) for c in range(self.ncols)]
+            rows[:0] = list(zip(*cols))[-(n - len(rows)):]
+            block -= 1
+        return rows
+
+    def summary(self, since=None, until=None):
+        """{колонка: (число значений, сумма, min, max)}; полные блоки берутся из сводок."""
+        stats = {col: [0, 0.0, math.inf, -math.inf] for col in self.columns[1:]}
+        for block, start, stop in self._ranges(since, until):
+            whole = start == 0 and stop == self._block_count(block)
+            for c, col in enumerate(self.columns[1:], 1):
+                acc = stats[col]
+                if whole:
+                    n, total, lo, hi = self._block_stats(block, c)
+                else:
+                    values = [v for v in self._column(block, c)[start:stop] if v == v]
+                    n, total = len(values), math.fsum(values)
+                    lo, hi = (min(values), max(values)) if values else (math.inf, -math.inf)
+                acc[0] += int(n)
+                acc[1] += total
+                acc[2] = min(acc[2], lo)
+                acc[3] = max(acc[3], hi)
+        return {col: tuple(v) for col, v in stats.items()}
+
+def convert_csv_log(src, dst, block_rows=1024):
+    """Переносит CSV-лог в колоночный формат; возвращает число перенесённых строк."""
+    log = ColumnarLog(dst, LOG_COLUMNS, block_rows)
+    converted = 0
+    try:
+        with open(src, newline='') as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if header is None:
+                return 0
+            index = [header.index(col) if col in header else None for col in LOG_COLUMNS[1:]]
+            for row in reader:
+                try:
+                    ts = datetime.fromisoformat(row[0]).timestamp()
+                except (ValueError, IndexError):
+                    continue
+                values = []
+                for i in index:
+                    try:
+                        values.append(_to_float(row[i]) if i is not None and i < len(row) else math.nan)
+                    except ValueError:
+                        values.append(math.nan)
+                log.append([ts] + values)
+                converted += 1
+                if converted % block_rows == 0:
+                    log.flush()
+    finally:
+        log.close()
+    return converted
+
+def metrics_writer(monitoring_config):
+    """Создаёт MetricsWriter по настройкам [monitoring] или None, если логирование отключено."""
+    if not monitoring_config['log_to_csv']:
+        return None
+    return MetricsWriter(
+        monitoring_config['log_file'],
+        batch_size=monitoring_config['log_batch_size'],
+        flush_interval=monitoring_config['log_flush_interval'],
+        fsync=monitoring_config['log_fsync'],
+        max_bytes=int(monitoring_config['log_max_size_mb'] * 1024 * 1024),
+        rotate_interval=monitoring_config['log_rotate_interval'],
+        keep=monitoring_config['log_keep'],
+        log_format=monitoring_config['log_format']
+    )
+
+def log_metrics(writer, snapshot, app_url):
+    """Ставит в очередь строку лога из снимка состояния сборщиков."""
+    system = _probe_value(snapshot, 'system')
+    temps = _probe_value(snapshot, 'temp')
+    pg = _probe_value(snapshot, 'postgresql')
+    http = _probe_value(snapshot, 'http', {}).get(app_url, {})
+    writer.log(
+        system['cpu'] if system else None,
+        system['mem'].percent if system else None,
+        system['disk'].percent if system else None,
+        temps['main'] if temps else None,
+        pg[2] if pg and pg[0] else None,
+        pg[3] if pg and pg[0] else None,
+        http.get('status')
+    )
+
+# Алерты
+class AlertRule:
+    """Правило: метрика выше (или ниже) порога дольше for_seconds.
+
+    Сработавшее правило сбрасывается только после возврата метрики за порог
+    с запасом hysteresis, поэтому колебания около порога не дают серии оповещений.
+    """
+    def __init__(self, name, metric, threshold, message, above=True, for_seconds=0, hysteresis=0):
+        self.name = name
+        self.metric = metric
+        self.threshold = threshold
+        self.message = message
+        self.above = above
+        self.for_seconds = for_seconds
+        self.hysteresis = hysteresis
+
+    def breached(self, value):
+        return value > self.threshold if self.above else value < self.threshold
+
+    def cleared(self, value):
+        # Нестрогое сравнение: без гистерезиса правило вида «доступен < 1» сбрасывается при 1
+        if self.above:
+            return value <= self.threshold - self.hysteresis
+        return value >= self.threshold + self.hysteresis
+
+class Alert:
+    """Состояние одного правила: ok, pending, firing или resolved."""
+    __slots__ = ('rule', 'state', 'since', 'value', 'detail', 'notified_at', 'announced', 'deferred')
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.state = 'ok'
+        self.since = None
+        self.value = None
+        self.detail = None
+        self.notified_at = None
+        self.announced = False
+        self.deferred = False  # сработало во время cooldown, оповещение ещё не отправлено
+
+    @property
+    def text(self):
+        return self.rule.message.format(value=self.value, detail=self.detail)
+
+AlertEvent = namedtuple('AlertEvent', 'alert state text timestamp')
+
+class AlertEngine:
+    """Пошаговая проверка правил по свежим значениям метрик.
+
+    evaluate() вызывается при появлении новых данных и возвращает события
+    firing/resolved, не чаще одного оповещения на правило за cooldown секунд.
+    """
+    def __init__(self, rules=(), cooldown=300):
+        self.cooldown = cooldown
+        self.alerts = {}
+        self.set_rules(rules)
+
+    def set_rules(self, rules, cooldown=None):
+        """Заменяет правила; состояние правил с теми же именами сохраняется."""
+        if cooldown is not None:
+            self.cooldown = cooldown
+        alerts = {}
+        for rule in rules:
+            alert = self.alerts.get(rule.name) or Alert(rule)
+            alert.rule = rule
+            alerts[rule.name] = alert
+        self.alerts = alerts
+
+    def evaluate(self, samples, details=None, now=None):
+        """samples — {метрика: значение}; метрики без значения (None) не меняют состояние."""
+        now = time.time() if now is None else now
+        details = details or {}
+        events = []
+        for alert in self.alerts.values():
+            rule = alert.rule
+            value = samples.get(rule.metric)
+            if value is None:
+                continue
+            alert.value = value
+            alert.detail = details.get(rule.metric)
+            if alert.state in ('ok', 'resolved', 'pending'):
+                if not rule.breached(value):
+                    alert.state, alert.since = 'ok', None
+                    continue
+                if alert.state != 'pending':
+                    alert.state, alert.since = 'pending', now
+                if now - alert.since >= rule.for_seconds:
+                    alert.state, alert.deferred = 'firing', True
+            elif rule.cleared(value):
+                alert.state, alert.since, alert.deferred = 'resolved', now, False
+                # О сбросе сообщаем, только если было оповещение о срабатывании
+                if alert.announced:
+                    alert.announced = False
+                    events.append(AlertEvent(alert, 'resolved', alert.text, now))
+                continue
+            # Повторное срабатывание внутри cooldown откладывается до его истечения, а не теряется
+            if alert.deferred and (alert.notified_at is None or now - alert.notified_at >= self.cooldown):
+                alert.notified_at, alert.announced, alert.deferred = now, True, False
+                events.append(AlertEvent(alert, 'firing', alert.text, now))
+        return events
+
+    def firing(self):
+        return [alert for alert in self.alerts.values() if alert.state == 'firing']
+
+def alert_rules(config_manager):
+    """Правила из [alerts] и списков unit'ов/адресов [application]."""
+    alerts_config = config_manager.get_alerts_config()
+    app_config = config_manager.get_application_config()
+    for_seconds = alerts_config['alert_for']
+    hysteresis = alerts_config['hysteresis']
+    rules = [
+        # Нагрузка CPU сравнивается со скользящим средним за cpu_sustained_load_time
+        AlertRule('cpu', 'cpu_sustained', alerts_config['cpu_threshold'],
+                  "ДЛИТЕЛЬНАЯ НАГРУЗКА CPU: {value:.0f}%", hysteresis=hysteresis),
+        AlertRule('memory', 'mem', alerts_config['memory_threshold'],
+                  "MEM Высокая нагрузка: {value:.0f}%", for_seconds=for_seconds, hysteresis=hysteresis),
+        AlertRule('disk', 'disk', alerts_config['disk_threshold'],
+                  "DISK Мало места: {value:.0f}% {detail}", for_seconds=for_seconds, hysteresis=hysteresis),
+        AlertRule('disk_full', 'disk_hours_to_full', alerts_config['disk_full_hours'],
+                  "DISK {detail} заполнится через {value:.0f}ч", above=False, for_seconds=for_seconds),
+        AlertRule('temp', 'temp', alerts_config['temp_threshold'],
+                  "CPU Температура: {value:.0f}°C", for_seconds=for_seconds, hysteresis=hysteresis),
+        AlertRule('net_errors', 'net_errors', alerts_config['net_errors_threshold'],
+                  "NET ошибки и потери пакетов: {value:.0f}/с", for_seconds=for_seconds),
+        AlertRule('postgresql', 'pg_up', 1, "POSTGRESQL НЕДОСТУПЕН", above=False, for_seconds=for_seconds),
+        AlertRule('pg_replication_lag', 'pg_replication_lag', alerts_config['pg_replication_lag'],
+                  "PG отставание репликации {detail}: {value:.0f} сек.", for_seconds=for_seconds),
+        AlertRule('pg_lock_waits', 'pg_lock_waits', alerts_config['pg_lock_waits'],
+                  "PG ожидают блокировку: {value:.0f}", for_seconds=for_seconds),
+        AlertRule('service', f"unit:{app_config['service_name']}", 1, "СЕРВИС ПРИЛОЖЕНИЯ ОСТАНОВЛЕН",
+                  above=False, for_seconds=for_seconds),
+        AlertRule('service_pressure', 'service_pressure', alerts_config['service_pressure_threshold'],
+                  "PSI {detail}: {value:.0f}% времени в ожидании", for_seconds=for_seconds, hysteresis=hysteresis),
+        # OOM kill — событие, а не состояние: оповещение сразу, сброс при следующем опросе без новых
+        AlertRule('service_oom', 'service_oom_kills', 0, "OOM KILL в {detail}: {value:.0f}"),
+        AlertRule('http', f"http:{app_config['url']}", 1, "ОШИБКА HTTP: {detail}",
+                  above=False, for_seconds=for_seconds),
+    ]
+    if alerts_config['anomaly_threshold'] > 0:
+        rules.append(AlertRule('anomaly', 'anomaly', alerts_config['anomaly_threshold'], "АНОМАЛИЯ {detail}",
+                               for_seconds=for_seconds, hysteresis=alerts_config['anomaly_threshold'] / 4))
+    if alerts_config['app_connections_threshold'] > 0:
+        rules.append(AlertRule('app_connections', 'app_connections', alerts_config['app_connections_threshold'],
+                               "Соединений с :{detail}: {value:.0f}", for_seconds=for_seconds, hysteresis=hysteresis))
+    for unit in app_config['services']:
+        if unit != app_config['service_name']:
+            rules.append(AlertRule(f"unit:{unit}", f"unit:{unit}", 1, unit + ": {detail}",
+                                   above=False, for_seconds=for_seconds))
+    for url in app_config['urls']:
+        if url != app_config['url']:
+            rules.append(AlertRule(f"http:{url}", f"http:{url}", 1, "ОШИБКА HTTP " + url + ": {detail}",
+                                   above=False, for_seconds=for_seconds))
+    return rules
+
+def alert_samples(snapshot, config_manager):
+    """Значения метрик для правил из снимка; устаревшие сборщики не дают значений."""
+    alerts_config = config_manager.get_alerts_config()
+    collectors_config = config_manager.get_collectors_config()
+    samples, details = {}, {}
+
+    def fresh(name):
+        result = snapshot.get(name)
+        if result is None or result.stale:
+            return None
+        return _probe_value(snapshot, name)
+
+    system = fresh('system')
+    if system is not None:
+        num_samples = int(alerts_config['cpu_sustained_load_time'] / collectors_config['system']['interval'])
+        samples['cpu_sustained'] = cpu_hist.mean(num_samples)
+        samples['mem'] = system['mem'].percent
+        samples['disk'], details['disk'] = system['disk'].percent, '/'
+    disks = fresh('disk')
+    if disks is not None and disks['mounts']:
+        # Самая заполненная точка монтирования и самая близкая к заполнению по прогнозу
+        fullest = max(disks['mounts'], key=lambda d: d['percent'])
+        samples['disk'], details['disk'] = fullest['percent'], fullest['mount']
+        forecasts = [d for d in disks['mounts'] if d['seconds_to_full'] is not None]
+        if forecasts:
+            soonest = min(forecasts, key=lambda d: d['seconds_to_full'])
+            samples['disk_hours_to_full'] = soonest['seconds_to_full'] / 3600
+            details['disk_hours_to_full'] = soonest['mount']
+        else:
+            samples['disk_hours_to_full'] = math.inf
+    temps = fresh('temp')
+    if temps is not None:
+        samples['temp'] = temps['main']
+    pg = fresh('postgresql')
+    if pg is not None:
+        samples['pg_up'] = int(pg[0])
+    workload = fresh('pg_workload')
+    if workload is not None and 'error' not in workload:
+        samples['pg_lock_waits'] = workload['lock_waits']
+        # Отставание самой медленной реплики, а на standby — его собственное
+        lags = [(lag, name) for name, _, _, lag in workload.get('replicas', ())]
+        if workload.get('standby_lag') is not None:
+            lags.append((workload['standby_lag'], 'standby'))
+        if lags:
+            samples['pg_replication_lag'], details['pg_replication_lag'] = max(lags)
+    net = fresh('net')
+    if net is not None:
+        samples['net_errors'] = sum(n['errors'] + n['drops'] for n in net['nics'].values())
+        app_port = focus_ports(config_manager)[0]
+        if app_port:
+            samples['app_connections'] = net['ports'][app_port].get('ESTABLISHED', 0)
+            details['app_connections'] = app_port
+    cgroups = fresh('cgroup')
+    if cgroups:
+        # Самое большое давление PSI «some» за 10 секунд по всем unit'ам и ресурсам
+        pressures = [(p['some'][0], f"{unit} {resource}") for unit, c in cgroups.items()
+                     for resource, p in c['pressure'].items() if 'some' in p]
+        if pressures:
+            samples['service_pressure'], details['service_pressure'] = max(pressures)
+        samples['service_oom_kills'] = sum(c['new_oom_kills'] for c in cgroups.values())
+        details['service_oom_kills'] = ', '.join(unit for unit, c in cgroups.items() if c['new_oom_kills'])
+    units = fresh('service')
+    if units is not None:
+        for unit, state in units.items():
+            samples[f"unit:{unit}"] = int(state == 'active')
+            details[f"unit:{unit}"] = state
+    endpoints = fresh('http')
+    if endpoints is not None:
+        for url, r in endpoints.items():
+            samples[f"http:{url}"] = int(r['status'] == 200)
+            details[f"http:{url}"] = r['status'] or 'N/A'
+    return samples, details
+
+# Поиск аномалий: скользящие базовые линии по каждому ряду метрик
+class Baseline:
+    """Базовая линия одного ряда, обновляемая за O(1) на значение.
+
+    EWMA среднего и дисперсии с постоянной времени window секунд (шаг учитывает
+    неравномерные интервалы), сезонные корзины по часу суток — EWMA средних за час
+    по дням — и двусторонний CUSUM по z-оценкам для медленных сдвигов уровня.
+    Значение оценивается по линии до его учёта, чтобы выброс не маскировал сам себя.
+    """
+    __slots__ = ('mean', 'var', 'count', 'last_ts', 'cusum_hi', 'cusum_lo',
+                 'hours', 'hour_key', 'hour_sum', 'hour_count',
+                 'value', 'expected', 'std', 'score', 'kind', 'seen', 'last_z')
+
+    def __init__(self):
+        self.mean = self.var = 0.0
+        self.count = 0
+        self.last_ts = None
+        self.cusum_hi = self.cusum_lo = self.last_z = 0.0
+        self.hours = [None] * 24  # [среднее, дисперсия, дней] средних за этот час
+        self.hour_key = None
+        self.hour_sum = 0.0
+        self.hour_count = 0
+        self.value = self.expected = self.std = None
+        self.score = 0.0
+        self.kind = None
+        self.seen = None  # время последнего значения по часам (для отбора пропавших рядов)
+
+    def _fold_hour(self, hour):
+        """Закрытый час добавляется в корзину своего часа суток."""
+        if not self.hour_count:
+            return
+        m = self.hour_sum / self.hour_count
+        bucket = self.hours[hour]
+        if bucket is None:
+            self.hours[hour] = [m, 0.0, 1]
+        else:
+            delta = m - bucket[0]
+            bucket[0] += AnomalyDetector.SEASON_ALPHA * delta
+            bucket[1] = (1 - AnomalyDetector.SEASON_ALPHA) * (bucket[1] + AnomalyDetector.SEASON_ALPHA * delta * delta)
+            bucket[2] += 1
+        self.hour_sum, self.hour_count = 0.0, 0
+
+    def update(self, value, ts, hour_key, detector):
+        """Учитывает значение и возвращает оценку аномальности (в единицах z)."""
+        if self.last_ts is not None and ts <= self.last_ts:
+            return self.score
+        if hour_key != self.hour_key:
+            if self.hour_key is not None:
+                self._fold_hour(self.hour_key[1])
+            self.hour_key = hour_key
+        self.hour_sum += value
+        self.hour_count += 1
+
+        score, kind = 0.0, None
+        if self.count >= detector.warmup:
+            expected, var = self.mean, self.var
+            bucket = self.hours[hour_key[1]]
+            if bucket is not None and bucket[2] >= detector.SEASON_MIN_DAYS:
+                # Обычный уровень для этого часа суток плюс разброс по дням
+                expected, var = bucket[0], var + bucket[1]
+            std = max(math.sqrt(var), abs(expected) * detector.MIN_STD_RATIO, 1e-9)
+            z = (value - expected) / std
+            # Выброс засчитывается, только если и предыдущее значение ушло в ту же сторону:
+            # одиночные всплески шума на сотнях рядов иначе постоянно дают максимум выше порога
+            spike = min(abs(z), abs(self.last_z)) if z * self.last_z > 0 else 0.0
+            # В CUSUM z ограничено, чтобы тяжёлый хвост распределения не копил сдвиг
+            k, limit, zc = detector.CUSUM_K, detector.CUSUM_H * 2, max(-detector.CUSUM_CLIP, min(detector.CUSUM_CLIP, z))
+            self.cusum_hi = min(limit, max(0.0, self.cusum_hi + zc - k))
+            self.cusum_lo = min(limit, max(0.0, self.cusum_lo - zc - k))
+            # CUSUM, достигший порога h, даёт ту же оценку, что и выброс на threshold
+            shift = max(self.cusum_hi, self.cusum_lo) / detector.CUSUM_H * detector.threshold
+            score, kind = (spike, 'выброс') if spike >= shift else (shift, 'сдвиг')
+            self.last_z = z
+            self.expected, self.std = expected, std
+
+        alpha = 1.0 if self.last_ts is None else 1 - math.exp(-(ts - self.last_ts) / detector.window)
+        # Пока значений меньше, чем помещается в окно, — обычное среднее: иначе EWMA,
+        # начатая с одного значения, долго занижает дисперсию и завышает z
+        alpha = max(alpha, 1.0 / (self.count + 1))
+        if self.count == 0:
+            self.mean = value
+        else:
+            diff = value - self.mean
+            incr = alpha * diff
+            self.mean += incr
+            self.var = (1 - alpha) * (self.var + diff * incr)
+        self.count += 1
+        self.last_ts = ts
+        self.value, self.score, self.kind = value, score, kind
+        return score
+
+class AnomalyDetector:
+    """Базовые линии для произвольного числа рядов; каждое значение обновляет только свой ряд."""
+    SEASON_ALPHA = 0.3
+    SEASON_MIN_DAYS = 3
+    MIN_STD_RATIO = 0.02
+    CUSUM_K = 0.75
+    CUSUM_H = 12.0
+    CUSUM_CLIP = 3.0
+    # Ряд без новых значений не участвует в оповещении, а через FORGET_AFTER удаляется
+    STALE_AFTER = 300
+    FORGET_AFTER = 2 * 86400
+
+    def __init__(self, threshold=4, window=600, warmup=30):
+        self.threshold = threshold
+        self.window = window
+        self.warmup = warmup
+        self.series = {}
+
+    def configure(self, threshold, window, warmup):
+        self.threshold, self.window, self.warmup = threshold, window, warmup
+
+    def update(self, values, now=None):
+        """values — {ряд: (значение, момент получения)}; возвращает (наибольшая оценка, описание)."""
+        now = time.time() if now is None else now
+        local = time.localtime(now)
+        hour_key = (local.tm_yday, local.tm_hour)
+        for name, (value, ts) in values.items():
+            baseline = self.series.get(name)
+            if baseline is None:
+                baseline = self.series[name] = Baseline()
+            baseline.update(float(value), ts, hour_key, self)
+            baseline.seen = now
+        worst = None
+        for name, b in list(self.series.items()):
+            if now - b.seen > self.FORGET_AFTER:
+                del self.series[name]
+            elif b.kind is not None and now - b.seen <= self.STALE_AFTER and (worst is None or b.score > worst[1].score):
+                worst = (name, b)
+        if worst is None:
+            return 0.0, None
+        name, b = worst
+        return b.score, f"{name} ({b.kind}): {b.value:.4g}, норма {b.expected:.4g} ± {b.std:.2g}"
+
+    def scores(self):
+        return {name: b.score for name, b in self.series.items() if b.kind is not None}
+
+def anomaly_series(snapshot):
+    """Непрерывные ряды из снимка для поиска аномалий: {ряд: (значение, момент получения)}."""
+    series = {}
+
+    def add(name, value, result):
+        if value is not None:
+            series[name] = (value, result.timestamp)
+
+    def fresh(name):
+        result = snapshot.get(name)
+        if result is None or result.stale or result.error is not None or result.value is None:
+            return None, None
+        return result.value, result
+
+    system, r = fresh('system')
+    if system is not None:
+        add('cpu', system['cpu'], r)
+        add('mem', system['mem'].percent, r)
+    temps, r = fresh('temp')
+    if temps is not None:
+        add('temp', temps['main'], r)
+    pg, r = fresh('postgresql')
+    if pg is not None and pg[0]:
+        add('pg_connections', pg[2], r)
+    workload, r = fresh('pg_workload')
+    if workload is not None and 'error' not in workload:
+        add('pg_tps', workload.get('tps'), r)
+        add('pg_lock_waits', workload['lock_waits'], r)
+    endpoints, r = fresh('http')
+    if endpoints is not None:
+        for url, e in endpoints.items():
+            add(f"http_latency:{url}", e['latency'], r)
+    net, r = fresh('net')
+    if net is not None:
+        for nic, n in net['nics'].items():
+            add(f"net_rx:{nic}", n['rx_bps'], r)
+            add(f"net_tx:{nic}", n['tx_bps'], r)
+        for port, states in net['ports'].items():
+            add(f"connections:{port}", states.get('ESTABLISHED', 0), r)
+    disks, r = fresh('disk')
+    if disks is not None:
+        for device, disk_io in disks['devices'].items():
+            add(f"disk_io:{device}", disk_io['read_bps'] + disk_io['write_bps'], r)
+            add(f"disk_latency:{device}", disk_io['latency_ms'], r)
+    cgroups, r = fresh('cgroup')
+    if cgroups is not None:
+        for unit, c in cgroups.items():
+            add(f"unit_cpu:{unit}", c['cpu_percent'], r)
+            add(f"unit_memory:{unit}", c['memory'], r)
+    procs, r = fresh('process')
+    if procs is not None:
+        add('processes', procs['count'], r)
+    return series
+
+def _event_record(event):
+    return {
+        'alert': event.alert.rule.name,
+        'state': event.state,
+        'text': event.text,
+        'value': event.alert.value,
+        'timestamp': datetime.fromtimestamp(event.timestamp).isoformat(timespec='seconds'),
+        'host': os.uname().nodename,
+    }
+
+class WebhookSink:
+    """POST пачки событий в виде JSON на локальный адрес."""
+    def __init__(self, url, timeout=5):
+        self.name = f"webhook {url}"
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def send(self, records):
+        r = self.session.post(self.url, json={'alerts': records}, timeout=self.timeout)
+        r.raise_for_status()
+
+class SyslogSink:
+    """Сообщения в syslog (journald принимает их через /dev/log)."""
+    def __init__(self, ident='monitoring'):
+        import syslog
+        self.name = 'syslog'
+        self._syslog = syslog
+        syslog.openlog(ident, 0, syslog.LOG_DAEMON)
+
+    def send(self, records):
+        for record in records:
+            priority = self._syslog.LOG_WARNING if record['state'] == 'firing' else self._syslog.LOG_NOTICE
+            self._syslog.syslog(priority, f"[{record['state']}] {record['text']}")
+
+class ExecSink:
+    """Запуск внешней команды; пачка событий передаётся в stdin как JSON."""
+    def __init__(self, command, timeout=10):
+        self.name = f"exec {command}"
+        self.command = command
+        self.timeout = timeout
+
+    def send(self, records):
+        subprocess.run(self.command, shell=True, input=json.dumps({'alerts': records}, ensure_ascii=False),
+                       text=True, timeout=self.timeout, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+class FileSink:
+    """Дописывает события в файл по одному JSON на строку."""
+    def __init__(self, path):
+        self.name = f"file {path}"
+        self.path = path
+
+    def send(self, records):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records))
+
+class Notifier:
+    """Доставка событий оповещений в приёмники.
+
+    У каждого приёмника своя ограниченная очередь и поток: события собираются
+    в пачки, при ошибке доставка повторяется с экспоненциальной задержкой.
+    publish() никогда не блокирует — при переполнении очереди событие отбрасывается.
+    """
+    def __init__(self, sinks, queue_size=100, batch_size=20, retries=3, backoff=1.0, batch_wait=0.5):
+        self.sinks = list(sinks)
+        self.batch_size = max(1, batch_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_wait = batch_wait
+        self.dropped = 0
+        self.failed = 0
+        self.delivered = 0
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in self.sinks]
+        self._threads = []
+        self._stop = threading.Event()
+
+    def start(self):
+        for sink, q in zip(self.sinks, self._queues):
+            thread = threading.Thread(target=self._loop, args=(sink, q), name=f"notify-{sink.name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        """Пытается доставить накопленное и останавливает потоки."""
+        for q in self._queues:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                self._stop.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Доставка, не уложившаяся в таймаут, прерывается между попытками
+        self._stop.set()
+        self._threads = []
+
+    def publish(self, events):
+        records = [_event_record(event) for event in events]
+        for q in self._queues:
+            for record in records:
+                try:
+                    q.put_nowait(record)
+                except queue.Full:
+                    self.dropped += 1
+
+    def _loop(self, sink, q):
+        stopping = False
+        while not stopping:
+            item = q.get()
+            if item is None:
+                break
+            batch = [item]
+            # Добираем события, пришедшие почти одновременно
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = q.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._deliver(sink, batch)
+
+    def _deliver(self, sink, batch):
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            try:
+                sink.send(batch)
+                self.delivered += len(batch)
+                return
+            except Exception as e:
+                error = e
+            if attempt < self.retries and self._stop.wait(delay):
+                break
+            delay *= 2
+        self.failed += len(batch)
+        report_error('notify', f"Не удалось доставить оповещение ({sink.name}): {str(error)}")
+
+def notification_sinks(notifications_config):
+    sinks = []
+    if notifications_config['webhook_url']:
+        sinks.append(WebhookSink(notifications_config['webhook_url']))
+    if notifications_config['syslog']:
+        sinks.append(SyslogSink())
+    if notifications_config['exec_command']:
+        sinks.append(ExecSink(notifications_config['exec_command']))
+    if notifications_config['file']:
+        sinks.append(FileSink(notifications_config['file']))
+    return sinks
+
+def notifier(notifications_config):
+    """Notifier по настройкам [notifications] или None, если приёмники не заданы."""
+    sinks = notification_sinks(notifications_config)
+    if not sinks:
+        return None
+    return Notifier(sinks, queue_size=notifications_config['queue_size'],
+                    batch_size=notifications_config['batch_size'],
+                    retries=notifications_config['retries'],
+                    backoff=notifications_config['retry_backoff'])
+
+# Уведомление о новых и сброшенных оповещениях
+def notify(events, config_manager, notifier=None):
+    if notifier is not None:
+        notifier.publish(events)
+
+    if not config_manager.get_monitoring_config()['enable_notifications']:
+        return
     
-    if compact:
-        layout.split_column(
-            Layout(name="main"),
-            Layout(name="footer", size=3)
-        )
-        
-        main_content = Group(
-            metric_line("CPU", cpu, width=30),
-            metric_line("Memory", mem.percent, width=30),
-            metric_line("Disk", disk.percent, width=30),
-            Text(f"CPU Temp: {temp}°C" if temp is not None else "CPU Temp: N/A", style="cyan"),
-            Rule(),
-            Panel(
-                Group(
-                    Text("PostgreSQL", style="bold blue", justify="center"),
-                    Text("Status: " + ("OK" if pg_ok else pg_status_text), 
-                         style="bold green" if pg_ok else "bold red",
-                         justify="center")
-                ),
-                border_style="blue",
-                padding=(0, 2)
-            ),
-            Text(f"Connections: {pg_conn_count if pg_conn_count is not None else 'N/A'}", style="bold blue"),
-            Panel(
-                Group(
-                    Text("Application", style="bold green", justify="center"),
-                    Text("Status: " + ("Running" if app_ok else "Stopped"),
-                         style="bold green" if app_ok else "bold red",
-                         justify="center")
-                ),
-                border_style="green",
-                padding=(0, 2)
-            ),
-            Text(f"HTTP Status: {http_code if http_code is not None else 'N/A'}", style="bold green" if http_code == 200 else "bold red")
-        )
-        
-        layout["main"].update(Panel(main_content, title="System Monitor"))
-        
-    else:
-        layout.split_column(
-            Layout(name="header", size=3),
-            Layout(name="main"),
-            Layout(name="footer", size=3)
-        )
-        
-        layout["main"].split_row(
-            Layout(name="left", ratio=2),
-            Layout(name="right", ratio=1)
-        )
-        
-        layout["header"].update(
-            Align.center(Text("SYSTEM & APPLICATION MONITORING", style="bold cyan"))
-        )
-        
-        # Sustained CPU load calculation
-        num_samples = int(alerts_config['cpu_sustained_load_time'] / monitoring_config['update_interval'])
-        if num_samples > len(cpu_hist.data):
-            num_samples = len(cpu_hist.data) # Use all available history if not enough data
-        
-        recent_cpu_history = list(cpu_hist.data)[-num_samples:] if num_samples > 0 else []
-        avg_cpu_sustained = sum(recent_cpu_history) / len(recent_cpu_history) if recent_cpu_history else 0
-            
-        # System metrics
-        cpu_warn = alerts_config['cpu_threshold'] * 0.9
-        cpu_crit = alerts_config['cpu_threshold']
-        mem_warn = alerts_config['memory_threshold'] * 0.9
-        mem_crit = alerts_config['memory_threshold']
-        disk_warn = alerts_config['disk_threshold'] * 0.9
-        disk_crit = alerts_config['disk_threshold']
-        temp_warn = alerts_config['temp_threshold'] * 0.9
-        temp_crit = alerts_config['temp_threshold']
-
-        system_resources_table = Table.grid(expand=True, padding=(0, 1))
-        system_resources_table.add_column(ratio=1)
-        system_resources_table.add_column(width=3, justify="center")
-
-        # CPU
-        system_resources_table.add_row(
-            metric_line("CPU Total", cpu, width=40, warning=cpu_warn, critical=cpu_crit),
-            get_resource_indicator(avg_cpu_sustained, warning=cpu_warn, critical=cpu_crit)
-        )
+    # Движок уже ограничил частоту, поэтому звонок не повторяется на каждом кадре
+    if any(event.state == 'firing' for event in events):
+        console.bell()
+
+def sparkline(data, width=30, height=1, version=None):
+    """Создает спарклайн (мини-график) из данных.
+
+    Точки сводятся к ширине по максимуму корзины, так что короткие пики видны.
+    """
+    if not data or len(data) == 0:
+        return "─" * width
+
+    def build():
+        values = downsample(data, width, 'max')
+        min_val, max_val = data_range(data)
+        line = ''.join(map(SPARK_GLYPHS.__getitem__, scale_levels(values, len(SPARK_GLYPHS), min_val, max_val)))
+        return line.rjust(width)
+
+    return _cached_chart(_chart_key('spark', data, version, width), build)
+
+def bar_chart(data, width=30, height=8, title="", color="blue", scale_to_max=False, version=None):
+    """Создает столбчатую диаграмму с заголовком"""
+    if not data or len(data) == 0:
+        empty_chart = []
+        if title:
+            header = f"─── {title} "
+            header += "─" * (width - len(title) - 4)
+            empty_chart.append(header)
+        empty_chart.extend([" " * width] * height)
+        return Text("\n".join(empty_chart), style=color)
+
+    def build():
+        min_val, max_val = data_range(data)
+        values = downsample(data, width, 'max')
+
+        # Если scale_to_max=False, используем фиксированный диапазон 0-100 для процентов
+        if not scale_to_max and max_val <= 100:
+            max_val = 100
+            min_val = 0
+
+        # Столбцы берутся из таблицы готовых строк и транспонируются в строки графика
+        columns = _column_glyphs(height, "▀")
+        cells = [columns[level] for level in scale_levels(values, height, min_val, max_val)]
+        cells += [' ' * height] * (width - len(cells))
+        chart = [''.join(row) for row in zip(*cells)]
+
+        # Добавляем заголовок
+        if title:
+            current = values[-1]
+            header = f"─── {title} [{current:.1f}] "
+            header += "─" * (width - len(title) - len(f" [{current:.1f}]") - 4)
+            chart.insert(0, header)
+        return "\n".join(chart)
+
+    return Text(_cached_chart(_chart_key('bar', data, version, width, height, title, scale_to_max), build), style=color)
+
+def format_duration(seconds):
+    """Короткая запись длительности: 90 -> '1мин', 7200 -> '2ч'."""
+    if seconds >= 86400:
+        return f"{seconds / 86400:g}д"
+    if seconds >= 3600:
+        return f"{seconds / 3600:g}ч"
+    if seconds >= 60:
+        return f"{seconds / 60:g}мин"
+    return f"{seconds:g}с"
+
+def get_load_color(value, warning=70, critical=90):
+    """Возвращает цвет в зависимости от нагрузки"""
+    if value >= critical:
+        return "red"
+    elif value >= warning:
+        return "yellow"
+    return "green"
+
+def get_load_style(value, warning=70, critical=90):
+    """Возвращает стиль для отображения нагрузки"""
+    return f"bold {get_load_color(value, warning, critical)}"
+
+def get_resource_indicator(value, warning=70, critical=90):
+    """Возвращает цветной индикатор ⬤ в зависимости от нагрузки."""
+    if value >= critical:
+        return Text("⬤", style="bold red")
+    elif value >= warning:
+        return Text("⬤", style="bold yellow")
+    return Text("⬤", style="bold green")
+
+def load_bar(value, width=50, warning=70, critical=90):
+    """Создает индикатор нагрузки в стиле htop"""
+    filled_width = int(value * width / 100)
+    empty_width = width - filled_width
+    
+    # Создаем сегменты разных цветов
+    segments = []
+    if filled_width > 0:
+        color = get_load_color(value, warning, critical)
+        segments.append(Text("█" * filled_width, style=f"bold {color}"))
+    if empty_width > 0:
+        segments.append(Text("░" * empty_width, style="dim"))
+    
+    # Добавляем процент
+    bar = Text().join(segments)
+    return Group(
+        bar,
+        Text(f"{value:>5.1f}%", style=get_load_style(value, warning, critical))
+    )
+
+def metric_line(label, value, max_value=100, width=50, warning=70, critical=90, unit=""):
+    """Создает строку с меткой и индикатором нагрузки"""
+    value_pct = (value / max_value * 100) if max_value > 0 else 0
+    return Group(
+        Text(f"{label:<15}", style="bold blue"),
+        load_bar(value_pct, width, warning, critical),
+        Text(f" {value}{unit}", style="dim")
+    )
+
+def _probe_value(snapshot, name, default=None):
+    result = snapshot.get(name)
+    if result is None or result.error is not None:
+        return default
+    return result.value
+
+class CachedRegion:
+    """Участок экрана: перестраивается только при смене ключа данных, готовые строки переиспользуются."""
+    def __init__(self, build):
+        self.build = build
+        self.key = object()
+        self.renderable = Text("")
+        self._lines = {}
+        self.rebuilds = 0
+
+    def update(self, key, *args):
+        if key == self.key:
+            return False
+        self.key = key
+        self.renderable = self.build(*args)
+        self._lines = {}
+        self.rebuilds += 1
+        return True
+
+    def __rich_console__(self, console, options):
+        size = (options.max_width, options.height)
+        lines = self._lines.get(size)
+        if lines is None:
+            lines = console.render_lines(self.renderable, options, pad=False)
+            self._lines[size] = lines
+        new_line = Segment.line()
+        for line in lines:
+            yield from line
+            yield new_line
+
+class CpuHeatmap:
+    """Плотная сетка загрузки ядер: один символ на ядро, ширина подстраивается под панель."""
+    GLYPHS = "▁▂▃▄▅▆▇█"
+
+    def __init__(self, per_cpu, warning=70, critical=90):
+        self.per_cpu = per_cpu
+        self.warning = warning
+        self.critical = critical
+
+    def __rich_console__(self, console, options):
+        label_width = len(f"  CPU {len(self.per_cpu) - 1}-{len(self.per_cpu) - 1} ")
+        columns = max(8, options.max_width - label_width)
+        columns -= columns % 8
+        cells = [Text(self.GLYPHS[min(int(p / 100 * len(self.GLYPHS)), len(self.GLYPHS) - 1)],
+                      style=get_load_color(p, self.warning, self.critical)) for p in self.per_cpu]
+        for start in range(0, len(cells), columns):
+            end = min(start + columns, len(cells))
+            yield Text.assemble(Text(f"  CPU {start}-{end - 1}".ljust(label_width), style="dim"), *cells[start:end])
+
+HEATMAP_MIN_CORES = 16
+
+def _cpu_block(cpu, per_cpu, avg_cpu_sustained, warning, critical):
+    table = Table.grid(expand=True, padding=(0, 1))
+    table.add_column(ratio=1)
+    table.add_column(width=3, justify="center")
+    table.add_row(
+        metric_line("CPU Total", cpu, width=40, warning=warning, critical=critical),
+        get_resource_indicator(avg_cpu_sustained, warning=warning, critical=critical)
+    )
+    if len(per_cpu) >= HEATMAP_MIN_CORES:
+        # На многоядерных машинах отдельные полосы заняли бы весь экран
+        table.add_row(CpuHeatmap(per_cpu, warning, critical))
+    else:
         for i, perc in enumerate(per_cpu):
-            system_resources_table.add_row(
-                metric_line(f"  CPU {i}", perc, width=38, warning=cpu_warn, critical=cpu_crit)
+            table.add_row(metric_line(f"  CPU {i}", perc, width=38, warning=warning, critical=critical))
+    return table
+
+def _disk_lines(disks):
+    """Строки по точкам монтирования (заполнение, прогноз) и устройствам (скорость, IOPS, задержка)."""
+    lines = []
+    for d in disks['mounts']:
+        forecast = f", заполнится через {format_duration(round(d['seconds_to_full']))}" if d['seconds_to_full'] else ""
+        lines.append(Text.assemble(
+            Text(f"  {d['mount']:<20} ", style="dim"),
+            Text(f"{d['percent']:5.1f}%", style=get_load_color(d['percent'])),
+            Text(f"  {format_bytes(d['used'])} / {format_bytes(d['total'])}{forecast}", style="dim"),
+            overflow="ellipsis", no_wrap=True))
+    for name, disk_io in sorted(disks['devices'].items()):
+        lines.append(Text(
+            f"  {name:<20} R {format_bytes(disk_io['read_bps'])}/с  W {format_bytes(disk_io['write_bps'])}/с  "
+            f"{disk_io['read_iops'] + disk_io['write_iops']:.0f} IOPS  {disk_io['latency_ms']:.1f} мс",
+            style="dim", overflow="ellipsis", no_wrap=True))
+    return lines
+
+def _resources_block(mem, disk, temps, alerts_config, disks=None):
+    mem_percent = mem.percent if mem is not None else 0.0
+    disk_percent = disk.percent if disk is not None else 0.0
+    temp = temps['main']
+    mem_warn, mem_crit = alerts_config['memory_threshold'] * 0.9, alerts_config['memory_threshold']
+    disk_warn, disk_crit = alerts_config['disk_threshold'] * 0.9, alerts_config['disk_threshold']
+    temp_warn, temp_crit = alerts_config['temp_threshold'] * 0.9, alerts_config['temp_threshold']
+
+    table = Table.grid(expand=True, padding=(0, 1))
+    table.add_column(ratio=1)
+    table.add_column(width=3, justify="center")
+
+    # Memory
+    table.add_row(
+        metric_line("Memory", mem_percent, width=40, warning=mem_warn, critical=mem_crit),
+        get_resource_indicator(mem_percent, warning=mem_warn, critical=mem_crit)
+    )
+    table.add_row(
+        Text(f"  Used: {mem.used // (1024*1024)} MB / {mem.total // (1024*1024)} MB" if mem is not None else "  Used: N/A", style="dim")
+    )
+    table.add_row(Rule())
+
+    # Disk
+    table.add_row(
+        metric_line("Disk", disk_percent, width=40, warning=disk_warn, critical=disk_crit),
+        get_resource_indicator(disk_percent, warning=disk_warn, critical=disk_crit)
+    )
+    table.add_row(
+        Text(f"  Used: {disk.used // (1024*1024*1024)} GB / {disk.total // (1024*1024*1024)} GB" if disk is not None else "  Used: N/A", style="dim")
+    )
+    if disks is not None:
+        for line in _disk_lines(disks):
+            table.add_row(line)
+    table.add_row(Rule())
+
+    # Temperature
+    if temp is not None:
+        table.add_row(
+            metric_line("CPU Temp", temp, max_value=100, width=40, unit="°C", warning=temp_warn, critical=temp_crit),
+            get_resource_indicator(temp, warning=temp_warn, critical=temp_crit)
+        )
+        per_sensor = list(temps['packages'].items()) + list(temps['cores'].items())
+        if len(per_sensor) > 1:
+            table.add_row(
+                Text("  " + "  ".join(f"{label}: {value:.0f}°C" for label, value in per_sensor),
+                     style="dim", overflow="fold")
             )
-        system_resources_table.add_row(Rule())
+    else:
+        table.add_row(Text("CPU Temp: N/A", style="cyan"))
+    return table
+
+def _net_block(nics, tcp, ports):
+    if nics is None:
+        return Group()
+    lines = [Rule(), Text("Network", style="bold cyan")]
+    for name, n in sorted(nics.items()):
+        problems = n['errors'] + n['drops']
+        lines.append(Text.assemble(
+            Text(f"  {name:<12}", style="bold blue"),
+            Text(f"↓ {format_bytes(n['rx_bps'])}/с  ↑ {format_bytes(n['tx_bps'])}/с  "
+                 f"{n['rx_pps'] + n['tx_pps']:.0f} пак/с  "),
+            Text(f"ошибки {n['errors']:.0f}/с  потери {n['drops']:.0f}/с", style="bold red" if problems else "dim"),
+            overflow="ellipsis", no_wrap=True))
+    order = sorted(tcp.items(), key=lambda item: -item[1])
+    lines.append(Text("  TCP: " + ", ".join(f"{state} {n}" for state, n in order), style="dim", overflow="fold"))
+    for port, counts in ports:
+        summary = ", ".join(f"{state} {n}" for state, n in sorted(counts, key=lambda item: -item[1])) or "нет соединений"
+        lines.append(Text(f"  :{port}  {summary}", style="dim", overflow="fold"))
+    return Group(*lines)
+
+def _trends_block(window, lines):
+    if lines is None:
+        return Group()
+    return Group(
+        Rule(),
+        Text(f"Тренд за {format_duration(window)}", style="bold cyan"),
+        *(Text.assemble(Text(f"{label:<15}", style="bold blue"), Text(line, style="cyan")) for label, line in lines)
+    )
+
+def _pg_workload_lines(workload):
+    """Строки нагрузки PostgreSQL: транзакции, кэш, блокировки, репликация, тяжёлые запросы."""
+    if not workload or 'error' in workload:
+        return []
+    lines = []
+    if 'tps' in workload:
+        cache_hit = f"{workload['cache_hit']:.1f}%" if workload['cache_hit'] is not None else "N/A"
+        lines.append(Text(f"TPS: {workload['tps']:.1f}  (rollback {workload['rollback_rate']:.1f}/с)  Cache hit: {cache_hit}",
+                          style="blue"))
+        if workload['deadlock_rate'] or workload['temp_bytes_rate']:
+            lines.append(Text(f"Deadlocks: {workload['deadlock_rate']:.2f}/с  Temp: {format_bytes(workload['temp_bytes_rate'])}/с",
+                              style="yellow"))
+    lines.append(Text(f"Lock waits: {workload['lock_waits']}"
+                      + (f" (дольше всех {format_duration(round(workload['longest_lock_wait']))})" if workload['lock_waits'] else ""),
+                      style="yellow" if workload['lock_waits'] else "blue"))
+    for name, state, lag_bytes, lag in workload.get('replicas', ()):
+        lines.append(Text(f"Replica {name} ({state}): {format_bytes(lag_bytes)}, {lag:.1f} сек.",
+                          style="dim", overflow="ellipsis", no_wrap=True))
+    if workload.get('standby_lag') is not None:
+        lines.append(Text(f"Standby replay lag: {workload['standby_lag']:.1f} сек.", style="dim"))
+    checkpoints = workload.get('checkpoints')
+    if checkpoints:
+        lines.append(Text(f"Checkpoints/ч: {checkpoints['timed_rate'] * 3600:.1f} по времени, "
+                          f"{checkpoints['requested_rate'] * 3600:.1f} по запросу", style="dim"))
+    statements = workload.get('statements')
+    if statements:
+        lines.append(Text("Top queries (нагрузка, вызовов/с, среднее):", style="dim"))
+        for st in statements:
+            lines.append(Text(f"  {st['load']:5.2f} {st['calls_rate']:7.1f} {st['mean_ms']:8.1f} мс  {st['query']}",
+                              style="dim", overflow="ellipsis", no_wrap=True))
+    for name, dead, ratio in workload.get('dead_tuples', ())[:3]:
+        ratio = f" ({ratio * 100:.0f}%)" if ratio is not None else ""
+        lines.append(Text(f"Dead tuples {name}: {dead}{ratio}", style="dim", overflow="ellipsis", no_wrap=True))
+    return lines
 
-        # Memory
-        system_resources_table.add_row(
-            metric_line("Memory", mem.percent, width=40, warning=mem_warn, critical=mem_crit),
-            get_resource_indicator(mem.percent, warning=mem_warn, critical=mem_crit)
+def _pg_block(pg_ok, pg_status_text, pg_conn_count, pg_long_queries, pg_size, workload=None):
+    pg_status_table = Table.grid(expand=True)
+    pg_status_table.add_column(justify="center")
+    pg_status_table.add_row(Text("PostgreSQL", style="bold cyan", justify="center"))
+    pg_status_table.add_row(Text("━━━━━━━━━", style="blue", justify="center"))
+    pg_status_table.add_row("")
+
+    pg_status_table.add_row(Text("Connection", style="dim", justify="center"))
+    pg_status_table.add_row("")
+    if pg_ok:
+        pg_status_table.add_row(
+            Text.assemble(Text("⬤  ", style="bold green"), Text("✓ OK ✓", style="bold green"))
         )
-        system_resources_table.add_row(
-            Text(f"  Used: {mem.used // (1024*1024)} MB / {mem.total // (1024*1024)} MB", style="dim")
+    else:
+        pg_status_table.add_row(
+            Text.assemble(
+                Text("⬤  ", style="bold red"),
+                Text(f"✗ {pg_status_text} ✗", style="bold red", overflow="fold")
+            )
         )
-        system_resources_table.add_row(Rule())
 
-        # Disk
-        system_resources_table.add_row(
-            metric_line("Disk", disk.percent, width=40, warning=disk_warn, critical=disk_crit),
-            get_resource_indicator(disk.percent, warning=disk_warn, critical=disk_crit)
-        )
-        system_resources_table.add_row(
-            Text(f"  Used: {disk.used // (1024*1024*1024)} GB / {disk.total // (1024*1024*1024)} GB", style="dim")
+    return Group(
+        Panel(
+            pg_status_table,
+            border_style="blue",
+            padding=(1, 4),
+            width=50
+        ),
+        Text(""),  # Пустая строка для отступа
+        Group(
+            Text(f"Active Connections: {pg_conn_count if pg_conn_count is not None else 'N/A'}", style="bold blue"),
+            Text(f"Long Queries: {pg_long_queries if pg_long_queries is not None else 'N/A'}",
+                 style="yellow" if pg_long_queries and pg_long_queries > 0 else "blue"),
+            Text(f"DB Size: {pg_size}", style="dim"),
+            *_pg_workload_lines(workload)
         )
-        system_resources_table.add_row(Rule())
+    )
 
-        # Temperature
-        if temp is not None:
-            system_resources_table.add_row(
-                metric_line("CPU Temp", temp, max_value=100, width=40, unit="°C", warning=temp_warn, critical=temp_crit),
-                get_resource_indicator(temp, warning=temp_warn, critical=temp_crit)
-            )
-        else:
-            system_resources_table.add_row(Text("CPU Temp: N/A", style="cyan"))
+def _cgroup_lines(c):
+    """Строки ресурсов cgroup unit'а: CPU и троттлинг, память, PID, давление PSI, OOM kill."""
+    memory = format_bytes(c['memory']) if c['memory'] is not None else 'N/A'
+    if c['memory_max'] is not None:
+        memory += f" / {format_bytes(c['memory_max'])}"
+    throttled = f" (throttled {c['throttled_percent']:.0f}%)" if c['throttled_percent'] else ""
+    lines = [Text(f"CPU {c['cpu_percent']:.1f}%{throttled}  Mem {memory}  PIDs {c['pids'] if c['pids'] is not None else 'N/A'}",
+                  style="yellow" if throttled else "dim", overflow="ellipsis", no_wrap=True)]
+    pressure = "  ".join(f"{resource} {p['some'][0]:.1f}%" for resource, p in c['pressure'].items() if 'some' in p)
+    if pressure:
+        lines.append(Text(f"PSI {pressure}", style="dim", overflow="ellipsis", no_wrap=True))
+    if c['oom_kills']:
+        lines.append(Text(f"OOM kills: {c['oom_kills']}", style="bold red"))
+    return lines
 
+def _app_block(app_ok, other_units, http_code, http_latency, other_endpoints, service_name=None, cgroups=None):
+    app_status_table = Table.grid(expand=True)
+    app_status_table.add_column(justify="center")
+    app_status_table.add_row(Text("Application", style="bold cyan", justify="center"))
+    app_status_table.add_row(Text("━━━━━━━━━", style="green", justify="center"))
+    app_status_table.add_row("")
 
-        system_content = Group(
-            Text("System Resources", style="bold cyan"),
-            Rule(),
-            system_resources_table
+    # Service status
+    app_status_table.add_row(Text("Service (systemd)", style="dim", justify="center"))
+    app_status_table.add_row("")
+    if app_ok:
+        app_status_table.add_row(
+            Text.assemble(Text("⬤  ", style="bold green"), Text("✓ RUNNING ✓", style="bold green"))
         )
-            
-        # Services status
-        pg_status_table = Table.grid(expand=True)
-        pg_status_table.add_column(justify="center")
-        pg_status_table.add_row(Text("PostgreSQL", style="bold cyan", justify="center"))
-        pg_status_table.add_row(Text("━━━━━━━━━", style="blue", justify="center"))
-        pg_status_table.add_row("")
-
-        pg_status_table.add_row(Text("Connection", style="dim", justify="center"))
-        pg_status_table.add_row("")
-        if pg_ok:
-            pg_status_table.add_row(
-                Text.assemble(Text("⬤  ", style="bold green"), Text("✓ OK ✓", style="bold green"))
-            )
-        else:
-            pg_status_table.add_row(
-                Text.assemble(
-                    Text("⬤  ", style="bold red"),
-                    Text(f"✗ {pg_status_text} ✗", style="bold red", overflow="fold")
-                )
-            )
-
-        app_status_table = Table.grid(expand=True)
-        app_status_table.add_column(justify="center")
-        app_status_table.add_row(Text("Application", style="bold cyan", justify="center"))
-        app_status_table.add_row(Text("━━━━━━━━━", style="green", justify="center"))
-        app_status_table.add_row("")
+    else:
+        app_status_table.add_row(
+            Text.assemble(Text("⬤  ", style="bold red"), Text("✗ STOPPED ✗", style="bold red"))
+        )
+    cgroups = cgroups or {}
+    for line in _cgroup_lines(cgroups[service_name]) if service_name in cgroups else ():
+        app_status_table.add_row(line)
 
-        # Service status
-        app_status_table.add_row(Text("Service (systemd)", style="dim", justify="center"))
+    if other_units:
         app_status_table.add_row("")
-        if app_ok:
-            app_status_table.add_row(
-                Text.assemble(Text("⬤  ", style="bold green"), Text("✓ RUNNING ✓", style="bold green"))
-            )
-        else:
+        for unit, state in other_units:
+            color = "green" if state == 'active' else "red"
             app_status_table.add_row(
-                Text.assemble(Text("⬤  ", style="bold red"), Text("✗ STOPPED ✗", style="bold red"))
+                Text.assemble(Text("⬤ ", style=f"bold {color}"), Text(f"{unit}: {state}", style=color))
             )
-        
-        app_status_table.add_row("") # Spacer
-        app_status_table.add_row(Text("· · ·", style="dim green", justify="center"))
-        app_status_table.add_row("") # Spacer
+            for line in _cgroup_lines(cgroups[unit]) if unit in cgroups else ():
+                app_status_table.add_row(line)
 
-        # HTTP status
-        app_status_table.add_row(Text("Endpoint (HTTP)", style="dim", justify="center"))
-        app_status_table.add_row("")
-        if http_code == 200:
-            status_text = '200 OK'
-            app_status_table.add_row(
-                Text.assemble(
-                    Text("⬤  ", style="bold green"), 
-                    Text(f"✓ {status_text} ✓", style="bold green")
-                )
+    app_status_table.add_row("") # Spacer
+    app_status_table.add_row(Text("· · ·", style="dim green", justify="center"))
+    app_status_table.add_row("") # Spacer
+
+    # HTTP status
+    app_status_table.add_row(Text("Endpoint (HTTP)", style="dim", justify="center"))
+    app_status_table.add_row("")
+    if http_code == 200:
+        status_text = '200 OK'
+        app_status_table.add_row(
+            Text.assemble(
+                Text("⬤  ", style="bold green"),
+                Text(f"✓ {status_text} ✓", style="bold green")
             )
-        else:
-            status_text = 'N/A' if http_code is None or http_code == 0 else str(http_code)
-            app_status_table.add_row(
-                Text.assemble(
-                    Text("⬤  ", style="bold red"), 
-                    Text(f"✗ {status_text} ✗", style="bold red")
-                )
+        )
+    else:
+        status_text = 'N/A' if http_code is None or http_code == 0 else str(http_code)
+        app_status_table.add_row(
+            Text.assemble(
+                Text("⬤  ", style="bold red"),
+                Text(f"✗ {status_text} ✗", style="bold red")
             )
+        )
+    if http_latency:
+        app_status_table.add_row(Text(http_latency, style="dim", justify="center"))
+    for url, status, latency in other_endpoints:
+        color = "green" if status == 200 else "red"
+        app_status_table.add_row(
+            Text.assemble(Text("⬤ ", style=f"bold {color}"), Text(f"{url}: {status or 'N/A'}", style=color),
+                          overflow="fold")
+        )
+        if latency:
+            app_status_table.add_row(Text(latency, style="dim", justify="center"))
+
+    return Panel(
+        app_status_table,
+        border_style="green",
+        padding=(1, 4),
+        width=50
+    )
+
+def format_bytes(value):
+    """Короткая запись объёма: 1536 -> '1.5K'."""
+    for unit in ('B', 'K', 'M', 'G', 'T'):
+        if abs(value) < 1024 or unit == 'T':
+            return f"{value:.0f}{unit}" if unit == 'B' else f"{value:.1f}{unit}"
+        value /= 1024
+
+def _process_block(rows, count, service_total, postgres_total, service_name):
+    table = Table(box=box.SIMPLE_HEAD, expand=True, padding=(0, 1),
+                  title=f"Процессы: {count}", title_style="bold cyan")
+    table.add_column("PID", justify="right", style="dim")
+    table.add_column("Имя", ratio=1, overflow="ellipsis", no_wrap=True)
+    table.add_column("CPU", justify="right")
+    table.add_column("RSS", justify="right")
+    table.add_column("IO/с", justify="right")
+    for r in rows:
+        table.add_row(str(r.pid), r.name, Text(f"{r.cpu:.1f}%", style=get_load_color(r.cpu)),
+                      format_bytes(r.rss), format_bytes(r.io))
+    totals = []
+    for label, total in ((service_name, service_total), ("postgres", postgres_total)):
+        if total['count']:
+            totals.append(f"{label}: {total['count']} проц., CPU {total['cpu']:.1f}%, "
+                          f"RSS {format_bytes(total['rss'])}, IO {format_bytes(total['io'])}/с")
+    return Group(table, Text("  ·  ".join(totals), style="dim")) if totals else table
+
+def _health_block(health, rss_trend, cpu_trend, detailed=True):
+    table = Table(box=box.SIMPLE_HEAD, expand=True, padding=(0, 1),
+                  title="Затраты монитора", title_style="bold cyan")
+    table.add_column("Сборщик", ratio=1, overflow="ellipsis", no_wrap=True)
+    table.add_column("Вызовов", justify="right")
+    table.add_column("Посл., мс", justify="right")
+    table.add_column("p95, мс", justify="right")
+    table.add_column("CPU, мс", justify="right")
+    table.add_column("Пропущено", justify="right")
+    for name, p in sorted(health['probes'].items()):
+        table.add_row(name, str(p['calls']),
+                      f"{p['wall_ms']:.1f}" if p['wall_ms'] is not None else "N/A",
+                      f"{p['wall_p95_ms']:.1f}" if p['wall_p95_ms'] is not None else "N/A",
+                      f"{p['cpu_ms']:.1f}" if p['cpu_ms'] is not None else "N/A",
+                      Text(str(p['missed']), style="yellow" if p['missed'] else "dim"))
+    frames, gc_stats = health['frames'], health['gc']
+    build = f"{frames['build_p95_ms']:.1f}" if frames['build_p95_ms'] is not None else "N/A"
+    draw = f"{frames['draw_p95_ms']:.1f}" if frames['draw_p95_ms'] is not None else "N/A"
+    lines = [
+        Text(f"Кадр p95: построение {build} мс, вывод {draw} мс; пропущено тактов: {frames['missed']}",
+             style="yellow" if frames['missed'] else "dim"),
+        Text.assemble(Text(f"Процесс: RSS {format_bytes(health['rss'])}, CPU {health['cpu_percent']:.1f}%, "
+                           f"потоков {health['threads']}  ", style="dim"), (rss_trend, "cyan"), " ", (cpu_trend, "magenta")),
+        Text(f"GC: сборок {'/'.join(map(str, gc_stats['collections']))}, пауза p95 {gc_stats['pause_p95_ms']:.2f} мс, "
+             f"макс. {gc_stats['pause_max_ms']:.2f} мс, всего {gc_stats['pause_total'] * 1000:.0f} мс", style="dim"),
+    ]
+    if health['profile']:
+        lines.append(Text(health['profile'], style="cyan", overflow="ellipsis", no_wrap=True))
+    if detailed:
+        return Group(table, *lines)
+    # На невысоком экране вместо таблицы — самый дорогой сборщик и сумма пропусков
+    timed = [(p['wall_p95_ms'], name) for name, p in health['probes'].items() if p['wall_p95_ms'] is not None]
+    missed = sum(p['missed'] for p in health['probes'].values())
+    slowest = "медленнее всех {1}: p95 {0:.1f} мс".format(*max(timed)) if timed else "нет замеров"
+    summary = Text(f"Затраты монитора: сборщиков {len(health['probes'])}, {slowest}, пропущено опросов: {missed}",
+                   style="yellow" if missed else "bold cyan", overflow="ellipsis", no_wrap=True)
+    return Group(summary, *lines)
 
-        services_content = Group(
-            Text("Services Status", style="bold magenta"),
-            Rule(style="magenta"),
-            Panel(
-                pg_status_table,
-                border_style="blue",
-                padding=(1, 4),
-                width=50
+def _compact_block(cpu, mem_percent, disk_percent, temp, pg_ok, pg_status_text, pg_conn_count, app_ok, http_code):
+    return Panel(Group(
+        metric_line("CPU", cpu, width=30),
+        metric_line("Memory", mem_percent, width=30),
+        metric_line("Disk", disk_percent, width=30),
+        Text(f"CPU Temp: {temp}°C" if temp is not None else "CPU Temp: N/A", style="cyan"),
+        Rule(),
+        Panel(
+            Group(
+                Text("PostgreSQL", style="bold blue", justify="center"),
+                Text("Status: " + ("OK" if pg_ok else pg_status_text),
+                     style="bold green" if pg_ok else "bold red",
+                     justify="center")
             ),
-            Text(""),  # Пустая строка для отступа
+            border_style="blue",
+            padding=(0, 2)
+        ),
+        Text(f"Connections: {pg_conn_count if pg_conn_count is not None else 'N/A'}", style="bold blue"),
+        Panel(
             Group(
-                Text(f"Active Connections: {pg_conn_count if pg_conn_count is not None else 'N/A'}", style="bold blue"),
-                Text(f"Long Queries: {pg_long_queries if pg_long_queries is not None else 'N/A'}", 
-                     style="yellow" if pg_long_queries and pg_long_queries > 0 else "blue"),
-                Text(f"DB Size: {pg_size}", style="dim")
+                Text("Application", style="bold green", justify="center"),
+                Text("Status: " + ("Running" if app_ok else "Stopped"),
+                     style="bold green" if app_ok else "bold red",
+                     justify="center")
             ),
-            Rule(style="magenta"),
-            Panel(
-                app_status_table,
-                border_style="green",
-                padding=(1, 4),
-                width=50
-            )
-        )
-
-        layout["left"].update(Panel(system_content, border_style="cyan"))
-        layout["right"].update(Panel(services_content, border_style="magenta"))
-    
-    # Footer
-    active_alerts = get_footer_alerts(
-        cpu, mem.percent, disk.percent, temp,
-        pg_ok, app_ok, http_code,
-        alerts_config, avg_cpu_sustained
-    )
+            border_style="green",
+            padding=(0, 2)
+        ),
+        Text(f"HTTP Status: {http_code if http_code is not None else 'N/A'}", style="bold green" if http_code == 200 else "bold red")
+    ), title="System Monitor")
 
+def _footer_block(active_alerts, update_interval):
     if active_alerts:
         alert_texts = [Text(a, style="bold red") for a in active_alerts]
         separator = Text(" | ", style="bold red")
-        footer_renderable = separator.join(alert_texts)
-    else:
-        footer_text = f"Ctrl+C для выхода. Обновление раз в {monitoring_config['update_interval']} сек."
-        footer_renderable = Text(footer_text, style="bold cyan")
+        return Align.center(separator.join(alert_texts))
+    footer_text = f"Ctrl+C для выхода. Обновление раз в {update_interval} сек."
+    return Align.center(Text(footer_text, style="bold cyan"))
 
-    layout["footer"].update(Align.center(footer_renderable))
-    
-    return layout
-
-def get_footer_alerts(cpu, mem, disk, temp, pg_ok, app_ok, http_code, alerts_config, avg_cpu_sustained):
-    """Возвращает список текущих проблем для футера."""
-    alerts = []
-    if avg_cpu_sustained > alerts_config['cpu_threshold']:
-        alerts.append(f"ДЛИТЕЛЬНАЯ НАГРУЗКА CPU: {avg_cpu_sustained:.0f}%")
-    if mem > alerts_config['memory_threshold']:
-        alerts.append(f"MEM Высокая нагрузка: {mem:.0f}%")
-    if disk > alerts_config['disk_threshold']:
-        alerts.append(f"DISK Мало места: {disk:.0f}%")
-    if temp is not None and temp > alerts_config['temp_threshold']:
-        alerts.append(f"CPU Температура: {temp:.0f}°C")
-    if not pg_ok:
-        alerts.append("POSTGRESQL НЕДОСТУПЕН")
-    if not app_ok:
-        alerts.append("СЕРВИС ПРИЛОЖЕНИЯ ОСТАНОВЛЕН")
-    if http_code != 200:
-        alerts.append(f"ОШИБКА HTTP: {http_code or 'N/A'}")
-    return alerts
+class Dashboard:
+    """Постоянное дерево виджетов экрана мониторинга.
+
+    Разметка и панели создаются один раз; на каждом кадре обновляются
+    только участки, чьи данные изменились, остальные отдают готовые строки.
+    """
+    def __init__(self, config_manager):
+        self.config_manager = config_manager
+        self.mode = None
+        self.layout = None
+        self.regions = {
+            'compact': CachedRegion(_compact_block),
+            'cpu': CachedRegion(_cpu_block),
+            'resources': CachedRegion(_resources_block),
+            'net': CachedRegion(_net_block),
+            'trends': CachedRegion(_trends_block),
+            'pg': CachedRegion(_pg_block),
+            'app': CachedRegion(_app_block),
+            'procs': CachedRegion(_process_block),
+            'health': CachedRegion(_health_block),
+            'footer': CachedRegion(_footer_block),
+        }
+
+    # Строк, которые оставляются основным панелям, прежде чем отдавать место панели затрат монитора
+    MAIN_MIN_ROWS = 30
+    # Свёрнутая панель затрат: три строки сводки, строка профилирования и рамка
+    HEALTH_SUMMARY_ROWS = 7
+    # Сколько секунд ошибка фонового потока остаётся в футере
+    ERRORS_SHOWN_FOR = 60
+
+    def _health_size(self, term_height, top_processes, health_rows):
+        """Высота панели затрат: полная таблица, если помещается, иначе сводка или ничего."""
+        if not health_rows:
+            return 0
+        spare = term_height - 6 - (top_processes + 7 if top_processes > 0 else 0) - self.MAIN_MIN_ROWS
+        if spare >= health_rows + 11:
+            return health_rows + 11
+        return self.HEALTH_SUMMARY_ROWS if spare >= self.HEALTH_SUMMARY_ROWS else 0
+
+    def _build_layout(self, mode, top_processes=0, health_size=0):
+        regions = self.regions
+        layout = Layout()
+        if mode == 'compact':
+            layout.split_column(
+                Layout(regions['compact'], name="main"),
+                Layout(regions['footer'], name="footer", size=3)
+            )
+            return layout
+
+        layout.split_column(
+            Layout(Align.center(Text("SYSTEM & APPLICATION MONITORING", style="bold cyan")), name="header", size=3),
+            Layout(name="main"),
+            Layout(Panel(regions['procs'], border_style="cyan"), name="procs", size=top_processes + 7,
+                   visible=mode == 'full' and top_processes > 0),
+            Layout(Panel(regions['health'], border_style="cyan"), name="health", size=health_size or 1,
+                   visible=mode == 'full' and health_size > 0),
+            Layout(regions['footer'], name="footer", size=3)
+        )
+        layout["main"].split_row(
+            Layout(Panel(Group(
+                Text("System Resources", style="bold cyan"),
+                Rule(),
+                regions['cpu'],
+                Rule(),
+                regions['resources'],
+                regions['net'],
+                regions['trends']
+            ), border_style="cyan"), name="left", ratio=2),
+            Layout(Panel(Group(
+                Text("Services Status", style="bold magenta"),
+                Rule(style="magenta"),
+                regions['pg'],
+                Rule(style="magenta"),
+                regions['app']
+            ), border_style="magenta"), name="right", ratio=1)
+        )
+        return layout
+
+    def render(self, snapshot, alerts=()):
+        """Обновляет дерево из снимка состояния сборщиков, не опрашивая систему.
+
+        alerts — сработавшие оповещения (AlertEngine.firing()) для футера.
+        """
+        term_width, term_height = console.size
+        minimal = term_width < 120 or term_height < 35
+        compact = term_width < 80 or term_height < 25
+        config_manager = self.config_manager
+        config_version = config_manager.version
+        monitoring_config = config_manager.get_monitoring_config()
+        top_processes = monitoring_config['top_processes']
+        mode = 'compact' if compact else 'minimal' if minimal else 'full'
+        health = _probe_value(snapshot, 'monitor') if monitoring_config['show_health'] else None
+        health_rows = len(health['probes']) if health is not None else 0
+        health_size = self._health_size(term_height, top_processes, health_rows)
+        if (mode, top_processes, health_size) != self.mode:
+            self.mode = (mode, top_processes, health_size)
+            self.layout = self._build_layout(mode, top_processes, health_size)
+
+        alerts_config = config_manager.get_alerts_config()
+        collectors_config = config_manager.get_collectors_config()
+        regions = self.regions
+
+        # Сборщики без свежих данных: ещё не ответили или устарели
+        stale = [name for name, r in snapshot.items() if r.stale]
+
+        # CPU / Memory / Disk
+        system = _probe_value(snapshot, 'system')
+        if system is not None:
+            cpu = system['cpu']
+            per_cpu = system['per_cpu']
+            mem = system['mem']
+            disk = system['disk']
+        else:
+            cpu, per_cpu = 0.0, []
+            mem = disk = None
+        mem_percent = mem.percent if mem is not None else 0.0
+        disk_percent = disk.percent if disk is not None else 0.0
+
+        # Temperature
+        temps = _probe_value(snapshot, 'temp', {'main': None, 'packages': {}, 'cores': {}, 'other': {}})
+        temp = temps['main']
+
+        # PostgreSQL
+        pg = _probe_value(snapshot, 'postgresql', (False, 'нет данных', None, None, 'N/A'))
+        pg_ok, pg_status_text, pg_conn_count, pg_long_queries, pg_size = pg
+
+        # App status
+        app_config = config_manager.get_application_config()
+        unit_states = _probe_value(snapshot, 'service', {})
+        app_ok = unit_states.get(app_config['service_name']) == 'active'
+        other_units = tuple((u, unit_states.get(u, 'unknown')) for u in app_config['services'] if u != app_config['service_name'])
+        endpoint_results = _probe_value(snapshot, 'http', {})
+        http_result = endpoint_results.get(app_config['url'], {})
+        http_code = http_result.get('status')
+        http_latency = format_latency(http_result) if http_result.get('p50') is not None else None
+        other_endpoints = tuple(
+            (url, r['status'], format_latency(r) if r.get('p50') is not None else None)
+            for url, r in endpoint_results.items() if url != app_config['url'])
+
+        # Sustained CPU load calculation (история пополняется с интервалом сборщика system)
+        # (если истории меньше, используется вся доступная)
+        num_samples = int(alerts_config['cpu_sustained_load_time'] / collectors_config['system']['interval'])
+        avg_cpu_sustained = cpu_hist.mean(num_samples)
+
+        if compact:
+            regions['compact'].update(
+                (config_version, cpu, mem_percent, disk_percent, temp, pg_ok, pg_status_text, pg_conn_count, app_ok, http_code),
+                cpu, mem_percent, disk_percent, temp, pg_ok, pg_status_text, pg_conn_count, app_ok, http_code)
+        else:
+            cpu_warn, cpu_crit = alerts_config['cpu_threshold'] * 0.9, alerts_config['cpu_threshold']
+            regions['cpu'].update(
+                (config_version, cpu, tuple(per_cpu), get_load_color(avg_cpu_sustained, cpu_warn, cpu_crit)),
+                cpu, per_cpu, avg_cpu_sustained, cpu_warn, cpu_crit)
+            disks = _probe_value(snapshot, 'disk')
+            disks_key = None
+            if disks is not None:
+                disks_key = (tuple((d['mount'], d['percent'], d['used'], d['seconds_to_full'] and round(d['seconds_to_full'], -2))
+                                   for d in disks['mounts']),
+                             tuple((name, tuple(round(v, 1) for v in disk_io.values())) for name, disk_io in disks['devices'].items()))
+            regions['resources'].update(
+                (config_version, mem, disk, temp, tuple(temps['packages'].items()), tuple(temps['cores'].items()), disks_key),
+                mem, disk, temps, alerts_config, disks)
+
+            net = _probe_value(snapshot, 'net')
+            if net is not None:
+                nics = {name: {k: round(v, 1) for k, v in n.items()} for name, n in net['nics'].items()}
+                ports = tuple((port, tuple(counts.items())) for port, counts in net['ports'].items())
+                regions['net'].update((tuple((k, tuple(v.values())) for k, v in nics.items()), tuple(net['tcp'].items()), ports),
+                                      nics, net['tcp'], ports)
+
+            # Тренды за chart_window (длинные окна берутся из минутных и часовых агрегатов)
+            window = monitoring_config['chart_window']
+            trend_lines = None
+            if not minimal:
+                trend_lines = tuple(
+                    (label, sparkline(hist.span(window, collectors_config[probe]['interval']), width=40,
+                                      version=(id(hist), hist.version, window)))
+                    for label, hist, probe in (("CPU", cpu_hist, 'system'), ("Memory", mem_hist, 'system'),
+                                               ("Disk", disk_hist, 'system'), ("CPU Temp", temp_hist, 'temp'),
+                                               ("Net ↓", net_rx_hist, 'net'), ("Net ↑", net_tx_hist, 'net')))
+            regions['trends'].update((window, trend_lines), window, trend_lines)
+
+            workload = _probe_value(snapshot, 'pg_workload')
+            workload_key = None
+            if workload is not None:
+                workload_key = tuple(
+                    (k, round(v, 1) if isinstance(v, float) else repr(v)) for k, v in sorted(workload.items()))
+            regions['pg'].update((pg, workload_key), *pg, workload)
+            cgroups = _probe_value(snapshot, 'cgroup', {})
+            cgroups_key = tuple(
+                (unit, round(c['cpu_percent']), round(c['throttled_percent']), c['memory'] and c['memory'] >> 20,
+                 c['pids'], c['oom_kills'], tuple((r, round(p['some'][0])) for r, p in c['pressure'].items() if 'some' in p))
+                for unit, c in cgroups.items())
+            regions['app'].update(
+                (app_ok, other_units, http_code, http_latency, other_endpoints, cgroups_key),
+                app_ok, other_units, http_code, http_latency, other_endpoints, app_config['service_name'], cgroups)
+
+            procs = _probe_value(snapshot, 'process')
+            if procs is not None and not minimal:
+                rows = tuple(r._replace(cpu=round(r.cpu, 1), io=round(r.io, -3)) for r in procs['top_cpu'])
+                totals = (procs['service_total'], procs['postgres_total'])
+                regions['procs'].update(
+                    (rows, procs['count'], tuple(tuple(t.items()) for t in totals)),
+                    rows, procs['count'], *totals, app_config['service_name'])
+
+            if health_size and not minimal:
+                trends = tuple(sparkline(hist, width=20) for hist in (monitor_rss_hist, monitor_cpu_hist))
+                detailed = health_size > self.HEALTH_SUMMARY_ROWS
+                regions['health'].update((repr(health), trends, detailed), health, *trends, detailed)
+
+        # Footer: сработавшие оповещения движка и сборщики без свежих данных
+        active_alerts = [alert.text for alert in alerts]
+        if stale:
+            active_alerts.append("НЕТ СВЕЖИХ ДАННЫХ: " + ", ".join(sorted(stale)))
+        # Ошибки фоновых потоков не печатаются поверх экрана — показываем последние здесь
+        active_alerts.extend(message for _, message in monitor_health.recent_errors(self.ERRORS_SHOWN_FOR))
+        regions['footer'].update((tuple(active_alerts), monitoring_config['update_interval']),
+                                 active_alerts, monitoring_config['update_interval'])
+
+        return self.layout
 
 # Главное меню
-def main_menu():
-    config_manager = ConfigManager()
+def main_menu(config_file='monitoring.conf'):
+    config_manager = ConfigManager(config_file)
     while True:
         console.clear()
         console.print("[bold cyan]=== Меню мониторинга ===\n")
@@ -776,7 +4392,7 @@ def main_menu():
                 if config_manager.edit_interactive():
                     start_monitoring(config_manager)
             elif choice == "3":
-                view_logs()
+                view_logs(config_manager.get_monitoring_config()['log_file'])
             else:
                 console.print("\n[bold green]До свидания![/bold green]")
                 break
@@ -784,104 +4400,1282 @@ def main_menu():
             console.print("\n\n[bold green]До свидания![/bold green]")
             break
 
+class MonitorRuntime:
+    """Сборщики, запись лога и слежение за конфигурацией — общее для экрана и фонового режима."""
+    def __init__(self, config_manager):
+        self.config_manager = config_manager
+        self.engine = None
+        self.writer = None
+        self.watcher = ConfigWatcher(config_manager)
+        self.alerts = AlertEngine()
+        self.anomalies = AnomalyDetector()
+        self.notifier = None
+        self._notifications_config = None
+        self._config_version = None
+        self._seen_version = None
+
+    @property
+    def state(self):
+        return self.engine.state
+
+    @property
+    def update_interval(self):
+        return self.config_manager.get_monitoring_config()['update_interval']
+
+    def start(self):
+        monitoring_config = self.config_manager.get_monitoring_config()
+        configure_histories(monitoring_config)
+        self._apply_alert_rules()
+        self._apply_notifications()
+        monitor_health.start()
+        self.engine = CollectorEngine(build_probes(self.config_manager), health=monitor_health)
+        self.engine.start()
+        self.watcher.start()
+        self._config_version = self.config_manager.version
+        self.writer = metrics_writer(monitoring_config)
+        if self.writer is not None:
+            self.writer.start()
+
+    def stop(self):
+        self.watcher.stop()
+        monitor_health.stop()
+        if self.engine is not None:
+            self.engine.stop()
+        if self.writer is not None:
+            self.writer.stop()
+        if self.notifier is not None:
+            self.notifier.stop()
+
+    def tick(self):
+        """Применяет перезагруженную конфигурацию, пишет лог и возвращает снимок состояния."""
+        if self.config_manager.version != self._config_version:
+            # Конфигурация перезагружена с диска — применяем без перезапуска
+            self._config_version = self.config_manager.version
+            configure_histories(self.config_manager.get_monitoring_config())
+            self._apply_alert_rules()
+            self._apply_notifications()
+            self.engine.replace_probes(build_probes(self.config_manager))
+        snapshot = self.engine.state.snapshot()
+        # Лог и оповещения обрабатываются, только если появились новые данные
+        if self.engine.state.version != self._seen_version:
+            self._seen_version = self.engine.state.version
+            if self.writer is not None:
+                log_metrics(self.writer, snapshot, self.config_manager.get_application_config()['url'])
+            samples, details = alert_samples(snapshot, self.config_manager)
+            if self.config_manager.get_alerts_config()['anomaly_threshold'] > 0:
+                samples['anomaly'], details['anomaly'] = self.anomalies.update(anomaly_series(snapshot))
+            events = self.alerts.evaluate(samples, details)
+            if events:
+                notify(events, self.config_manager, self.notifier)
+        return snapshot
+
+    def _apply_notifications(self):
+        notifications_config = self.config_manager.get_notifications_config()
+        if self.notifier is not None:
+            if notifications_config == self._notifications_config:
+                return
+            self.notifier.stop()
+        self._notifications_config = notifications_config
+        self.notifier = notifier(notifications_config)
+        if self.notifier is not None:
+            self.notifier.start()
+
+    def _apply_alert_rules(self):
+        alerts_config = self.config_manager.get_alerts_config()
+        self.alerts.set_rules(alert_rules(self.config_manager), alerts_config['notify_cooldown'])
+        self.anomalies.configure(alerts_config['anomaly_threshold'], alerts_config['anomaly_window'],
+                                 alerts_config['anomaly_warmup'])
+
 def start_monitoring(config_manager):
+    runtime = MonitorRuntime(config_manager)
+    dashboard = Dashboard(config_manager)
     try:
-        monitoring_config = config_manager.get_monitoring_config()
-        update_interval = monitoring_config['update_interval']
-        
+        runtime.start()
+        install_profiling_signals(config_manager)
+
+        # Кадр выводится сразу после построения, чтобы время вывода можно было замерить
         with Live(
-            render(config_manager),
-            refresh_per_second=1/update_interval,
+            dashboard.render(runtime.state.snapshot()),
+            auto_refresh=False,
             screen=True
         ) as live:
             try:
+                next_frame = time.monotonic()
                 while True:
-                    live.update(render(config_manager))
-                    time.sleep(update_interval)
+                    started = time.perf_counter()
+                    frame = dashboard.render(runtime.tick(), runtime.alerts.firing())
+                    built = time.perf_counter()
+                    live.update(frame, refresh=True)
+                    monitor_health.record_frame(built - started, time.perf_counter() - built)
+                    # Кадры идут по расписанию; не успевшие к своему сроку считаются пропущенными
+                    next_frame += runtime.update_interval
+                    now = time.monotonic()
+                    if now > next_frame:
+                        missed = int((now - next_frame) // runtime.update_interval) + 1
+                        monitor_health.record_missed(missed)
+                        next_frame += missed * runtime.update_interval
+                    time.sleep(max(0.0, next_frame - now))
             except KeyboardInterrupt:
                 return
     except Exception as e:
         console.print(f"\n[red]Ошибка при запуске мониторинга: {str(e)}[/red]")
         input("\nНажмите Enter для продолжения...")
         return
+    finally:
+        runtime.stop()
+
+# Фоновый режим: экспорт метрик в формате Prometheus/OpenMetrics
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Exposition:
+    """Накапливает строки текстового формата Prometheus с описаниями метрик."""
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        """samples — пары (метки, значение); метки — dict или None."""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            if value is None:
+                continue
+            if labels:
+                label_text = ','.join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+                self.lines.append(f"{name}{{{label_text}}} {float(value)!r}")
+            else:
+                self.lines.append(f"{name} {float(value)!r}")
+
+    def text(self):
+        return '\n'.join(self.lines) + '\n'
+
+def _probe_up(name, result):
+    """Свежий результат без ошибки; сборщики PostgreSQL сообщают об ошибке в самом значении."""
+    if result.error is not None or result.stale:
+        return False
+    if name == 'postgresql':
+        return bool(result.value and result.value[0])
+    if name == 'pg_workload':
+        return not (isinstance(result.value, dict) and 'error' in result.value)
+    return True
+
+def render_exposition(snapshot, config_manager, alerts=None, anomalies=None):
+    """Текст /metrics из снимка состояния сборщиков (без новых опросов)."""
+    app_config = config_manager.get_application_config()
+    out = Exposition()
+    out.metric('monitoring_probe_up', 'gauge', 'Сборщик вернул свежие данные без ошибки',
+               [({'probe': name}, int(_probe_up(name, r))) for name, r in sorted(snapshot.items())])
+    out.metric('monitoring_probe_duration_seconds', 'gauge', 'Длительность последнего опроса',
+               [({'probe': name}, r.duration) for name, r in sorted(snapshot.items())])
+
+    system = _probe_value(snapshot, 'system')
+    if system is not None:
+        out.metric('monitoring_cpu_percent', 'gauge', 'Загрузка CPU, %', [(None, system['cpu'])])
+        out.metric('monitoring_cpu_core_percent', 'gauge', 'Загрузка ядра CPU, %',
+                   [({'core': i}, v) for i, v in enumerate(system['per_cpu'])])
+        out.metric('monitoring_memory_percent', 'gauge', 'Занятая память, %', [(None, system['mem'].percent)])
+        out.metric('monitoring_memory_used_bytes', 'gauge', 'Занятая память, байт', [(None, system['mem'].used)])
+        out.metric('monitoring_disk_percent', 'gauge', 'Занятое место на /, %', [(None, system['disk'].percent)])
+
+    temps = _probe_value(snapshot, 'temp')
+    if temps is not None:
+        out.metric('monitoring_temperature_celsius', 'gauge', 'Температура датчика, °C',
+                   [({'sensor': label}, v) for group in ('packages', 'cores', 'other')
+                    for label, v in temps[group].items()] or [({'sensor': 'cpu'}, temps['main'])])
+
+    pg = _probe_value(snapshot, 'postgresql')
+    if pg is not None:
+        pg_ok, _, pg_conn_count, pg_long_queries, _ = pg
+        out.metric('monitoring_postgresql_up', 'gauge', 'PostgreSQL доступен', [(None, int(pg_ok))])
+        if pg_ok:
+            out.metric('monitoring_postgresql_connections', 'gauge', 'Подключения к PostgreSQL', [(None, pg_conn_count)])
+            out.metric('monitoring_postgresql_long_queries', 'gauge', 'Запросы дольше 30 секунд', [(None, pg_long_queries)])
+
+    workload = _probe_value(snapshot, 'pg_workload')
+    if workload is not None and 'error' not in workload:
+        if 'tps' in workload:
+            for key, name, help_text in (
+                    ('tps', 'transactions_per_second', 'Транзакций в секунду'),
+                    ('rollback_rate', 'rollbacks_per_second', 'Откатов в секунду'),
+                    ('deadlock_rate', 'deadlocks_per_second', 'Взаимоблокировок в секунду'),
+                    ('temp_bytes_rate', 'temp_bytes_per_second', 'Запись во временные файлы, байт/с'),
+                    ('tuple_write_rate', 'tuple_writes_per_second', 'Вставленных, изменённых и удалённых строк в секунду'),
+                    ('cache_hit', 'cache_hit_percent', 'Попадания в кэш за интервал, %')):
+                if workload[key] is not None:
+                    out.metric(f'monitoring_postgresql_{name}', 'gauge', help_text, [(None, workload[key])])
+        out.metric('monitoring_postgresql_lock_waits', 'gauge', 'Сеансы в ожидании блокировки',
+                   [(None, workload['lock_waits'])])
+        out.metric('monitoring_postgresql_lock_wait_seconds', 'gauge', 'Самое долгое ожидание блокировки',
+                   [(None, workload['longest_lock_wait'])])
+        if workload.get('replicas'):
+            out.metric('monitoring_postgresql_replication_lag_bytes', 'gauge', 'Отставание реплики, байт WAL',
+                       [({'replica': name, 'state': state}, lag_bytes) for name, state, lag_bytes, _ in workload['replicas']])
+            out.metric('monitoring_postgresql_replication_lag_seconds', 'gauge', 'Отставание реплики (replay_lag)',
+                       [({'replica': name, 'state': state}, lag) for name, state, _, lag in workload['replicas']])
+        if workload.get('standby_lag') is not None:
+            out.metric('monitoring_postgresql_standby_lag_seconds', 'gauge', 'Отставание standby от мастера',
+                       [(None, workload['standby_lag'])])
+        if workload.get('checkpoints'):
+            out.metric('monitoring_postgresql_checkpoints_per_second', 'gauge', 'Контрольных точек в секунду',
+                       [({'kind': 'timed'}, workload['checkpoints']['timed_rate']),
+                        ({'kind': 'requested'}, workload['checkpoints']['requested_rate'])])
+            out.metric('monitoring_postgresql_buffers_written_per_second', 'gauge', 'Записанных буферов в секунду',
+                       [({'by': by}, workload['checkpoints'][f'buffers_{by}_rate'])
+                        for by in ('checkpoint', 'clean', 'backend')])
+        if workload.get('dead_tuples'):
+            out.metric('monitoring_postgresql_dead_tuples', 'gauge', 'Мёртвые строки в таблице',
+                       [({'table': name}, dead) for name, dead, _ in workload['dead_tuples']])
+
+    units = _probe_value(snapshot, 'service')
+    if units is not None:
+        out.metric('monitoring_systemd_unit_active', 'gauge', 'Unit systemd в состоянии active',
+                   [({'unit': u, 'state': state}, int(state == 'active')) for u, state in units.items()])
 
-def view_logs():
-    """Отображает статистику из файла логов."""
+    endpoints = _probe_value(snapshot, 'http')
+    if endpoints is not None:
+        out.metric('monitoring_http_up', 'gauge', 'Адрес ответил 200',
+                   [({'url': url}, int(r['status'] == 200)) for url, r in endpoints.items()])
+        out.metric('monitoring_http_status_code', 'gauge', 'Код последнего ответа',
+                   [({'url': url}, r['status']) for url, r in endpoints.items()])
+        out.metric('monitoring_http_response_bytes', 'gauge', 'Размер тела последнего ответа',
+                   [({'url': url}, r['size']) for url, r in endpoints.items()])
+        samples_bucket, samples_count, samples_sum = [], [], []
+        for url, r in endpoints.items():
+            cumulative, count, total_ms = r['histogram']
+            for le, n in zip(EndpointStats.LATENCY_BUCKETS_MS, cumulative):
+                samples_bucket.append(({'url': url, 'le': f"{le / 1000:g}"}, n))
+            samples_bucket.append(({'url': url, 'le': '+Inf'}, count))
+            samples_count.append(({'url': url}, count))
+            samples_sum.append(({'url': url}, total_ms / 1000))
+        out.lines.append("# HELP monitoring_http_latency_seconds Время ответа")
+        out.lines.append("# TYPE monitoring_http_latency_seconds histogram")
+        for suffix, samples in (('_bucket', samples_bucket), ('_count', samples_count), ('_sum', samples_sum)):
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{_label_value(v)}"' for k, v in labels.items())
+                out.lines.append(f"monitoring_http_latency_seconds{suffix}{{{label_text}}} {float(value)!r}")
+
+    disks = _probe_value(snapshot, 'disk')
+    if disks is not None:
+        mounts = disks['mounts']
+        out.metric('monitoring_mount_used_percent', 'gauge', 'Занятое место на точке монтирования, %',
+                   [({'mount': d['mount'], 'device': d['device']}, d['percent']) for d in mounts])
+        out.metric('monitoring_mount_free_bytes', 'gauge', 'Свободное место на точке монтирования',
+                   [({'mount': d['mount'], 'device': d['device']}, d['free']) for d in mounts])
+        out.metric('monitoring_mount_seconds_to_full', 'gauge', 'Прогноз времени до заполнения по линейной регрессии',
+                   [({'mount': d['mount'], 'device': d['device']}, d['seconds_to_full']) for d in mounts])
+        devices = sorted(disks['devices'].items())
+        for key, name, help_text in (('read_bps', 'read_bytes_per_second', 'Скорость чтения'),
+                                     ('write_bps', 'write_bytes_per_second', 'Скорость записи'),
+                                     ('read_iops', 'read_iops', 'Операций чтения в секунду'),
+                                     ('write_iops', 'write_iops', 'Операций записи в секунду'),
+                                     ('latency_ms', 'latency_milliseconds', 'Среднее время операции')):
+            out.metric(f'monitoring_disk_{name}', 'gauge', help_text,
+                       [({'device': dev}, disk_io[key]) for dev, disk_io in devices])
+
+    net = _probe_value(snapshot, 'net')
+    if net is not None:
+        nics = sorted(net['nics'].items())
+        for key, name, help_text in (('rx_bps', 'receive_bytes_per_second', 'Принято байт в секунду'),
+                                     ('tx_bps', 'transmit_bytes_per_second', 'Отправлено байт в секунду'),
+                                     ('rx_pps', 'receive_packets_per_second', 'Принято пакетов в секунду'),
+                                     ('tx_pps', 'transmit_packets_per_second', 'Отправлено пакетов в секунду'),
+                                     ('errors', 'errors_per_second', 'Ошибок приёма и отправки в секунду'),
+                                     ('drops', 'drops_per_second', 'Потерянных пакетов в секунду')):
+            out.metric(f'monitoring_network_{name}', 'gauge', help_text,
+                       [({'interface': nic}, n[key]) for nic, n in nics])
+        out.metric('monitoring_tcp_connections', 'gauge', 'TCP-сокетов по состояниям',
+                   [({'state': state}, n) for state, n in sorted(net['tcp'].items())])
+        out.metric('monitoring_tcp_port_connections', 'gauge', 'TCP-сокетов порта приложения или PostgreSQL по состояниям',
+                   [({'port': port, 'state': state}, n) for port, counts in net['ports'].items()
+                    for state, n in sorted(counts.items())])
+
+    procs = _probe_value(snapshot, 'process')
+    if procs is not None:
+        top = {r.pid: r for key in ('top_cpu', 'top_rss', 'top_io') for r in procs[key]}.values()
+        out.metric('monitoring_processes', 'gauge', 'Число процессов', [(None, procs['count'])])
+        out.metric('monitoring_process_cpu_percent', 'gauge', 'Загрузка CPU процессом из топа, %',
+                   [({'pid': r.pid, 'name': r.name}, r.cpu) for r in top])
+        out.metric('monitoring_process_rss_bytes', 'gauge', 'Резидентная память процесса из топа',
+                   [({'pid': r.pid, 'name': r.name}, r.rss) for r in top])
+        out.metric('monitoring_process_io_bytes_per_second', 'gauge', 'Скорость чтения и записи процесса из топа',
+                   [({'pid': r.pid, 'name': r.name}, r.io) for r in top])
+        groups = (('service', app_config['service_name'], procs['service_total']),
+                  ('postgres', 'postgres', procs['postgres_total']))
+        out.metric('monitoring_group_processes', 'gauge', 'Процессов в группе (cgroup сервиса, backends PostgreSQL)',
+                   [({'group': g, 'name': n}, t['count']) for g, n, t in groups])
+        out.metric('monitoring_group_cpu_percent', 'gauge', 'Загрузка CPU группой процессов, %',
+                   [({'group': g, 'name': n}, t['cpu']) for g, n, t in groups])
+        out.metric('monitoring_group_rss_bytes', 'gauge', 'Резидентная память группы процессов',
+                   [({'group': g, 'name': n}, t['rss']) for g, n, t in groups])
+
+    cgroups = _probe_value(snapshot, 'cgroup')
+    if cgroups:
+        items = sorted(cgroups.items())
+        out.metric('monitoring_unit_cpu_percent', 'gauge', 'Загрузка CPU cgroup unit\'а, %',
+                   [({'unit': u}, c['cpu_percent']) for u, c in items])
+        out.metric('monitoring_unit_cpu_throttled_percent', 'gauge', 'Доля периодов CFS с троттлингом, %',
+                   [({'unit': u}, c['throttled_percent']) for u, c in items])
+        out.metric('monitoring_unit_cpu_throttled_seconds_per_second', 'gauge', 'Время троттлинга в секунду',
+                   [({'unit': u}, c['throttled_seconds']) for u, c in items])
+        out.metric('monitoring_unit_memory_bytes', 'gauge', 'memory.current cgroup',
+                   [({'unit': u}, c['memory']) for u, c in items])
+        out.metric('monitoring_unit_memory_max_bytes', 'gauge', 'memory.max cgroup (нет значения — без ограничения)',
+                   [({'unit': u}, c['memory_max']) for u, c in items])
+        out.metric('monitoring_unit_memory_stat_bytes', 'gauge', 'Разбивка памяти cgroup из memory.stat',
+                   [({'unit': u, 'kind': k}, v) for u, c in items for k, v in c['memory_stat'].items()])
+        out.metric('monitoring_unit_oom_kills_total', 'counter', 'OOM kill в cgroup unit\'а с учётом перезапусков',
+                   [({'unit': u}, c['oom_kills']) for u, c in items])
+        out.metric('monitoring_unit_io_bytes_per_second', 'gauge', 'Скорость ввода-вывода cgroup',
+                   [({'unit': u, 'direction': d}, c[f'{d}_bps']) for u, c in items for d in ('read', 'write')])
+        out.metric('monitoring_unit_io_operations_per_second', 'gauge', 'Операций ввода-вывода cgroup в секунду',
+                   [({'unit': u}, c['iops']) for u, c in items])
+        out.metric('monitoring_unit_pids', 'gauge', 'pids.current cgroup', [({'unit': u}, c['pids']) for u, c in items])
+        out.metric('monitoring_unit_pressure_percent', 'gauge', 'PSI: доля времени в ожидании ресурса, %',
+                   [({'unit': u, 'resource': r, 'kind': kind, 'window': w}, v)
+                    for u, c in items for r, p in c['pressure'].items() for kind, values in p.items()
+                    for w, v in zip(('10s', '60s', '300s'), values)])
+
+    health = _probe_value(snapshot, 'monitor')
+    if health is not None:
+        probes = sorted(health['probes'].items())
+        out.metric('monitoring_self_probe_calls_total', 'counter', 'Вызовов сборщика',
+                   [({'probe': name}, p['calls']) for name, p in probes])
+        out.metric('monitoring_self_probe_missed_total', 'counter', 'Опросов, пропущенных из-за долгого предыдущего',
+                   [({'probe': name}, p['missed']) for name, p in probes])
+        out.metric('monitoring_self_probe_seconds_total', 'counter', 'Суммарное время вызовов сборщика',
+                   [({'probe': name}, p['wall_total']) for name, p in probes])
+        out.metric('monitoring_self_probe_cpu_seconds_total', 'counter', 'Суммарное время CPU потока сборщика',
+                   [({'probe': name}, p['cpu_total']) for name, p in probes])
+        out.metric('monitoring_self_probe_duration_p95_seconds', 'gauge', 'p95 длительности вызова сборщика',
+                   [({'probe': name}, p['wall_p95_ms'] / 1000) for name, p in probes if p['wall_p95_ms'] is not None])
+        frames = health['frames']
+        out.metric('monitoring_self_frames_total', 'counter', 'Построенных кадров (экран или /metrics)',
+                   [(None, frames['count'])])
+        if frames['build_p95_ms'] is not None:
+            out.metric('monitoring_self_frame_build_p95_seconds', 'gauge', 'p95 построения кадра',
+                       [(None, frames['build_p95_ms'] / 1000)])
+        out.metric('monitoring_self_ticks_missed_total', 'counter', 'Тактов, пропущенных из-за долгого кадра',
+                   [(None, frames['missed'])])
+        out.metric('monitoring_self_rss_bytes', 'gauge', 'Резидентная память монитора', [(None, health['rss'])])
+        out.metric('monitoring_self_cpu_seconds_total', 'counter', 'Время CPU процесса монитора',
+                   [(None, health['cpu_total'])])
+        out.metric('monitoring_self_threads', 'gauge', 'Потоков монитора', [(None, health['threads'])])
+        out.metric('monitoring_self_gc_collections_total', 'counter', 'Сборок мусора по поколениям',
+                   [({'generation': g}, n) for g, n in enumerate(health['gc']['collections'])])
+        out.metric('monitoring_self_gc_pause_seconds_total', 'counter', 'Суммарная пауза сборщика мусора',
+                   [(None, health['gc']['pause_total'])])
+        out.metric('monitoring_self_gc_pause_max_seconds', 'gauge', 'Самая долгая из последних пауз GC',
+                   [(None, health['gc']['pause_max_ms'] / 1000)])
+        out.metric('monitoring_self_errors_total', 'counter', 'Ошибок фоновых потоков (запись лога, доставка оповещений)',
+                   [({'source': source}, e['count']) for source, e in sorted(health['errors'].items())])
+
+    if anomalies is not None and anomalies.series:
+        out.metric('monitoring_anomaly_score', 'gauge', 'Отклонение ряда от базовой линии, в единицах z',
+                   [({'series': name}, score) for name, score in sorted(anomalies.scores().items())])
+
+    if alerts is not None:
+        out.metric('monitoring_alert_firing', 'gauge', 'Оповещение в состоянии firing',
+                   [({'alert': name, 'state': alert.state}, int(alert.state == 'firing'))
+                    for name, alert in sorted(alerts.alerts.items())])
+    return out.text()
+
+class MetricsExporter:
+    """Неблокирующий HTTP-сервер на asyncio, отдающий заранее подготовленный текст /metrics.
+
+    По /stream агент держит одно постоянное соединение с агрегатором и шлёт
+    строки JSON: сначала полную сводку хоста, затем только изменившиеся поля.
+    """
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+    STREAM_CONTENT_TYPE = 'application/x-ndjson'
+
+    def __init__(self, host='127.0.0.1', port=9101, stream_interval=1.0, heartbeat=15.0):
+        self.host = host
+        self.port = port
+        self.stream_interval = stream_interval
+        self.heartbeat = heartbeat
+        self.body = b''
+        self.summary = {}
+        self.scrapes = 0
+        self._changed = None
+        self._closing = False
+        self._streams = {}  # writer -> задача обработчика
+
+    def publish(self, text, summary=None):
+        # Подмена одной ссылкой — обработчики запросов всегда видят целую версию
+        self.body = text.encode('utf-8')
+        if summary is not None:
+            self.summary = summary
+            if self._changed is not None:
+                self._changed.set()
+                self._changed = asyncio.Event()
+
+    async def serve(self):
+        self._changed = asyncio.Event()
+        return await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def close_streams(self):
+        """Завершает потоки /stream и ждёт их обработчики."""
+        self._closing = True
+        if self._changed is not None:
+            self._changed.set()
+        for writer in self._streams:
+            writer.close()
+        await asyncio.gather(*self._streams.values(), return_exceptions=True)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=30)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    break
+                request_line = head.split(b'\r\n', 1)[0].decode('latin-1')
+                parts = request_line.split()
+                keep_alive = b'connection: close' not in head.lower()
+                path = parts[1].split('?')[0] if len(parts) >= 2 else ''
+                if parts and parts[0] == 'GET' and path == '/stream':
+                    await self._stream(writer)
+                    break
+                if len(parts) >= 2 and parts[0] in ('GET', 'HEAD') and path == '/metrics':
+                    self.scrapes += 1
+                    body, status = self.body, '200 OK'
+                else:
+                    body, status = b'not found\n', '404 Not Found'
+                headers = (f"HTTP/1.1 {status}\r\nContent-Type: {self.CONTENT_TYPE}\r\n"
+                           f"Content-Length: {len(body)}\r\n"
+                           f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode('latin-1')
+                writer.write(headers if parts and parts[0] == 'HEAD' else headers + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _stream(self, writer):
+        self._streams[writer] = asyncio.current_task()
+        try:
+            writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: {self.STREAM_CONTENT_TYPE}\r\n"
+                          f"Connection: close\r\n\r\n").encode('latin-1'))
+            sent = dict(self.summary)
+            writer.write(_stream_frame({'full': sent}))
+            await writer.drain()
+            while not self._closing and not writer.is_closing():
+                changed = self._changed
+                try:
+                    await asyncio.wait_for(changed.wait(), timeout=self.heartbeat)
+                except asyncio.TimeoutError:
+                    pass
+                if self._closing:
+                    break
+                # Изменения за stream_interval уходят одним кадром
+                await asyncio.sleep(self.stream_interval)
+                current = self.summary
+                delta = {k: v for k, v in current.items() if sent.get(k, _MISSING) != v}
+                delta.update((k, None) for k in sent.keys() - current.keys())
+                sent = dict(current)
+                writer.write(_stream_frame({'delta': delta}))
+                await writer.drain()
+        finally:
+            self._streams.pop(writer, None)
+
+_MISSING = object()
+
+def _stream_frame(frame):
+    frame['t'] = round(time.time(), 3)
+    return json.dumps(frame, separators=(',', ':'), ensure_ascii=False).encode('utf-8') + b'\n'
+
+def host_summary(snapshot, config_manager, alerts=None):
+    """Компактная сводка хоста для агрегатора: плоский словарь округлённых значений."""
+    app_config = config_manager.get_application_config()
+    summary = {'host': os.uname().nodename}
+    system = _probe_value(snapshot, 'system')
+    if system is not None:
+        summary.update(cpu=round(system['cpu'], 1), mem=round(system['mem'].percent, 1),
+                       disk=round(system['disk'].percent, 1), cores=len(system['per_cpu']))
+    temps = _probe_value(snapshot, 'temp')
+    if temps is not None and temps['main'] is not None:
+        summary['temp'] = round(temps['main'], 1)
+    pg = _probe_value(snapshot, 'postgresql')
+    if pg is not None:
+        summary['pg'] = bool(pg[0])
+        summary['pg_conn'] = pg[2]
+    units = _probe_value(snapshot, 'service')
+    if units is not None:
+        summary['app'] = units.get(app_config['service_name'], 'unknown')
+    endpoints = _probe_value(snapshot, 'http')
+    if endpoints is not None and app_config['url'] in endpoints:
+        summary['http'] = endpoints[app_config['url']]['status']
+    summary['stale'] = sorted(name for name, r in snapshot.items() if r.stale)
+    if alerts is not None:
+        summary['alerts'] = [alert.text for alert in alerts.firing()]
+    return summary
+
+def run_daemon(config_manager, listen=None):
+    """Фоновый режим без интерфейса: сборщики, лог и /metrics для Prometheus."""
+    daemon_config = config_manager.get_daemon_config()
+    host, port = daemon_config['listen_address'], daemon_config['listen_port']
+    if listen:
+        host, _, port = listen.rpartition(':')
+        host, port = host or '0.0.0.0', int(port)
+
+    runtime = MonitorRuntime(config_manager)
+    exporter = MetricsExporter(host, port, daemon_config['stream_interval'])
+
+    async def main():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        install_profiling_signals(config_manager, loop)
+        server = await exporter.serve()
+        console.print(f"[green]Экспорт метрик: http://{host}:{port}/metrics[/green]")
+        exported_version = None
+        next_tick = time.monotonic()
+        try:
+            while not stop.is_set():
+                started = time.perf_counter()
+                snapshot = runtime.tick()
+                if runtime.state.version != exported_version:
+                    exported_version = runtime.state.version
+                    exporter.publish(render_exposition(snapshot, config_manager, runtime.alerts, runtime.anomalies),
+                                     host_summary(snapshot, config_manager, runtime.alerts))
+                    monitor_health.record_frame(time.perf_counter() - started)
+                next_tick += runtime.update_interval
+                now = time.monotonic()
+                if now > next_tick:
+                    missed = int((now - next_tick) // runtime.update_interval) + 1
+                    monitor_health.record_missed(missed)
+                    next_tick += missed * runtime.update_interval
+                try:
+                    await asyncio.wait_for(stop.wait(), timeout=max(0.0, next_tick - now))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            server.close()
+            await exporter.close_streams()
+            await server.wait_closed()
+
+    runtime.start()
     try:
-        if not os.path.exists(LOG_FILE):
-            console.print("[red]Файл логов не найден![/red]")
-            input("\nНажмите Enter для возврата в меню...")
+        asyncio.run(main())
+    finally:
+        runtime.stop()
+
+# Режим флота: агрегатор подключается к агентам (--daemon) и сводит их в одну таблицу
+class FleetAggregator:
+    """Постоянные соединения с агентами по /stream и слияние присылаемых изменений.
+
+    Опроса нет: каждый агент сам присылает кадры, когда у него меняются данные.
+    Работает в собственном потоке с циклом asyncio; hosts() безопасно вызывать из любого потока.
+    """
+    def __init__(self, agents, timeout=30.0, max_backoff=30.0):
+        self.agents = list(dict.fromkeys(a for a in agents if a))
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self._hosts = {agent: {'agent': agent, 'online': False, 'error': 'подключение...'} for agent in self.agents}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='fleet', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._loop is None:
             return
-        
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+        self._loop = None
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        for agent in self.agents:
+            self._loop.create_task(self._follow(agent))
         try:
-            with open(LOG_FILE, 'r') as f:
-                reader = csv.reader(f)
-                header = next(reader)
-                data = list(reader)
+            self._loop.run_forever()
+        finally:
+            for task in asyncio.all_tasks(self._loop):
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*asyncio.all_tasks(self._loop), return_exceptions=True))
+            self._loop.close()
 
-            if not data:
-                console.print("[yellow]Файл логов пуст.[/yellow]")
-                input("\nНажмите Enter для возврата в меню...")
-                return
+    async def _follow(self, agent):
+        host, _, port = agent.rpartition(':')
+        backoff = 1.0
+        while True:
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(host or '127.0.0.1', int(port)),
+                                                        timeout=self.timeout)
+                writer.write(f"GET /stream HTTP/1.1\r\nHost: {agent}\r\n\r\n".encode('latin-1'))
+                await writer.drain()
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=self.timeout)
+                if b' 200 ' not in head.split(b'\r\n', 1)[0]:
+                    raise ConnectionError(head.split(b'\r\n', 1)[0].decode('latin-1'))
+                while True:
+                    line = await asyncio.wait_for(reader.readline(), timeout=self.timeout)
+                    if not line:
+                        raise ConnectionError('соединение закрыто агентом')
+                    self._apply(agent, json.loads(line))
+                    backoff = 1.0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                with self._lock:
+                    state = self._hosts[agent]
+                    state['online'] = False
+                    state['error'] = str(e) or type(e).__name__
+            finally:
+                if writer is not None:
+                    writer.close()
+            await asyncio.sleep(backoff)
+            backoff = min(self.max_backoff, backoff * 2)
 
-            # Последние 10 записей
-            console.print("\n[bold]Последние 10 записей:[/bold]")
-            log_table = Table(box=box.ROUNDED)
-            for col in header:
-                log_table.add_column(col)
-            
-            for row in data[-10:]:
-                styled_row = []
-                for i, value in enumerate(row):
-                    if i > 0: # Пропускаем время
-                        try:
-                            val = float(value)
-                            if header[i] == 'cpu':
-                                styled_row.append(f"[{get_load_color(val)}]"+value+f"[/[{get_load_color(val)}]]")
-                            else:
-                                 styled_row.append(value)
-                        except (ValueError, TypeError):
-                            styled_row.append(value)
+    def _apply(self, agent, frame):
+        with self._lock:
+            state = self._hosts[agent]
+            if 'full' in frame:
+                state = self._hosts[agent] = dict(frame['full'], agent=agent)
+            else:
+                for key, value in frame.get('delta', {}).items():
+                    if value is None:
+                        state.pop(key, None)
                     else:
-                        styled_row.append(value)
-                log_table.add_row(*styled_row)
-            
-            console.print(log_table)
+                        state[key] = value
+            state['online'] = True
+            state['error'] = None
+            state['seen'] = time.time()
 
-            # Статистика
-            stats_table = Table(title="Статистика по метрикам", box=box.ROUNDED, show_header=True, header_style="bold magenta")
-            stats_table.add_column("Метрика")
-            stats_table.add_column("Среднее")
-            stats_table.add_column("Максимум")
-            stats_table.add_column("Минимум")
+    def hosts(self):
+        """Копия текущего состояния всех агентов."""
+        with self._lock:
+            return [dict(state) for state in self._hosts.values()]
 
-            for i, col in enumerate(header[1:], 1):  # Пропускаем колонку времени
-                values = []
-                for row in data:
-                    try:
-                        # Пытаемся преобразовать значение в число, пропуская некорректные
-                        if len(row) > i and row[i] not in ('', 'None', 'N/A'):
-                            values.append(float(row[i]))
-                    except (ValueError, IndexError):
-                        continue # Пропускаем строки с ошибками данных
-
-                if values:
-                    avg = sum(values) / len(values)
-                    max_val = max(values)
-                    min_val = min(values)
-                    stats_table.add_row(col, f"{avg:.2f}", f"{max_val:.2f}", f"{min_val:.2f}")
-                else:
-                    stats_table.add_row(col, "N/A", "N/A", "N/A")
+FLEET_SORT_KEYS = ('host', 'cpu', 'mem', 'disk', 'temp', 'alerts')
+
+def fleet_rows(hosts, sort='cpu', text_filter=''):
+    """Фильтр по подстроке в имени/адресе и сортировка; проблемные хосты — вверху при равенстве."""
+    if text_filter:
+        needle = text_filter.lower()
+        hosts = [h for h in hosts if needle in h.get('host', '').lower() or needle in h['agent'].lower()]
+    if sort == 'host':
+        return sorted(hosts, key=lambda h: (h.get('host') or h['agent']))
+    if sort == 'alerts':
+        return sorted(hosts, key=lambda h: (h['online'], -len(h.get('alerts', ()))))
+    return sorted(hosts, key=lambda h: (h['online'], -(h.get(sort) or 0)))
+
+def fleet_table(hosts, sort='cpu', text_filter='', limit=None):
+    rows = fleet_rows(hosts, sort, text_filter)
+    shown = rows[:limit] if limit else rows
+    table = Table(box=box.SIMPLE_HEAD, expand=True,
+                  title=f"Хостов: {len(hosts)}, показано: {len(shown)} · сортировка: {sort}"
+                        + (f" · фильтр: {text_filter}" if text_filter else ""))
+    table.add_column("Хост")
+    for title in ("CPU", "Mem", "Disk", "Temp"):
+        table.add_column(title, justify="right")
+    table.add_column("PG")
+    table.add_column("App")
+    table.add_column("HTTP", justify="right")
+    table.add_column("Оповещения", ratio=1, overflow="fold")
+    now = time.time()
+    for h in shown:
+        name = Text.assemble(Text(h.get('host', ''), style="bold"), Text(f" {h['agent']}", style="dim"))
+        if not h['online']:
+            name.stylize("red")
+            table.add_row(name, *([""] * 7), Text(f"нет связи: {h.get('error')}", style="red"))
+            continue
+
+        def percent(key):
+            value = h.get(key)
+            return Text("N/A", style="dim") if value is None else Text(f"{value:.0f}%", style=get_load_color(value))
+
+        temp = h.get('temp')
+        alerts = h.get('alerts', [])
+        stale = h.get('stale', [])
+        problems = alerts + ([f"нет данных: {', '.join(stale)}"] if stale else [])
+        if now - h.get('seen', now) > 60:
+            problems.append(f"кадр {format_duration(round(now - h['seen']))} назад")
+        table.add_row(
+            name,
+            percent('cpu'), percent('mem'), percent('disk'),
+            Text("N/A", style="dim") if temp is None else Text(f"{temp:.0f}°C"),
+            Text("OK", style="green") if h.get('pg') else Text("—" if 'pg' not in h else "DOWN", style="red"),
+            Text(h.get('app', '—'), style="green" if h.get('app') == 'active' else "red"),
+            Text(str(h.get('http') or 'N/A'), style="green" if h.get('http') == 200 else "red"),
+            Text(" | ".join(problems), style="bold red" if problems else "dim")
+        )
+    return table
+
+def start_fleet(config_manager, agents=None, sort=None, text_filter=''):
+    """Экран флота: таблица всех агентов с сортировкой и фильтром."""
+    fleet_config = config_manager.get_fleet_config()
+    agents = agents or fleet_config['agents']
+    if not agents:
+        console.print("[red]Не заданы агенты: укажите --fleet HOST:PORT,... или [fleet] agents[/red]")
+        return
+    sort = sort or fleet_config['sort']
+    aggregator = FleetAggregator(agents)
+    aggregator.start()
+    interval = config_manager.get_monitoring_config()['update_interval']
+
+    def frame():
+        # Заголовок таблицы и рамка занимают несколько строк
+        return fleet_table(aggregator.hosts(), sort, text_filter, limit=max(1, console.size.height - 6))
+
+    try:
+        with Live(frame(), refresh_per_second=1 / interval, screen=True) as live:
+            while True:
+                time.sleep(interval)
+                live.update(frame())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        aggregator.stop()
+
+class QuantileSketch:
+    """Приближённые перцентили в ограниченной памяти (упрощённый merging t-digest)."""
+    def __init__(self, compression=100, buffer_size=500):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.count = 0
+        self._centroids = []  # [среднее, вес], по возрастанию среднего
+        self._buffer = []
+
+    def add(self, value):
+        self._buffer.append(value)
+        self.count += 1
+        if len(self._buffer) >= self.buffer_size:
+            self._merge()
+
+    def _merge(self):
+        if not self._buffer:
+            return
+        points = sorted(self._centroids + [[v, 1] for v in self._buffer])
+        self._buffer = []
+        merged = [points[0]]
+        cumulative = 0
+        for mean, weight in points[1:]:
+            last = merged[-1]
+            q = (cumulative + (last[1] + weight) / 2) / self.count
+            # Центроиды у хвостов распределения остаются мелкими — там точность важнее
+            if last[1] + weight <= max(1, 4 * self.count * q * (1 - q) / self.compression):
+                total = last[1] + weight
+                last[0] += (mean - last[0]) * weight / total
+                last[1] = total
+            else:
+                cumulative += last[1]
+                merged.append([mean, weight])
+        self._centroids = merged
+
+    def quantile(self, q):
+        self._merge()
+        if not self._centroids:
+            return None
+        target = q * self.count
+        cumulative = 0
+        prev_mean, prev_center = self._centroids[0][0], 0
+        for mean, weight in self._centroids:
+            center = cumulative + weight / 2
+            if target <= center:
+                if center == prev_center:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / (center - prev_center)
+            cumulative += weight
+            prev_mean, prev_center = mean, center
+        return self._centroids[-1][0]
+
+class LogColumnStats:
+    """Потоковая статистика колонки за один проход: Welford для среднего и дисперсии плюс перцентили."""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch()
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.sketch.add(value)
+
+    @property
+    def stddev(self):
+        return math.sqrt(self._m2 / (self.count - 1)) if self.count > 1 else 0.0
 
-            console.print(stats_table)
+def _logs_last_rows_table(header, rows):
+    """Таблица последних записей лога; rows — списки строковых значений."""
+    log_table = Table(box=box.ROUNDED)
+    for col in header:
+        log_table.add_column(col)
+    for row in rows:
+        styled_row = []
+        for i, value in enumerate(row):
+            if i > 0 and i < len(header) and header[i] == 'cpu': # Пропускаем время
+                try:
+                    styled_row.append(Text(value, style=get_load_color(float(value))))
+                    continue
+                except (ValueError, TypeError):
+                    pass
+            styled_row.append(value)
+        log_table.add_row(*styled_row)
+    return log_table
+
+def _logs_stats_table(stats):
+    """Таблица статистики; stats — {колонка: LogColumnStats}."""
+    stats_table = Table(title="Статистика по метрикам", box=box.ROUNDED, show_header=True, header_style="bold magenta")
+    stats_table.add_column("Метрика")
+    for title in ("Записей", "Среднее", "Ст. откл.", "Минимум", "p50", "p95", "p99", "Максимум"):
+        stats_table.add_column(title, justify="right")
+    for col, st in stats.items():
+        if st.count:
+            stats_table.add_row(col, str(st.count), f"{st.mean:.2f}", f"{st.stddev:.2f}", f"{st.min:.2f}",
+                                *(f"{st.sketch.quantile(q):.2f}" for q in (0.5, 0.95, 0.99)), f"{st.max:.2f}")
+        else:
+            stats_table.add_row(col, "0", *(["N/A"] * 7))
+    return stats_table
+
+def _logs_trends_table(histories):
+    """Тренды по минутным и часовым агрегатам; histories — {колонка: TieredHistory}."""
+    trends_table = Table(title="Тренды (среднее)", box=box.ROUNDED, header_style="bold magenta")
+    trends_table.add_column("Метрика")
+    trends_table.add_column("24ч, по минутам")
+    trends_table.add_column("7д, по часам")
+    for col, hist in histories.items():
+        minutes, hours = hist.tiers
+        minutes.flush()
+        hours.flush()
+        trends_table.add_row(col, sparkline(minutes.avg.window(1440), width=48),
+                             sparkline(hours.avg.window(168), width=48))
+    return trends_table
+
+def _format_log_value(value):
+    return 'None' if value != value else f"{value:g}"
+
+def tail_lines(path, n, chunk_size=8192):
+    """Последние n строк файла: читает блоки с конца, не загружая файл целиком."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        data = b''
+        while pos > 0 and data.count(b'\n') <= n:
+            step = min(chunk_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    return data.decode('utf-8', errors='replace').splitlines()[-n:]
+
+def _csv_timed_rows(log_file, since=None, until=None):
+    """Построчно читает CSV-лог: (время, строка, [значения или None]) в пределах [since, until)."""
+    with open(log_file, 'r', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        width = len(header)
+        for row in reader:
+            try:
+                ts = datetime.fromisoformat(row[0]).timestamp()
+            except (ValueError, IndexError):
+                continue
+            if (since is not None and ts < since) or (until is not None and ts >= until):
+                continue
+            values = []
+            for value in row[1:width]:
+                try:
+                    values.append(None if value in ('', 'None', 'N/A') else float(value))
+                except ValueError:
+                    values.append(None) # Пропускаем ошибки данных
+            yield ts, row, values
+
+def analyze_log(log_file, since=None, until=None):
+    """Один проход по логу (CSV или колоночному) с ограниченной памятью.
+
+    Возвращает (заголовок, последние 10 строк, {колонка: LogColumnStats}, таблица трендов).
+    """
+    if is_columnar_log(log_file):
+        reader = ColumnarLogReader(log_file)
+        header = list(reader.columns)
+
+        def timed_rows():
+            for row in reader.rows(since, until):
+                yield (row[0],
+                       [datetime.fromtimestamp(row[0]).isoformat(timespec='seconds')] + [_format_log_value(v) for v in row[1:]],
+                       [v if v == v else None for v in row[1:]])
+    else:
+        reader = None
+        with open(log_file, 'r', newline='') as f:
+            header = next(csv.reader(f), None)
+        if header is None:
+            return None, [], {}, None
+        timed_rows = lambda: _csv_timed_rows(log_file, since, until)
+
+    try:
+        stats = {col: LogColumnStats() for col in header[1:]}
+        column_stats = list(stats.values())
+        histories = [TieredHistory(default_value=None) for _ in header[1:]]
+        last_rows = deque(maxlen=10)
+        for ts, row, values in timed_rows():
+            last_rows.append(row)
+            for st, hist, value in zip(column_stats, histories, values):
+                if value is not None:
+                    st.add(value)
+                    hist.append(value, ts)
+        return header, list(last_rows), stats, _logs_trends_table(dict(zip(header[1:], histories)))
+    finally:
+        if reader is not None:
+            reader.close()
+
+def view_logs(log_file=LOG_FILE, since=None, until=None, wait=True):
+    """Отображает статистику из файла логов за период [since, until) (unix time)."""
+    def pause():
+        if wait:
             input("\nНажмите Enter для возврата в меню...")
 
+    try:
+        if not os.path.exists(log_file):
+            console.print("[red]Файл логов не найден![/red]")
+            pause()
+            return
+        
+        try:
+            columnar = is_columnar_log(log_file)
+            if not columnar and since is None and until is None:
+                # Последние записи показываем сразу, читая только хвост файла
+                with open(log_file, 'r', newline='') as f:
+                    header = next(csv.reader(f), None)
+                tail = list(csv.reader(tail_lines(log_file, 10)))
+                tail = [row for row in tail if row and row != header]
+                if not tail:
+                    console.print("[yellow]Файл логов пуст.[/yellow]")
+                    pause()
+                    return
+                console.print("\n[bold]Последние 10 записей:[/bold]")
+                console.print(_logs_last_rows_table(header, tail))
+
+            with console.status("Анализ лога..."):
+                header, last_rows, stats, trends_table = analyze_log(log_file, since, until)
+
+            if not last_rows:
+                console.print("[yellow]Нет записей за выбранный период.[/yellow]")
+                pause()
+                return
+            if columnar or since is not None or until is not None:
+                console.print("\n[bold]Последние 10 записей:[/bold]")
+                console.print(_logs_last_rows_table(header, last_rows))
+            console.print(_logs_stats_table(stats))
+            console.print(trends_table)
+            pause()
+
         except Exception as e:
             console.print(f"[red]Ошибка чтения логов: {e}[/red]")
-            input("\nНажмите Enter для возврата в меню...")
+            pause()
     except KeyboardInterrupt:
         console.print("\n[yellow]Возврат в главное меню...[/yellow]")
         return
 
+def parse_time_arg(value):
+    """Время для --since/--until: ISO-дата или смещение назад вида 30m, 2h, 7d."""
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    if value and value[-1] in units:
+        try:
+            return time.time() - float(value[:-1]) * units[value[-1]]
+        except ValueError:
+            pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"неверное время: {value}")
+
+# Замеры производительности сборщиков и отрисовки (--bench)
+BENCH_MIN_TIME = 0.3
+BENCH_HISTORY_SIZES = (60, 720, 10000)
+BENCH_CORE_COUNTS = (4, 64, 256)
+# Размеры терминала, при которых Dashboard выбирает режимы compact, minimal и full
+BENCH_SCREENS = {'compact': (70, 24), 'minimal': (110, 40), 'full': (160, 60)}
+
+FAKE_SENSORS = """#!/bin/sh
+cat <<'OUT'
+coretemp-isa-0000
+Adapter: ISA adapter
+Package id 0:  +52.0°C  (high = +80.0°C, crit = +100.0°C)
+Core 0:        +50.0°C  (high = +80.0°C, crit = +100.0°C)
+Core 1:        +51.0°C  (high = +80.0°C, crit = +100.0°C)
+OUT
+"""
+
+# Отвечает на systemctl show блоками свойств для каждого unit'а после «--»
+FAKE_SYSTEMCTL = """#!/bin/sh
+units=0
+sep=""
+for arg in "$@"; do
+    if [ "$units" = 1 ]; then
+        printf '%sId=%s\\nActiveState=active\\n' "$sep" "$arg"
+        sep="\\n"
+    fi
+    [ "$arg" = "--" ] && units=1
+done
+exit 0
+"""
+
+def _bench_timings(func, min_time=BENCH_MIN_TIME, min_runs=5, max_runs=100000):
+    """Повторяет func не меньше min_time секунд и min_runs раз; времена в миллисекундах."""
+    times = []
+    started = time.perf_counter()
+    while len(times) < max_runs and (len(times) < min_runs or time.perf_counter() - started < min_time):
+        t = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - t) * 1000)
+    times.sort()
+    return {
+        'runs': len(times),
+        'mean_ms': round(sum(times) / len(times), 4),
+        'p50_ms': round(percentile(times, 50), 4),
+        'p95_ms': round(percentile(times, 95), 4),
+        'min_ms': round(times[0], 4),
+        'max_ms': round(times[-1], 4),
+    }
+
+class _BenchHTTPHandler(BaseHTTPRequestHandler):
+    """Локальный адрес для замера http_status: короткий JSON с keep-alive."""
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело уходят отдельными записями — без TCP_NODELAY каждый ответ ждал бы delayed ACK
+    disable_nagle_algorithm = True
+    body = b'{"status": "ok"}'
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+def _bench_fake_hwmon(root, sensors):
+    for i in range(sensors):
+        chip = os.path.join(root, f'hwmon{i // 8}')
+        os.makedirs(chip, exist_ok=True)
+        with open(os.path.join(chip, 'name'), 'w') as f:
+            f.write('coretemp\n')
+        with open(os.path.join(chip, f'temp{i % 8 + 1}_input'), 'w') as f:
+            f.write(f'{40000 + i * 100}\n')
+        with open(os.path.join(chip, f'temp{i % 8 + 1}_label'), 'w') as f:
+            f.write(f'Core {i}\n' if i % 8 else 'Package id 0\n')
+
+def _bench_collectors(config_manager, workdir, results, values):
+    """Сборщики против локальных заменителей: фиктивные sensors/systemctl, hwmon в каталоге и HTTP-сервер."""
+    def add(name, func, **params):
+        value = [None]
+
+        def run():
+            value[0] = func()
+        results.append({'group': 'collector', 'name': name, 'params': params, **_bench_timings(run)})
+        return value[0]
+
+    psutil.cpu_percent(interval=None)
+    add('psutil.cpu_percent', lambda: psutil.cpu_percent(percpu=True), cores=psutil.cpu_count())
+    add('psutil.virtual_memory', psutil.virtual_memory)
+    add('psutil.disk_usage', lambda: psutil.disk_usage('/'))
+    add('psutil.net_io_counters', lambda: psutil.net_io_counters(pernic=True))
+    add('psutil.pids', psutil.pids)
+    values['system'] = add('system_metrics', system_metrics)
+
+    for sensors in (4, 64):
+        hwmon = os.path.join(workdir, f'hwmon-{sensors}')
+        _bench_fake_hwmon(hwmon, sensors)
+        reader = TempSensors(hwmon)
+        values['temp'] = add('cpu_temps (hwmon)', reader.read, sensors=sensors)
+        reader.close()
+    add('cpu_temp (sensors)', _sensors_cpu_temp)
+
+    app_config = config_manager.get_application_config()
+    for count in (1, 20):
+        units = [app_config['service_name']] + [f'bench-{i}.service' for i in range(count - 1)]
+        # Без start() наблюдатель остаётся в режиме systemctl и вызывает фиктивный systemctl
+        watcher = SystemdWatcher(units)
+        states = add('service_status (systemctl)', watcher.states, units=count)
+        if count == 1:
+            values['service'] = states
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _BenchHTTPHandler)
+    thread = threading.Thread(target=server.serve_forever, name='bench-http', daemon=True)
+    thread.start()
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/health"
+        for count in (1, 8):
+            prober = HttpProber([url] + [f"{url}?n={i}" for i in range(count - 1)])
+            try:
+                result = add('http_status', prober.probe, endpoints=count)
+            finally:
+                prober.close()
+            if count == 1:
+                values['http'] = {app_config['url']: result[url]}
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    pg_config = config_manager.get_postgresql_config()
+    collector = PostgresCollector(pg_config)
+    ok, status, *_ = collector.collect()
+    if ok:
+        values['postgresql'] = add('pg_status', collector.collect)
+        collector.workload()
+        values['pg_workload'] = add('pg_workload', collector.workload)
+    else:
+        # Заменить PostgreSQL локально нечем — замеряется только настроенный сервер
+        results.append({'group': 'collector', 'name': 'pg_status', 'params': {}, 'skipped': status})
+        values['postgresql'] = (True, 'OK', 25, 1, '1.2 GB')
+    collector.close()
+
+    monitoring_config = config_manager.get_monitoring_config()
+    table = ProcessTable(app_config['service_name'], monitoring_config['top_processes'])
+    table.sample()
+    values['process'] = add('process_table', table.sample, processes=len(psutil.pids()))
+    disks = DiskMonitor(monitoring_config['mounts'])
+    values['disk'] = add('disk_monitor', disks.sample)
+    net = NetworkMonitor(focus_ports(config_manager))
+    net.sample()
+    values['net'] = add('network_monitor', net.sample)
+    cgroups = CgroupMonitor([app_config['service_name']] + app_config['services'])
+    values['cgroup'] = add('cgroup_monitor', cgroups.sample)
+    cgroups.close()
+
+def _bench_charts(results):
+    """Графики на синтетических историях: без кэша (первый кадр после изменения) и из кэша."""
+    for size in BENCH_HISTORY_SIZES:
+        hist = History(size)
+        for i in range(size):
+            hist.append(50 + 40 * math.sin(i / 7))
+        for name, draw in (('sparkline', lambda: sparkline(hist, width=40)),
+                           ('bar_chart', lambda: bar_chart(hist, width=50)),
+                           ('line_chart', lambda: line_chart(hist, width=50))):
+            def cold():
+                _chart_cache.clear()
+                draw()
+            results.append({'group': 'render', 'name': name, 'params': {'history': size, 'cache': False},
+                            **_bench_timings(cold)})
+            results.append({'group': 'render', 'name': name, 'params': {'history': size, 'cache': True},
+                            **_bench_timings(draw)})
+
+def _bench_dashboard(config_manager, results, values):
+    """Полный кадр Dashboard для каждого режима и числа ядер; данные меняются на каждом кадре."""
+    monitoring_config = config_manager.get_monitoring_config()
+    configure_histories(monitoring_config)
+    for hist in (cpu_hist, mem_hist, disk_hist, temp_hist, pg_conn_hist, pg_long_hist, http_hist,
+                 net_rx_hist, net_tx_hist, app_conn_hist):
+        for i in range(monitoring_config['history_length']):
+            hist.append(50 + 40 * math.sin(i / 7))
+
+    now = time.time()
+    snapshot = {name: ProbeResult(value, None, now, 0.0) for name, value in values.items() if value is not None}
+    system = values['system']
+    try:
+        for cores in BENCH_CORE_COUNTS:
+            # Несколько вариантов снимка, чтобы каждый кадр перестраивал участки с изменившимися данными
+            variants = []
+            for shift in range(8):
+                per_cpu = [float((i * 7 + shift * 13) % 100) for i in range(cores)]
+                value = dict(system, cpu=sum(per_cpu) / cores, per_cpu=per_cpu)
+                variants.append(dict(snapshot, system=ProbeResult(value, None, now, 0.0)))
+            for mode, (width, height) in BENCH_SCREENS.items():
+                console.size = (width, height)
+                screen = Console(width=width, height=height, file=io.StringIO(), force_terminal=True,
+                                 color_system='truecolor')
+                dashboard = Dashboard(config_manager)
+                frame = itertools.count()
+
+                def draw():
+                    n = next(frame)
+                    cpu_hist.append(n % 100)
+                    screen.file.seek(0)
+                    screen.file.truncate()
+                    screen.print(dashboard.render(variants[n % len(variants)]))
+                results.append({'group': 'render', 'name': 'dashboard', 'params': {'mode': mode, 'cores': cores},
+                                **_bench_timings(draw)})
+    finally:
+        console.size = (None, None)
+
+def run_bench(config_manager, output=''):
+    """Замеры сборщиков и отрисовки; результат в JSON (в файл output или на stdout)."""
+    results, values = [], {}
+    path = os.environ.get('PATH', '')
+    with tempfile.TemporaryDirectory(prefix='monitoring-bench-') as workdir:
+        bin_dir = os.path.join(workdir, 'bin')
+        os.makedirs(bin_dir)
+        for name, script in (('sensors', FAKE_SENSORS), ('systemctl', FAKE_SYSTEMCTL)):
+            with open(os.path.join(bin_dir, name), 'w') as f:
+                f.write(script)
+            os.chmod(os.path.join(bin_dir, name), 0o755)
+        os.environ['PATH'] = bin_dir + os.pathsep + path
+        try:
+            _bench_collectors(config_manager, workdir, results, values)
+        finally:
+            os.environ['PATH'] = path
+    _bench_charts(results)
+    _bench_dashboard(config_manager, results, values)
+
+    report = {
+        'host': os.uname().nodename,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'cpu_count': psutil.cpu_count(),
+        'min_time': BENCH_MIN_TIME,
+        'results': results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+    return report
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Мониторинг системы и приложений")
+    parser.add_argument('--daemon', action='store_true',
+                        help="фоновый режим без интерфейса с экспортом метрик на /metrics")
+    parser.add_argument('--listen', metavar='[HOST:]PORT', help="адрес экспорта метрик для --daemon")
+    parser.add_argument('--config', default='monitoring.conf', help="файл конфигурации")
+    parser.add_argument('--fleet', nargs='?', const='', metavar='HOST:PORT,...',
+                        help="экран флота: сводка агентов --daemon (по умолчанию — [fleet] agents)")
+    parser.add_argument('--sort', choices=FLEET_SORT_KEYS, help="сортировка экрана флота")
+    parser.add_argument('--filter', default='', help="показывать только хосты, содержащие подстроку")
+    parser.add_argument('--convert-log', nargs=2, metavar=('CSV', 'BINARY'),
+                        help="перенести CSV-лог в колоночный бинарный формат и выйти")
+    parser.add_argument('--logs', nargs='?', const='', metavar='FILE',
+                        help="показать статистику лога (по умолчанию — log_file из конфигурации) и выйти")
+    parser.add_argument('--bench', nargs='?', const='', metavar='FILE',
+                        help="замерить сборщики и отрисовку, записать JSON в FILE (по умолчанию — на stdout) и выйти")
+    parser.add_argument('--since', type=parse_time_arg, help="начало периода: ISO-дата или 30m/2h/7d назад")
+    parser.add_argument('--until', type=parse_time_arg, help="конец периода: ISO-дата или 30m/2h/7d назад")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    main_menu() 
+    args = parse_args()
+    if args.convert_log:
+        count = convert_csv_log(*args.convert_log)
+        console.print(f"[green]Перенесено строк: {count}[/green]")
+    elif args.logs is not None:
+        log_file = args.logs or ConfigManager(args.config).get_monitoring_config()['log_file']
+        view_logs(log_file, args.since, args.until, wait=False)
+    elif args.bench is not None:
+        run_bench(ConfigManager(args.config), args.bench)
+    elif args.daemon:
+        run_daemon(ConfigManager(args.config), args.listen)
+    elif args.fleet is not None:
+        agents = [a.strip() for a in args.fleet.split(',') if a.strip()]
+        start_fleet(ConfigManager(args.config), agents, args.sort, args.filter)
+    else:
+        main_menu(args.config)
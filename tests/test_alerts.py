@@ -0,0 +1,72 @@
+from monitoring import AlertEngine, AlertRule
+
+
+def states(events):
+    return [event.state for event in events]
+
+
+def test_fires_after_for_seconds_and_resolves():
+    engine = AlertEngine([AlertRule('cpu', 'cpu', 80, "CPU {value:.0f}%", for_seconds=10)], cooldown=0)
+    assert states(engine.evaluate({'cpu': 90}, now=0)) == []
+    assert engine.alerts['cpu'].state == 'pending'
+    assert states(engine.evaluate({'cpu': 95}, now=9)) == []
+    events = engine.evaluate({'cpu': 95}, now=10)
+    assert states(events) == ['firing'] and events[0].text == "CPU 95%"
+    assert engine.firing() == [engine.alerts['cpu']]
+    assert states(engine.evaluate({'cpu': 50}, now=11)) == ['resolved']
+
+
+def test_pending_resets_when_value_recovers():
+    engine = AlertEngine([AlertRule('cpu', 'cpu', 80, "", for_seconds=10)])
+    engine.evaluate({'cpu': 90}, now=0)
+    engine.evaluate({'cpu': 10}, now=5)
+    assert states(engine.evaluate({'cpu': 90}, now=10)) == []
+    assert states(engine.evaluate({'cpu': 90}, now=20)) == ['firing']
+
+
+def test_hysteresis_is_absolute():
+    engine = AlertEngine([AlertRule('mem', 'mem', 80, "", hysteresis=5)], cooldown=0)
+    assert states(engine.evaluate({'mem': 85}, now=0)) == ['firing']
+    assert states(engine.evaluate({'mem': 78}, now=1)) == []
+    assert states(engine.evaluate({'mem': 75}, now=2)) == ['resolved']
+
+
+def test_below_threshold_rule_resolves_at_threshold():
+    # «Доступен < 1» без гистерезиса должно сбрасываться при значении 1
+    engine = AlertEngine([AlertRule('pg', 'pg_up', 1, "", above=False)], cooldown=0)
+    assert states(engine.evaluate({'pg_up': 0}, now=0)) == ['firing']
+    assert states(engine.evaluate({'pg_up': 1}, now=1)) == ['resolved']
+
+
+def test_missing_metric_keeps_state():
+    engine = AlertEngine([AlertRule('cpu', 'cpu', 80, "")])
+    engine.evaluate({'cpu': 90}, now=0)
+    assert states(engine.evaluate({'cpu': None}, now=1)) == []
+    assert engine.alerts['cpu'].state == 'firing'
+
+
+def test_refire_inside_cooldown_is_deferred_not_lost():
+    engine = AlertEngine([AlertRule('x', 'x', 1, "")], cooldown=300)
+    assert states(engine.evaluate({'x': 5}, now=0)) == ['firing']
+    assert states(engine.evaluate({'x': 0}, now=2)) == ['resolved']
+    assert states(engine.evaluate({'x': 5}, now=4)) == []
+    assert states(engine.evaluate({'x': 5}, now=299)) == []
+    assert states(engine.evaluate({'x': 5}, now=1000)) == ['firing']
+    assert states(engine.evaluate({'x': 5}, now=5000)) == []
+    assert states(engine.evaluate({'x': 0}, now=5001)) == ['resolved']
+
+
+def test_unannounced_alert_resolves_silently():
+    engine = AlertEngine([AlertRule('x', 'x', 1, "")], cooldown=300)
+    engine.evaluate({'x': 5}, now=0)
+    engine.evaluate({'x': 0}, now=1)
+    engine.evaluate({'x': 5}, now=2)
+    assert states(engine.evaluate({'x': 0}, now=3)) == []
+
+
+def test_set_rules_keeps_state_of_same_names():
+    engine = AlertEngine([AlertRule('cpu', 'cpu', 80, "")])
+    engine.evaluate({'cpu': 90}, now=0)
+    engine.set_rules([AlertRule('cpu', 'cpu', 70, ""), AlertRule('mem', 'mem', 80, "")], cooldown=60)
+    assert engine.alerts['cpu'].state == 'firing' and engine.alerts['cpu'].rule.threshold == 70
+    assert engine.alerts['mem'].state == 'ok' and engine.cooldown == 60
@@ -0,0 +1,81 @@
+import random
+
+from monitoring import AnomalyDetector
+
+START = 1_700_000_000
+STEP = 5
+
+
+def run(detector, values_at, ticks, start_tick=0):
+    results = []
+    for i in range(start_tick, start_tick + ticks):
+        now = START + i * STEP
+        results.append(detector.update({name: (value, now) for name, value in values_at(i).items()}, now))
+    return results
+
+
+def test_warmup_gives_no_score():
+    detector = AnomalyDetector(threshold=6, warmup=30)
+    results = run(detector, lambda i: {'x': 1000 if i == 20 else 10}, 30)
+    assert all(score == 0.0 and detail is None for score, detail in results)
+
+
+def test_noise_on_many_series_rarely_crosses_threshold():
+    rng = random.Random(1)
+    detector = AnomalyDetector(threshold=6, window=600, warmup=30)
+
+    def values(i):
+        series = {f"gauss{j}": 50 + 10 * rng.gauss(0, 1) for j in range(50)}
+        series.update({f"expo{j}": rng.expovariate(1 / 20) for j in range(50)})
+        return series
+
+    results = run(detector, values, 1000)
+    over = sum(score > 6 for score, _ in results[50:])
+    assert over <= 5
+
+
+def test_step_change_is_detected():
+    rng = random.Random(2)
+    detector = AnomalyDetector(threshold=6, window=600, warmup=30)
+    run(detector, lambda i: {'x': 50 + 2 * rng.gauss(0, 1)}, 200)
+    results = run(detector, lambda i: {'x': 80 + 2 * rng.gauss(0, 1)}, 3, start_tick=200)
+    score, detail = results[-1]
+    assert score > 6 and detail.startswith('x (')
+
+
+def test_slow_shift_is_detected_by_cusum():
+    rng = random.Random(3)
+    detector = AnomalyDetector(threshold=6, window=600, warmup=30)
+    run(detector, lambda i: {'x': 50 + 2 * rng.gauss(0, 1)}, 200)
+    results = run(detector, lambda i: {'x': 53 + 2 * rng.gauss(0, 1)}, 60, start_tick=200)
+    detected = [detail for score, detail in results if score > 6]
+    assert detected and '(сдвиг)' in detected[0]
+
+
+def test_daily_pattern_is_learned():
+    rng = random.Random(4)
+    detector = AnomalyDetector(threshold=6, window=600, warmup=30)
+    step = 300
+    alarms = []
+    for i in range(7 * 288):
+        now = START + i * step
+        hour = (now // 3600) % 24
+        value = (90 if 9 <= hour < 18 else 10) + rng.gauss(0, 1)
+        score, _ = detector.update({'load': (value, now)}, now)
+        if i >= 5 * 288:
+            alarms.append(score > 6)
+    assert sum(alarms) == 0
+
+
+def test_stale_series_are_ignored_then_forgotten():
+    detector = AnomalyDetector(threshold=6, warmup=5)
+    run(detector, lambda i: {'gone': 10, 'kept': 10}, 20)
+    run(detector, lambda i: {'gone': 10, 'kept': 10} if i < 21 else {'kept': 10}, 2, start_tick=20)
+    # «gone» пропал с последним значением-выбросом: пока он устаревший, он не должен определять максимум
+    detector.series['gone'].score, detector.series['gone'].kind = 99.0, 'выброс'
+    now = START + 21 * STEP + AnomalyDetector.STALE_AFTER + 1
+    score, detail = detector.update({'kept': (10, now)}, now)
+    assert score < 6 and (detail is None or detail.startswith('kept'))
+    now += AnomalyDetector.FORGET_AFTER
+    detector.update({'kept': (10, now)}, now)
+    assert 'gone' not in detector.series and set(detector.scores()) <= {'kept'}
@@ -0,0 +1,98 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from monitoring import FleetAggregator, fleet_rows
+
+MONITORING = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'monitoring.py')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+
+@pytest.fixture
+def agents(tmp_path):
+    """Два локальных агента monitoring.py --daemon со своими конфигурациями."""
+    procs, addresses = [], []
+    for i in range(2):
+        workdir = tmp_path / f"agent{i}"
+        workdir.mkdir()
+        config = workdir / 'monitoring.conf'
+        config.write_text("[daemon]\nstream_interval = 0.2\n[monitoring]\nupdate_interval = 0.5\n"
+                          "[postgresql]\nhost = 127.0.0.1\nport = 1\n", encoding='utf-8')
+        address = f"127.0.0.1:{free_port()}"
+        procs.append(subprocess.Popen([sys.executable, MONITORING, '--daemon', '--listen', address,
+                                       '--config', str(config)], cwd=workdir,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        addresses.append(address)
+    yield procs, addresses
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def test_aggregates_local_agents(agents):
+    procs, addresses = agents
+    aggregator = FleetAggregator(addresses, timeout=5, max_backoff=1)
+    aggregator.start()
+    try:
+        assert wait_for(lambda: all(h['online'] and h.get('cpu') is not None for h in aggregator.hosts()))
+        hosts = {h['agent']: h for h in aggregator.hosts()}
+        assert set(hosts) == set(addresses)
+        for h in hosts.values():
+            assert h['host'] == os.uname().nodename
+            assert 0 <= h['mem'] <= 100
+            assert h['error'] is None
+
+        # Остановленный агент помечается как недоступный, остальные продолжают обновляться
+        procs[0].terminate()
+        procs[0].wait(10)
+        assert wait_for(lambda: not {h['agent']: h for h in aggregator.hosts()}[addresses[0]]['online'])
+        down = {h['agent']: h for h in aggregator.hosts()}[addresses[0]]
+        assert down['error']
+        seen = {h['agent']: h for h in aggregator.hosts()}[addresses[1]]['seen']
+        assert wait_for(lambda: {h['agent']: h for h in aggregator.hosts()}[addresses[1]]['seen'] > seen)
+    finally:
+        aggregator.stop()
+
+
+def test_unreachable_agent_reports_error():
+    aggregator = FleetAggregator([f"127.0.0.1:{free_port()}"], timeout=1, max_backoff=1)
+    aggregator.start()
+    try:
+        assert wait_for(lambda: aggregator.hosts()[0]['error'] != 'подключение...', timeout=5)
+        assert not aggregator.hosts()[0]['online']
+    finally:
+        aggregator.stop()
+
+
+def test_fleet_rows_sort_and_filter():
+    hosts = [
+        {'agent': 'a:1', 'host': 'web1', 'online': True, 'cpu': 10, 'alerts': []},
+        {'agent': 'b:1', 'host': 'web2', 'online': True, 'cpu': 90, 'alerts': ['x', 'y']},
+        {'agent': 'c:1', 'host': 'db1', 'online': False},
+    ]
+    assert [h['agent'] for h in fleet_rows(hosts, 'cpu')] == ['c:1', 'b:1', 'a:1']
+    assert [h['agent'] for h in fleet_rows(hosts, 'host')] == ['c:1', 'a:1', 'b:1']
+    assert [h['agent'] for h in fleet_rows(hosts, 'alerts')] == ['c:1', 'b:1', 'a:1']
+    assert [h['agent'] for h in fleet_rows(hosts, 'cpu', 'WEB')] == ['b:1', 'a:1']
@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from monitoring import History
+
+
+def test_default_value_and_empty_history():
+    assert list(History(5).window()) == [0.0]
+    empty = History(5, default_value=None)
+    assert len(empty) == 0
+    assert empty.mean() == 0.0
+    assert empty.last() is None and empty.min() is None and empty.max() is None
+
+
+@pytest.mark.parametrize('maxlen', [1, 2, 5, 17])
+def test_windows_match_reference(maxlen):
+    rng = random.Random(maxlen)
+    history = History(maxlen, default_value=None)
+    reference = []
+    for _ in range(300):
+        value = rng.randint(-50, 50)
+        history.append(value)
+        reference = (reference + [value])[-maxlen:]
+        assert list(history.window()) == reference
+        assert history.min() == min(reference) and history.max() == max(reference)
+        for n in range(maxlen + 2):
+            expected = reference[-n:] if n else []
+            assert history.sum(n) == sum(expected)
+        assert history.mean() == pytest.approx(sum(reference) / len(reference))
+
+
+def test_sum_is_bounded_to_window():
+    # Огромные старые значения не должны съедать точность свежих
+    history = History(60)
+    for _ in range(100000):
+        history.append(1e12)
+    for _ in range(60):
+        history.append(0.1)
+    assert history.mean() == pytest.approx(0.1)
+    assert history.sum(3) == pytest.approx(0.3)
+
+
+def test_resize_keeps_latest_values():
+    history = History(10, default_value=None)
+    for i in range(10):
+        history.append(i)
+    history.resize(4)
+    assert list(history.window()) == [6, 7, 8, 9]
+    assert history.sum() == 30 and history.min() == 6
+    history.resize(8)
+    history.append(10)
+    assert list(history.window()) == [6, 7, 8, 9, 10]
+
+
+def test_version_changes_on_append():
+    history = History(3)
+    version = history.version
+    history.append(1)
+    assert history.version != version
@@ -0,0 +1,140 @@
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import monitoring
+from monitoring import AlertEngine, AlertRule, ExecSink, FileSink, Notifier, WebhookSink
+
+
+class Receiver:
+    """Локальный приёмник webhook: запоминает тела запросов, первые fail_first отвечает 500."""
+    def __init__(self, fail_first=0):
+        self.bodies = []
+        self.fail_first = fail_first
+        self.received = threading.Event()
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if receiver.fail_first > 0:
+                    receiver.fail_first -= 1
+                    self.send_response(500)
+                else:
+                    receiver.bodies.append(body)
+                    receiver.received.set()
+                    self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def receiver():
+    r = Receiver()
+    yield r
+    r.close()
+
+
+def firing_events(*names):
+    engine = AlertEngine([AlertRule(name, name, 1, name + " {value:.0f}") for name in names], cooldown=0)
+    return engine.evaluate({name: 5 for name in names}, now=1_700_000_000)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_webhook_receives_batch(receiver):
+    notifier = Notifier([WebhookSink(receiver.url)], batch_wait=0.2)
+    notifier.start()
+    try:
+        notifier.publish(firing_events('cpu', 'mem'))
+        assert receiver.received.wait(5)
+    finally:
+        notifier.stop()
+    records = receiver.bodies[0]['alerts']
+    assert [(r['alert'], r['state'], r['text']) for r in records] == [('cpu', 'firing', 'cpu 5'),
+                                                                      ('mem', 'firing', 'mem 5')]
+    assert records[0]['value'] == 5 and records[0]['host']
+    assert notifier.delivered == 2 and notifier.failed == 0
+
+
+def test_webhook_retries_with_backoff():
+    receiver = Receiver(fail_first=2)
+    notifier = Notifier([WebhookSink(receiver.url)], retries=3, backoff=0.01, batch_wait=0)
+    notifier.start()
+    try:
+        notifier.publish(firing_events('cpu'))
+        assert receiver.received.wait(5)
+    finally:
+        notifier.stop()
+        receiver.close()
+    assert len(receiver.bodies) == 1 and notifier.delivered == 1
+
+
+def test_failed_delivery_is_counted():
+    receiver = Receiver(fail_first=100)
+    notifier = Notifier([WebhookSink(receiver.url)], retries=1, backoff=0.01, batch_wait=0)
+    before = monitoring.monitor_health.errors.get('notify', [0])[0]
+    notifier.start()
+    try:
+        notifier.publish(firing_events('cpu'))
+        assert wait_for(lambda: notifier.failed == 1)
+    finally:
+        notifier.stop()
+        receiver.close()
+    assert monitoring.monitor_health.errors['notify'][0] == before + 1
+    assert 'webhook' in monitoring.monitor_health.errors['notify'][1]
+
+
+def test_slow_sink_does_not_block_publish(receiver, tmp_path):
+    class SlowSink:
+        name = 'slow'
+
+        def send(self, records):
+            time.sleep(0.5)
+
+    path = tmp_path / 'events.jsonl'
+    notifier = Notifier([SlowSink(), FileSink(str(path))], batch_wait=0)
+    notifier.start()
+    try:
+        started = time.perf_counter()
+        notifier.publish(firing_events('cpu'))
+        assert time.perf_counter() - started < 0.1
+        assert wait_for(lambda: path.exists() and path.read_text())
+    finally:
+        notifier.stop()
+    assert json.loads(path.read_text().splitlines()[0])['alert'] == 'cpu'
+
+
+def test_full_queue_drops_events():
+    notifier = Notifier([FileSink('/dev/null')], queue_size=2)
+    notifier.publish(firing_events('a', 'b', 'c'))
+    assert notifier.dropped == 1
+
+
+def test_exec_sink_passes_batch_on_stdin(tmp_path):
+    path = tmp_path / 'stdin.json'
+    sink = ExecSink(f"{sys.executable} -c \"import sys; open({str(path)!r}, 'w').write(sys.stdin.read())\"")
+    sink.send([monitoring._event_record(event) for event in firing_events('disk')])
+    assert json.loads(path.read_text())['alerts'][0]['alert'] == 'disk'
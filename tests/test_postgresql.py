@@ -0,0 +1,153 @@
+import glob
+import os
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+import pytest
+
+import monitoring
+from monitoring import PostgresCollector, ProbeResult
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def pg_bin(name):
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(glob.glob(f"/usr/lib/postgresql/*/bin/{name}") + glob.glob(f"/usr/pgsql-*/bin/{name}"))
+    return candidates[-1] if candidates else None
+
+
+def conf(port, database='postgres'):
+    return {'host': '127.0.0.1', 'port': str(port), 'database': database, 'user': 'monitoring', 'password': ''}
+
+
+@pytest.fixture(scope='module')
+def postgres(tmp_path_factory):
+    """Временный локальный кластер PostgreSQL на свободном порту."""
+    initdb, pg_ctl = pg_bin('initdb'), pg_bin('pg_ctl')
+    if not initdb or not pg_ctl:
+        pytest.skip("initdb/pg_ctl не найдены")
+    if os.geteuid() == 0:
+        pytest.skip("PostgreSQL не запускается от root")
+    data = tmp_path_factory.mktemp('pgdata')
+    port = free_port()
+    subprocess.run([initdb, '-D', str(data), '-U', 'monitoring', '--auth=trust'], check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    subprocess.run([pg_ctl, '-D', str(data), '-w', '-l', str(data / 'server.log'),
+                    '-o', f"-p {port} -k {data} -c listen_addresses=127.0.0.1", 'start'], check=True,
+                   stdout=subprocess.DEVNULL)
+    yield conf(port)
+    subprocess.run([pg_ctl, '-D', str(data), '-w', '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+
+
+def test_unreachable_server_reports_error_and_backs_off():
+    collector = PostgresCollector(conf(free_port()), timeout=1)
+    ok, error, connections, long_queries, size = collector.collect()
+    assert not ok and error and (connections, long_queries, size) == (0, 0, 'N/A')
+    # Повторная попытка до истечения отсрочки не подключается заново
+    ok, error, *_ = collector.collect()
+    assert not ok and 'повтор через' in error
+    assert 'error' in collector.workload()
+
+
+def test_probe_up_reflects_collector_error():
+    collector = PostgresCollector(conf(free_port()), timeout=1)
+    assert not monitoring._probe_up('postgresql', ProbeResult(collector.collect(), None, 0, 0.1))
+    assert not monitoring._probe_up('pg_workload', ProbeResult(collector.workload(), None, 0, 0.1))
+
+
+def test_probes_share_one_collector_per_connection():
+    settings = conf(free_port())
+    collector = monitoring.pg_collector(settings)
+    try:
+        assert monitoring.pg_collector(dict(settings)) is collector
+    finally:
+        monitoring._pg_collectors.pop(monitoring._pg_collector_key(settings)).close()
+
+
+def test_timeout_is_applied_per_call(postgres):
+    collector = PostgresCollector(postgres)
+
+    def current(cur, now):
+        cur.execute("SHOW statement_timeout")
+        return cur.fetchone()[0]
+
+    try:
+        assert collector._with_connection(current, 5) == ('5s', None)
+        assert collector._with_connection(current, 2) == ('2s', None)
+        assert collector.collect(2)[0] and 'error' not in collector.workload(5)
+    finally:
+        collector.close()
+
+
+def test_collect_counts_connections(postgres):
+    collector = PostgresCollector(postgres, timeout=2)
+    other = psycopg2.connect(**{k: v for k, v in postgres.items() if k != 'database'}, dbname='postgres')
+    try:
+        ok, status, connections, long_queries, size = collector.collect()
+        assert ok and status == 'OK'
+        assert connections >= 1 and long_queries == 0
+        assert size != 'N/A'
+        assert monitoring._probe_up('postgresql', ProbeResult((ok, status, connections, long_queries, size),
+                                                              None, 0, 0.1))
+    finally:
+        other.close()
+        collector.close()
+
+
+def test_workload_rates_and_lock_waits(postgres):
+    collector = PostgresCollector(postgres, timeout=2)
+    holder = psycopg2.connect(host=postgres['host'], port=postgres['port'], user='monitoring', dbname='postgres')
+    waiter = psycopg2.connect(host=postgres['host'], port=postgres['port'], user='monitoring', dbname='postgres')
+    try:
+        holder.autocommit = True
+        holder.cursor().execute("CREATE TABLE IF NOT EXISTS lock_target (id int)")
+        first = collector.workload()
+        assert 'error' not in first and 'tps' not in first  # скорости — со второго вызова
+        time.sleep(0.2)
+        second = collector.workload()
+        assert second['tps'] >= 0 and second['lock_waits'] == 0
+
+        holder.autocommit = False
+        holder.cursor().execute("LOCK TABLE lock_target IN ACCESS EXCLUSIVE MODE")
+        blocked = threading.Thread(target=lambda: waiter.cursor().execute("SELECT * FROM lock_target"))
+        blocked.start()
+        deadline = time.monotonic() + 5
+        result = collector.workload()
+        while result['lock_waits'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.1)
+            result = collector.workload()
+        assert result['lock_waits'] == 1
+        holder.rollback()
+        blocked.join(5)
+    finally:
+        holder.close()
+        waiter.close()
+        collector.close()
+
+
+def test_reconnects_after_backend_terminated(postgres):
+    collector = PostgresCollector(postgres, timeout=2)
+    admin = psycopg2.connect(host=postgres['host'], port=postgres['port'], user='monitoring', dbname='postgres')
+    admin.autocommit = True
+    try:
+        assert collector.collect()[0]
+        admin.cursor().execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity "
+                               "WHERE application_name = 'monitoring'")
+        assert not collector.collect()[0]
+        time.sleep(1.1)  # первая отсрочка — 1 секунда
+        assert collector.collect()[0]
+    finally:
+        admin.close()
+        collector.close()
@@ -0,0 +1,48 @@
+from monitoring import TempSensors
+
+
+def hwmon(tmp_path, chip='coretemp', sensors=(('temp1', 'Package id 0', '45000'),)):
+    directory = tmp_path / 'hwmon0'
+    directory.mkdir()
+    (directory / 'name').write_text(chip + '\n')
+    for prefix, label, value in sensors:
+        (directory / f'{prefix}_label').write_text(label + '\n')
+        (directory / f'{prefix}_input').write_text(value + '\n')
+    return directory
+
+
+def test_reads_package_temperature(tmp_path):
+    hwmon(tmp_path, sensors=(('temp1', 'Package id 0', '45000'), ('temp2', 'Core 0', '43000')))
+    sensors = TempSensors(str(tmp_path))
+    try:
+        temps = sensors.read()
+        assert temps['main'] == 45.0
+        assert temps['cores'] == {'Core 0': 43.0}
+    finally:
+        sensors.close()
+
+
+def test_transient_read_error_skips_one_value(tmp_path):
+    value = hwmon(tmp_path) / 'temp1_input'
+    sensors = TempSensors(str(tmp_path))
+    try:
+        value.write_text('garbage\n')
+        assert sensors.read()['main'] is None
+        value.write_text('47000\n')
+        assert sensors.read()['main'] == 47.0
+    finally:
+        sensors.close()
+
+
+def test_sensor_dropped_after_repeated_failures(tmp_path):
+    value = hwmon(tmp_path) / 'temp1_input'
+    sensors = TempSensors(str(tmp_path))
+    try:
+        value.write_text('garbage\n')
+        for _ in range(TempSensors.MAX_FAILURES):
+            sensors.read()
+        assert sensors.sensors == []
+        value.write_text('47000\n')
+        assert sensors.read()['main'] is None
+    finally:
+        sensors.close()
@@ -0,0 +1,61 @@
+import pytest
+
+from monitoring import TieredHistory
+
+HOUR = 1_699_999_200  # начало часа
+
+
+def fill(history, count, step=5, start=HOUR + 1, value=lambda i: i % 7):
+    for i in range(count):
+        history.append(value(i), start + i * step)
+
+
+def test_rollups_aggregate_each_period():
+    history = TieredHistory(60, default_value=None)
+    fill(history, 36, step=5, value=lambda i: i)  # три полные минуты
+    history.append(0, HOUR + 1 + 36 * 5)  # закрывает третью минуту
+    minutes = history.tiers[0]
+    assert list(minutes.min.window()) == [0, 12, 24]
+    assert list(minutes.max.window()) == [11, 23, 35]
+    assert list(minutes.avg.window()) == [5.5, 17.5, 29.5]
+
+
+def test_default_value_stays_out_of_rollups():
+    history = TieredHistory(60)
+    assert list(history.window()) == [0.0]
+    assert len(history.tiers[0].avg) == 0
+
+
+def test_short_span_uses_raw_values():
+    history = TieredHistory(60, default_value=None)
+    fill(history, 120)
+    assert len(history.span(200, 5)) == 40
+    assert len(history.span(300, 5)) == 60
+
+
+def test_span_falls_back_to_finest_covering_tier():
+    # Часовых агрегатов ещё нет, но минутные покрывают больше, чем сырые значения
+    history = TieredHistory(60, default_value=None)
+    fill(history, 59 * 12)
+    assert len(history.tiers[1].avg) == 0
+    span = history.span(30 * 86400, 5)
+    assert len(span) == len(history.tiers[0].avg) == 58
+
+
+def test_span_uses_hour_tier_once_filled():
+    history = TieredHistory(60, default_value=None, minutes=60)
+    fill(history, 3 * 720 + 1)
+    assert len(history.tiers[1].avg) == 3
+    assert list(history.span(3 * 86400, 5)) == list(history.tiers[1].avg.window())
+
+
+def test_span_with_only_raw_values():
+    history = TieredHistory(60)
+    assert len(history.span(86400, 5)) == 1
+
+
+@pytest.mark.parametrize('agg', ['min', 'avg', 'max'])
+def test_span_aggregate_selection(agg):
+    history = TieredHistory(12, default_value=None)
+    fill(history, 12 * 10)
+    assert list(history.span(600, 5, agg)) == list(getattr(history.tiers[0], agg).window(10))